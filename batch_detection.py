@@ -0,0 +1,296 @@
+"""Offline marble detection over recorded frames: directories of images or video files, spread over every core"""
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+import cv2
+import numpy as np
+
+from constants import AI, IMAGE_PROCESSING
+from image_processing import MarbleDetector
+
+IMAGE_EXTENSIONS = (".bmp", ".jpeg", ".jpg", ".png")
+# frames processed by a worker process per task
+CHUNK_SIZE = 64
+
+
+class FrameResult:
+
+    def __init__(self, frame, name, shape, read_time, detect_time, marbles):
+        """
+        :param frame: index of the frame within the directory or video
+        :param name: file name of the image, empty for frames of a video
+        :param shape: (height, width) of the frame
+        :param read_time: seconds spent reading and decoding the frame
+        :param detect_time: seconds spent detecting the marbles
+        :param marbles: list of (x, y, radius) like image_processing.detect()
+        """
+        self.frame = frame
+        self.name = name
+        self.shape = shape
+        self.read_time = read_time
+        self.detect_time = detect_time
+        self.marbles = marbles
+
+
+def _is_video(path):
+    return not os.path.isdir(path)
+
+
+def _tasks(path, chunk_size):
+    """
+    :return: list of (path, first frame, images or frame count), one for each chunk of frames
+    """
+    if not _is_video(path):
+        images = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        return [(path, first, images[first:first + chunk_size]) for first in range(0, len(images), chunk_size)]
+
+    video = cv2.VideoCapture(path)
+    if not video.isOpened():
+        raise IOError("can not read frames from {}".format(path))
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    if frame_count <= 0:
+        # unknown length, read by a single task up to the end
+        return [(path, 0, None)]
+    return [(path, first, min(chunk_size, frame_count - first)) for first in range(0, frame_count, chunk_size)]
+
+
+# MarbleDetector of the worker process, created by _init_worker
+_detector = None
+
+
+def _init_worker(color_lower, color_upper):
+    global _detector
+    # one process per core, OpenCV must not start threads of its own
+    cv2.setNumThreads(1)
+    _detector = MarbleDetector(color_lower, color_upper)
+
+
+def _detect_chunk(task):
+    """
+        runs in a worker process, every frame is read by the worker itself instead of being sent to it
+    """
+    path, first, frames = task
+    results = []
+
+    def detect(frame, name, image, read_time):
+        start = time.perf_counter()
+        marbles = _detector.detect(image)
+        results.append(FrameResult(frame, name, image.shape[:2], read_time, time.perf_counter() - start, marbles))
+
+    if isinstance(frames, list):
+        for frame, name in enumerate(frames, first):
+            start = time.perf_counter()
+            image = cv2.imread(os.path.join(path, name))
+            if image is not None:
+                detect(frame, name, image, time.perf_counter() - start)
+        return results
+
+    video = cv2.VideoCapture(path)
+    video.set(cv2.CAP_PROP_POS_FRAMES, first)
+    image = None
+    frame = first
+    while frames is None or frame < first + frames:
+        start = time.perf_counter()
+        ok, image = video.read(image)
+        if not ok:
+            break
+        detect(frame, "", image, time.perf_counter() - start)
+        frame += 1
+    video.release()
+    return results
+
+
+def detect_batch(path, color_lower, color_upper, processes=None, chunk_size=CHUNK_SIZE):
+    """
+        detects the marbles of every frame of a directory of images or a video file in a pool of processes.
+        Frames are detected independently of each other, without tracking
+
+    :param path: directory of images or video file
+    :param color_lower: lower HSV bound, e.g. Light.get_color_space()[0]
+    :param color_upper: upper HSV bound
+    :param processes: number of worker processes, every core if None
+    :param chunk_size: frames processed by a worker process per task
+    :return: generator of FrameResults in the order of the frames, unreadable images are skipped
+    """
+    tasks = _tasks(path, chunk_size)
+    with multiprocessing.Pool(processes, _init_worker, (np.array(color_lower), np.array(color_upper))) as pool:
+        for results in pool.imap(_detect_chunk, tasks):
+            for result in results:
+                yield result
+
+
+class _Column:
+
+    def __init__(self, directory, name, dtype):
+        """
+        Column of save_results() growing in a temporary file, copied into the .npz archive once complete
+
+        :param directory: directory of the temporary file
+        :param name: name of the column
+        :param dtype: numpy dtype of the values
+        """
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self.file = open(os.path.join(directory, name), "w+b")
+
+    def append(self, values):
+        array = np.asarray(values, dtype=self.dtype)
+        self.file.write(array.tobytes())
+        self.length += len(array)
+
+    def _write_header(self, f, dtype):
+        np.lib.format.write_array_header_1_0(f, {"descr": np.lib.format.dtype_to_descr(dtype),
+                                                 "fortran_order": False, "shape": (self.length,)})
+
+    def copy_to(self, archive):
+        """
+            writes the column as .npy file into the given ZipFile
+        """
+        self.file.seek(0)
+        with archive.open(self.name + ".npy", "w", force_zip64=True) as f:
+            self._write_header(f, self.dtype)
+            shutil.copyfileobj(self.file, f)
+
+
+class _StringColumn(_Column):
+
+    def __init__(self, directory, name):
+        """
+        Column of strings, stored null-terminated as their width is only known once complete
+        """
+        super().__init__(directory, name, np.uint8)
+        self.width = 1
+
+    def append(self, values):
+        for value in values:
+            self.file.write(value.encode() + b"\0")
+            self.width = max(self.width, len(value))
+        self.length += len(values)
+
+    def copy_to(self, archive):
+        self.file.seek(0)
+        dtype = np.dtype("<U{}".format(self.width))
+        with archive.open(self.name + ".npy", "w", force_zip64=True) as f:
+            self._write_header(f, dtype)
+            rest = b""
+            for block in iter(lambda: self.file.read(1 << 16), b""):
+                values = (rest + block).split(b"\0")
+                rest = values.pop()
+                f.write(np.array([value.decode() for value in values], dtype=dtype).tobytes())
+
+
+def save_results(path, results, chunk_size=CHUNK_SIZE, **metadata):
+    """
+        writes the results column by column into a numpy .npz file, read by load_results().
+        Per frame: frame, name, height, width, read_time, detect_time, marble_count and marble_start,
+        the index of its first marble. Per marble: marble_frame, marble_x, marble_y and marble_radius.
+        Every chunk_size results the columns are appended to temporary files, copied into the file at the end,
+        so the results of a long video never have to fit into memory
+
+    :param path: file to write, .npz is appended like by numpy.savez() if missing
+    :param results: iterable of FrameResults
+    :param chunk_size: results kept in memory before they are appended to the columns
+    :param metadata: further arrays stored along, e.g. the color bounds
+    :return: number of frames written
+    """
+    path = os.fspath(path)
+    if not path.endswith(".npz"):
+        path += ".npz"
+    with tempfile.TemporaryDirectory() as directory:
+        columns = {name: _Column(directory, name, dtype) for name, dtype in (
+            ("frame", np.int64), ("height", np.int64), ("width", np.int64), ("read_time", np.float64),
+            ("detect_time", np.float64), ("marble_count", np.int64), ("marble_start", np.int64),
+            ("marble_frame", np.int64), ("marble_x", np.int64), ("marble_y", np.int64),
+            ("marble_radius", np.int64))}
+        columns["name"] = _StringColumn(directory, "name")
+        marble_count = 0
+        chunk = []
+
+        def append_chunk():
+            nonlocal marble_count
+            counts = np.array([len(result.marbles) for result in chunk], dtype=np.int64)
+            marbles = np.array([(result.frame,) + tuple(marble) for result in chunk for marble in result.marbles],
+                               dtype=np.int64).reshape(-1, 4)
+            columns["frame"].append([result.frame for result in chunk])
+            columns["name"].append([result.name for result in chunk])
+            columns["height"].append([result.shape[0] for result in chunk])
+            columns["width"].append([result.shape[1] for result in chunk])
+            columns["read_time"].append([result.read_time for result in chunk])
+            columns["detect_time"].append([result.detect_time for result in chunk])
+            columns["marble_count"].append(counts)
+            columns["marble_start"].append(marble_count + np.cumsum(counts) - counts)
+            for i, name in enumerate(("marble_frame", "marble_x", "marble_y", "marble_radius")):
+                columns[name].append(marbles[:, i])
+            marble_count += int(counts.sum())
+            chunk.clear()
+
+        try:
+            for result in results:
+                chunk.append(result)
+                if len(chunk) >= chunk_size:
+                    append_chunk()
+            append_chunk()
+
+            # uncompressed like numpy.savez()
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+                for column in columns.values():
+                    column.copy_to(archive)
+                for key, value in metadata.items():
+                    with archive.open(key + ".npy", "w", force_zip64=True) as f:
+                        np.lib.format.write_array(f, np.asanyarray(value))
+        finally:
+            for column in columns.values():
+                column.file.close()
+    return columns["frame"].length
+
+
+def load_results(path):
+    """
+    :return: dictionary of every column written by save_results()
+    """
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def _main(args):
+    processes = None
+    paths = []
+    color_lower, color_upper = AI.properties.light.get_color_space()
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '-processes' or arg == '-p':
+            i += 1
+            processes = int(args[i])
+        elif arg == '-lower' or arg == '-l':
+            i += 1
+            color_lower = tuple(int(value) for value in args[i].split(","))
+        elif arg == '-upper' or arg == '-u':
+            i += 1
+            color_upper = tuple(int(value) for value in args[i].split(","))
+        else:
+            paths.append(arg)
+        i += 1
+    if len(paths) != 2:
+        raise ValueError("usage: batch_detection.py <image directory or video> <output .npz> "
+                         "[-processes n] [-lower h,s,v] [-upper h,s,v]")
+
+    start = time.perf_counter()
+    count = save_results(paths[1], detect_batch(paths[0], color_lower, color_upper, processes),
+                         color_lower=color_lower, color_upper=color_upper,
+                         min_radius=IMAGE_PROCESSING.MIN_RADIUS, x_offset=IMAGE_PROCESSING.X_OFFSET)
+    duration = time.perf_counter() - start
+    print("{} frames in {:.1f} s, {:.1f} frames/s".format(count, duration, count / max(duration, 1e-9)))
+
+
+# called when executed directly
+if __name__ == '__main__':
+    _main(sys.argv[1:])
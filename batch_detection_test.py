@@ -0,0 +1,121 @@
+"""Runs on the images/ fixtures: python batch_detection_test.py (or pytest)"""
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+from batch_detection import FrameResult, detect_batch, load_results, save_results
+from constants import Light
+from image_processing import MarbleDetector
+
+COLOR_LOWER, COLOR_UPPER = Light(Light.Intensity.LOW).get_color_space()
+
+
+def test_detect_batch_of_directory():
+    names = sorted(name for name in os.listdir("images") if name.lower().endswith((".jpg", ".png")))
+    # chunks smaller than the directory, every frame is detected by a fresh detector
+    results = list(detect_batch("images", COLOR_LOWER, COLOR_UPPER, processes=1, chunk_size=3))
+    assert [result.frame for result in results] == list(range(len(names)))
+    assert [result.name for result in results] == names
+    for result in results:
+        image = cv2.imread(os.path.join("images", result.name))
+        assert result.shape == image.shape[:2]
+        assert result.marbles == MarbleDetector(np.array(COLOR_LOWER), np.array(COLOR_UPPER)).detect(image)
+        assert result.read_time > 0 and result.detect_time > 0
+
+
+def test_save_and_load_results():
+    results = list(detect_batch("images", COLOR_LOWER, COLOR_UPPER, processes=1))
+    # a frame without marbles between the others
+    results.insert(1, FrameResult(len(results), "empty.png", (10, 20), 0.1, 0.2, []))
+    assert any(result.marbles for result in results)
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "results.npz")
+        assert save_results(path, results, color_lower=COLOR_LOWER, color_upper=COLOR_UPPER) == len(results)
+        data = load_results(path)
+        # written in chunks, the file holds the same columns
+        for chunk_size in (1, 2, len(results) - 1):
+            assert save_results(path, results, chunk_size=chunk_size,
+                                color_lower=COLOR_LOWER, color_upper=COLOR_UPPER) == len(results)
+            chunked = load_results(path)
+            assert chunked.keys() == data.keys()
+            for key in data:
+                assert chunked[key].dtype == data[key].dtype and np.array_equal(chunked[key], data[key]), key
+    finally:
+        shutil.rmtree(directory)
+
+    assert data["frame"].tolist() == [result.frame for result in results]
+    assert data["name"].tolist() == [result.name for result in results]
+    assert [(height, width) for height, width in zip(data["height"], data["width"])] == \
+        [tuple(result.shape) for result in results]
+    assert data["read_time"].tolist() == [result.read_time for result in results]
+    assert data["detect_time"].tolist() == [result.detect_time for result in results]
+    assert data["color_lower"].tolist() == list(COLOR_LOWER) and data["color_upper"].tolist() == list(COLOR_UPPER)
+    for i, result in enumerate(results):
+        start, count = data["marble_start"][i], data["marble_count"][i]
+        assert (data["marble_frame"][start:start + count] == result.frame).all()
+        marbles = zip(data["marble_x"][start:start + count], data["marble_y"][start:start + count],
+                      data["marble_radius"][start:start + count])
+        assert [tuple(int(value) for value in marble) for marble in marbles] == \
+            [tuple(marble) for marble in result.marbles]
+    assert len(data["marble_x"]) == sum(len(result.marbles) for result in results)
+
+
+def test_save_results_without_marbles():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "results.npz")
+        assert save_results(path, [FrameResult(0, "", (10, 20), 0.1, 0.2, [])]) == 1
+        data = load_results(path)
+    finally:
+        shutil.rmtree(directory)
+    assert data["marble_count"].tolist() == [0] and data["marble_start"].tolist() == [0]
+    assert data["marble_x"].shape == (0,)
+
+
+def test_detect_batch_of_video():
+    # frames of the same size, repeated to span several chunks
+    images = [cv2.imread(os.path.join("images", name)) for name in ("pitest.jpg", "pitest2.jpg", "handytest_small.jpg")]
+    images = images * 3
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "frames.avi")
+        height, width = images[0].shape[:2]
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (width, height))
+        assert writer.isOpened()
+        for image in images:
+            writer.write(image)
+        writer.release()
+
+        # the frames as decoded from the video, compressed unlike the images
+        video = cv2.VideoCapture(path)
+        frames = []
+        while True:
+            ok, frame = video.read()
+            if not ok:
+                break
+            frames.append(frame)
+        video.release()
+        assert len(frames) == len(images)
+
+        # every chunk but the first one starts by seeking into the video
+        results = list(detect_batch(path, COLOR_LOWER, COLOR_UPPER, processes=2, chunk_size=4))
+    finally:
+        shutil.rmtree(directory)
+    assert [result.frame for result in results] == list(range(len(images)))
+    assert any(result.marbles for result in results)
+    detector = MarbleDetector(np.array(COLOR_LOWER), np.array(COLOR_UPPER))
+    for result, frame in zip(results, frames):
+        assert result.name == "" and result.shape == (height, width)
+        assert result.marbles == detector.detect(frame), result.frame
+        assert result.read_time > 0 and result.detect_time > 0
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
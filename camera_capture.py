@@ -0,0 +1,291 @@
+"""Background capture of camera frames into a preallocated ring buffer"""
+
+import threading
+import time
+
+import numpy
+
+
+class Frame:
+
+    def __init__(self, image, timestamp, index):
+        """
+        :param image: BGR image as numpy array
+        :param timestamp: time.monotonic() the exposure of the frame started at (approximately for the camera)
+        :param index: number of the frame since the capture started
+        """
+        self.image = image
+        self.timestamp = timestamp
+        self.index = index
+
+
+class FrameRing:
+
+    def __init__(self, count, shape):
+        """
+        Preallocated buffers of the latest frames. The writer fills the slot after the latest one,
+        so readers copying one of the count - 1 latest frames are never overwritten
+
+        :param count: number of buffers, at least 2
+        :param shape: shape of every frame, e.g. (1024, 1024, 3)
+        """
+        if count < 2:
+            raise ValueError("a FrameRing needs at least 2 buffers")
+        self.buffers = numpy.empty((count,) + tuple(shape), dtype=numpy.uint8)
+        self.timestamps = numpy.full(count, -numpy.inf)
+        # index of the latest frame, -1 before the first one
+        self.latest_index = -1
+        self.condition = threading.Condition()
+
+    def next_buffer(self):
+        """
+        :return: the buffer the writer fills next
+        """
+        return self.buffers[(self.latest_index + 1) % len(self.buffers)]
+
+    def publish(self, timestamp):
+        """
+            makes the buffer returned by next_buffer() the latest frame
+        """
+        with self.condition:
+            index = self.latest_index + 1
+            self.timestamps[index % len(self.buffers)] = timestamp
+            self.latest_index = index
+            self.condition.notify_all()
+
+    def _copy(self, index, out):
+        """
+            copies the frame with the given index. Caller holds the condition
+        """
+        slot = index % len(self.buffers)
+        if out is None:
+            out = self.buffers[slot].copy()
+        else:
+            numpy.copyto(out, self.buffers[slot])
+        return Frame(out, float(self.timestamps[slot]), index)
+
+    def latest(self, out=None, timeout=None):
+        """
+            copy of the newest frame, waits for the first frame if there is none yet
+
+        :param out: array the image is copied into, newly allocated if None
+        :return: Frame, None on timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.latest_index >= 0, timeout):
+                return None
+            return self._copy(self.latest_index, out)
+
+    def frame_after(self, timestamp, out=None, timeout=None):
+        """
+            copy of the first frame whose exposure started at or after the given time, waits until one is captured
+
+        :param timestamp: time.monotonic() timestamp
+        :param out: array the image is copied into, newly allocated if None
+        :return: Frame, None on timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                    lambda: self.latest_index >= 0 and
+                    self.timestamps[self.latest_index % len(self.buffers)] >= timestamp, timeout):
+                return None
+            # oldest frame not being overwritten by the writer
+            index = self.latest_index
+            while index > max(self.latest_index - len(self.buffers) + 2, 0) and \
+                    self.timestamps[(index - 1) % len(self.buffers)] >= timestamp:
+                index -= 1
+            return self._copy(index, out)
+
+
+class CaptureService:
+
+    def __init__(self, source, frame_count=4):
+        """
+        Streams frames of the given source in a background Thread into a FrameRing,
+        so callers get the newest frame without waiting for a capture
+
+        :param source: PiCameraSource, FileSource or any object providing shape, read_into(buffer) and close()
+        :param frame_count: number of preallocated frame buffers
+        """
+        self.source = source
+        self.ring = FrameRing(frame_count, source.shape)
+        self.__stop = False
+        self.__error = None
+        self.__thread = None
+
+    def start(self):
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__stop = False
+            self.__thread = threading.Thread(target=self.__capture, daemon=True)
+            self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__stop = True
+        return self
+
+    def join(self, timeout=None):
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+        return self
+
+    def is_running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def __capture(self):
+        """
+            runs in the capture Thread until stop() is called or the source has no frames left
+        """
+        try:
+            while not self.__stop:
+                timestamp = self.source.read_into(self.ring.next_buffer())
+                if timestamp is None:
+                    break
+                self.ring.publish(timestamp)
+        except Exception as e:
+            # raised again by the next caller
+            self.__error = e
+        finally:
+            self.source.close()
+            with self.ring.condition:
+                self.ring.condition.notify_all()
+
+    def __check(self):
+        if self.__error is not None:
+            raise self.__error
+
+    def latest(self, out=None, timeout=None):
+        """
+            see FrameRing.latest()
+        """
+        self.__check()
+        return self.ring.latest(out, timeout)
+
+    def frame_after(self, timestamp, out=None, timeout=None):
+        """
+            see FrameRing.frame_after()
+        """
+        self.__check()
+        return self.ring.frame_after(timestamp, out, timeout)
+
+
+def _exposure_start(camera, received, max_latency):
+    """
+    :param camera: PiCamera that delivered a frame of capture_continuous()
+    :param received: time.monotonic() the frame was received at
+    :param max_latency: seconds assumed between the first line of the frame and its reception
+                        if the camera has no timestamp of the frame
+    :return: time.monotonic() the exposure of the frame started at
+    """
+    frame = camera.frame
+    if frame is not None and frame.timestamp is not None:
+        # the timestamp of the frame is the time the first line was received, on the clock of the camera
+        latency = (camera.timestamp - frame.timestamp) / 1000000
+    else:
+        latency = max_latency
+    return received - latency - camera.exposure_speed / 1000000
+
+
+class PiCameraSource:
+
+    def __init__(self, resolution=(1024, 1024), framerate=30, max_latency=None):
+        """
+        Continuous capture from the video port of the Pi camera, much faster than still captures
+
+        :param max_latency: seconds assumed for capturing, encoding and transferring a frame
+                            if the camera has no timestamp of it, two frame intervals if None
+        """
+        from picamera import PiCamera
+
+        self.camera = PiCamera(resolution=resolution, framerate=framerate)
+        self.max_latency = 2 / framerate if max_latency is None else max_latency
+        # bgr frames are padded to a multiple of 32 x 16 pixels
+        width, height = resolution
+        self.shape = ((height + 15) // 16 * 16, (width + 31) // 32 * 32, 3)
+        # allow the camera to warmup
+        time.sleep(1)
+        self.__buffer = None
+        self.__offset = 0
+        self.__frames = self.camera.capture_continuous(self, format="bgr", use_video_port=True)
+
+    def write(self, data):
+        """
+            called by picamera with the bytes of the frame, possibly in several chunks
+        """
+        end = min(self.__offset + len(data), self.__buffer.size)
+        numpy.copyto(self.__buffer.reshape(-1)[self.__offset:end],
+                     numpy.frombuffer(data, dtype=numpy.uint8, count=end - self.__offset))
+        self.__offset = end
+
+    def flush(self):
+        pass
+
+    def read_into(self, buffer):
+        """
+        :return: time.monotonic() the exposure started at
+        """
+        self.__buffer = buffer
+        self.__offset = 0
+        next(self.__frames)
+        return _exposure_start(self.camera, time.monotonic(), self.max_latency)
+
+    def close(self):
+        self.__frames.close()
+        self.camera.close()
+
+
+class FileSource:
+
+    def __init__(self, path, framerate=30, loop=True):
+        """
+        Stand-in for the camera: frames of a video file, or one image repeated
+
+        :param path: video file or image file
+        :param framerate: frames per second delivered, like a camera. None as fast as possible
+        :param loop: restart a video at its end instead of ending the capture
+        """
+        import cv2
+
+        self.framerate = framerate
+        self.loop = loop
+        self.__image = cv2.imread(path)
+        self.__video = None
+        if self.__image is None:
+            self.__video = cv2.VideoCapture(path)
+            ok, first = self.__video.read()
+            if not ok:
+                raise IOError("can not read frames from {}".format(path))
+            self.shape = first.shape
+            self.__video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        else:
+            self.shape = self.__image.shape
+        self.__next_frame = time.monotonic()
+
+    def read_into(self, buffer):
+        """
+        :return: time.monotonic() the frame was taken at, None at the end of a video not looping
+        """
+        if self.framerate is not None:
+            delay = self.__next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.__next_frame = max(self.__next_frame, time.monotonic() - 1 / self.framerate) + 1 / self.framerate
+        timestamp = time.monotonic()
+        if self.__image is not None:
+            numpy.copyto(buffer, self.__image)
+            return timestamp
+        ok, image = self.__video.read(buffer)
+        if not ok and self.loop:
+            import cv2
+            self.__video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self.__video.read(buffer)
+        if not ok:
+            return None
+        if image is not buffer:
+            # opencv allocated a new image instead of decoding into the buffer
+            numpy.copyto(buffer, image)
+        return timestamp
+
+    def close(self):
+        if self.__video is not None:
+            self.__video.release()
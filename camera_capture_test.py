@@ -0,0 +1,86 @@
+"""Runs without a camera on the images/ fixtures: python camera_capture_test.py (or pytest)"""
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy
+
+from camera_capture import CaptureService, FileSource, FrameRing, _exposure_start
+
+
+def test_latest_frame_from_file():
+    service = CaptureService(FileSource("images/pitest.jpg", framerate=200), frame_count=3).start()
+    frame = service.latest(timeout=1)
+    assert frame is not None and frame.image.shape == service.source.shape
+    out = numpy.empty_like(frame.image)
+    assert service.latest(out).image is out
+    service.stop().join(1)
+    assert not service.is_running()
+
+
+def test_frame_after_waits_for_new_exposure():
+    service = CaptureService(FileSource("images/pitest.jpg", framerate=100)).start()
+    first = service.latest(timeout=1)
+    timestamp = time.monotonic()
+    frame = service.frame_after(timestamp, timeout=1)
+    assert frame.timestamp >= timestamp and frame.index > first.index
+    service.stop().join(1)
+
+
+def test_frame_after_returns_first_matching_frame():
+    ring = FrameRing(4, (2, 2, 3))
+    for timestamp in (1.0, 2.0, 3.0):
+        ring.next_buffer()[:] = int(timestamp)
+        ring.publish(timestamp)
+    frame = ring.frame_after(1.5)
+    assert frame.timestamp == 2.0 and frame.image[0, 0, 0] == 2
+    assert ring.frame_after(3.5, timeout=0.01) is None
+
+
+def test_frame_after_selection_in_full_ring():
+    ring = FrameRing(3, (2, 2, 3))
+    for timestamp in (1.0, 2.0, 3.0, 4.0, 5.0):
+        ring.next_buffer()[:] = int(timestamp)
+        ring.publish(timestamp)
+    # the oldest matching frame the writer does not overwrite next, not the slot of frame 3
+    frame = ring.frame_after(0)
+    assert (frame.index, frame.timestamp, frame.image[0, 0, 0]) == (3, 4.0, 4)
+    assert ring.frame_after(4.0).index == 3 and ring.frame_after(4.5).index == 4
+    assert ring.latest().index == 4
+
+    # no matching frame yet, waits for the writer
+    def publish():
+        time.sleep(0.05)
+        ring.next_buffer()[:] = 6
+        ring.publish(6.0)
+
+    writer = threading.Thread(target=publish)
+    writer.start()
+    frame = ring.frame_after(5.5, timeout=1)
+    writer.join()
+    assert (frame.index, frame.timestamp, frame.image[0, 0, 0]) == (5, 6.0, 6)
+
+
+def test_frame_exposed_before_request_rejected():
+    ring = FrameRing(4, (2, 2, 3))
+    received = time.monotonic()
+    after = received - 0.02
+    # received after the request, but the first line left the sensor 50 ms earlier, clocks in microseconds
+    camera = SimpleNamespace(timestamp=7000000, frame=SimpleNamespace(timestamp=6950000), exposure_speed=10000)
+    timestamp = _exposure_start(camera, received, max_latency=0)
+    assert abs(timestamp - (received - 0.06)) < 1e-9
+    ring.publish(timestamp)
+    assert ring.frame_after(after, timeout=0.01) is None
+
+    # without a timestamp of the frame the latency bound is assumed
+    camera.frame.timestamp = None
+    assert _exposure_start(camera, received, max_latency=0.05) < after
+    ring.publish(_exposure_start(camera, received + 0.1, max_latency=0.05))
+    assert ring.frame_after(after, timeout=0.01).index == 1
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
@@ -0,0 +1,2 @@
+# eezybot_test.py drives the real arm and sleeps, it is not a pytest module
+collect_ignore = ["eezybot_test.py"]
@@ -1,4 +1,5 @@
 """----------------------------------------CONTROLLER--------------------------------------------"""
+import sys
 from enum import Enum
 
 import numpy
@@ -6,10 +7,28 @@ import numpy
 
 class SERVO_CONTROLLER:
     USE_FAKE_CONTROLLER = False
+    # write the PCA9685 registers directly, one I2C transaction for all channels updated in a tick
+    BATCHED_OUTPUT = False
+    # fake controller only: rotations advance a virtual clock instead of sleeping (forces synchronized execution)
+    SIMULATE_TIME = False
 
 
 class EEZYBOT_CONTROLLER:
     NO_STEP_TIMES = False
+    # one executor Thread moving all Servos on a shared tick instead of one Thread per Servo
+    SYNCHRONIZED = False
+    # queued rotations collapse into the latest target instead of being performed one after another
+    COALESCE_ROTATIONS = False
+
+    class Profile(Enum):
+        # constant acceleration
+        TRAPEZOIDAL = 0
+        # sinusoidal acceleration, no jerk
+        S_CURVE = 1
+
+    PROFILE = Profile.TRAPEZOIDAL
+    # seconds between two angle updates while rotating
+    UPDATE_INTERVAL = 0.02
 
     class MANUEL_CONTROL:
         # Should be False if not running on pi due to use of picamera
@@ -20,35 +39,63 @@ class EEZYBOT_CONTROLLER:
         MIN = 0
         DEFAULT = 20
         MAX = 180
-        STEP_SIZE = 2
-        STEP_TIME = 0.02 * STEP_SIZE
+        # degrees per second
+        MAX_VELOCITY = 50
+        # degrees per second squared
+        MAX_ACCELERATION = 300
 
     class HORIZONTAL:
         CHANNEL = 1
         MIN = 0
         DEFAULT = 21
         MAX = 125
-        STEP_SIZE = 1
-        STEP_TIME = 0.025 * STEP_SIZE
+        MAX_VELOCITY = 40
+        MAX_ACCELERATION = 300
 
     class VERTICAL:
         CHANNEL = 2
         MIN = 0
         MAX = 150
         DEFAULT = 129
-        STEP_SIZE = 1
-        STEP_TIME = 0.02 * STEP_SIZE
+        MAX_VELOCITY = 50
+        MAX_ACCELERATION = 300
 
     class CLUTCH:
         CHANNEL = 3
         MIN = 35
         MAX = 180
         DEFAULT = MAX - 30
-        STEP_SIZE = 1
-        STEP_TIME = 0.0075 * STEP_SIZE
+        MAX_VELOCITY = 40
+        MAX_ACCELERATION = 300
         GRAB = MIN
         RELEASE = MAX
 
+    class KINEMATICS:
+        # EEZYbotARM MK2 geometry in millimeters
+        BASE_HEIGHT = 92
+        LOWER_ARM = 135
+        UPPER_ARM = 147
+        # horizontal distance from the end of the upper arm to the center of the clutch
+        CLUTCH_OFFSET = 60
+        # joint angle in degrees = ZERO + DIRECTION * servo angle, measured against the horizontal.
+        # The upper arm is driven by a parallelogram, its angle does not depend on the lower arm
+        LOWER_ARM_ZERO = 180
+        LOWER_ARM_DIRECTION = -1
+        UPPER_ARM_ZERO = 20
+        UPPER_ARM_DIRECTION = -1
+        # degrees between two entries of the inverse kinematics table
+        TABLE_RESOLUTION = 0.5
+        # directory the inverse kinematics tables are cached in
+        CACHE_DIRECTORY = "kinematics_cache"
+        # millimeters a position resolved by move_to() or move_along() may be away from the requested one
+        MAX_ERROR = 5
+        # millimeters between two waypoints of the straight lines of move_along()
+        PATH_STEP = 20
+        # millimeters per second the clutch moves at along the path of move_along()
+        PATH_VELOCITY = 100
+        # millimeters per second squared
+        PATH_ACCELERATION = 300
+
 
 """----------------------------------------IMAGE PROCESSING--------------------------------------------"""
 
@@ -56,8 +103,43 @@ class EEZYBOT_CONTROLLER:
 class IMAGE_PROCESSING:
     MIN_RADIUS = 20
     X_OFFSET = -30
-    EXECUTE_IN_PYTHON2 = False
+    # detect in a long-lived worker process, see detection_worker.py
+    USE_DETECTION_WORKER = False
+    # python 3 interpreter running the worker, e.g. of a virtualenv having OpenCV installed
+    WORKER_PYTHON = sys.executable
+    # seconds to wait for the marbles of a frame before the worker is restarted
+    WORKER_TIMEOUT = 2
+    # seconds to wait for the worker to import OpenCV
+    WORKER_START_TIMEOUT = 30
+    # "contours" detects every marble, "components" only the biggest one, see image_processing.MarbleDetector
+    DETECTION_BACKEND = "contours"
+    # search candidates in a frame of PYRAMID_SIZE, measured in crops of the full resolution frame
+    PYRAMID = False
+    PYRAMID_SIZE = 128
+    # search a window around the last detected marble first, the full frame only if it is not found there
+    ROI_TRACKING = False
+    # half the size of the window in radii of the last detected marble
+    ROI_SCALE = 3
+    # predict the marble through dropped detections with a Kalman Filter, see marble_tracker.py
+    KALMAN_TRACKING = False
+    # dropped detections in a row predicted through before the marble counts as lost
+    MAX_DROPOUTS = 3
+    # expected change of the state (x, y, radius) per degree of (base, vertical, horizontal) rotation,
+    # None to ignore the arm motion
+    CONTROL_MATRIX = None
     USE_IMAGE_NOT_CAMERA = False
+    # stream from the video port into a ring of frame buffers instead of a still capture per picture
+    CONTINUOUS_CAPTURE = False
+    CAPTURE_BUFFERS = 4
+    CAPTURE_FRAMERATE = 30
+    # a file played instead of the camera by the continuous capture, e.g. a recorded video. None for the camera
+    CAPTURE_FILE = None
+    # seconds to wait for a frame before failing
+    CAPTURE_TIMEOUT = 2
+    # seconds the servos need to settle after their last write, observations are exposed after it
+    SETTLE_DELAY = 0.1
+    # directory of the HSV conversions cached by hsv_calibration.py
+    CALIBRATION_CACHE = "calibration_cache"
     # debug
     USE_FAKE_IMAGE_PROCESSING = False
 
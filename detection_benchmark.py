@@ -0,0 +1,230 @@
+"""Benchmark of the detection pipeline: take_picture -> _find_marbles -> get_state, stage by stage.
+
+Runs without a camera on the images/ fixtures and on synthetic frames of several resolutions.
+The results are written as JSON, compared by -compare to the results of another commit on the same machine
+"""
+
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import image_processing
+import image_processing_interface
+import raspi_camera
+from camera_capture import CaptureService
+from constants import AI, IMAGE_PROCESSING
+from image_processing import MarbleDetector
+
+# the fixtures next to this file, wherever the benchmark is started from
+IMAGES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+SYNTHETIC_SIZES = (256, 512, 1024, 2048)
+PERCENTILES = (50, 95, 99)
+# flags of IMAGE_PROCESSING the capture and chain stages depend on, pinned to read from the injected CaptureService
+PINNED_FLAGS = {"CONTINUOUS_CAPTURE": True, "USE_IMAGE_NOT_CAMERA": False, "USE_DETECTION_WORKER": False}
+
+
+class _ArraySource:
+
+    def __init__(self, image, framerate=IMAGE_PROCESSING.CAPTURE_FRAMERATE):
+        """
+        Stand-in for the camera delivering the same image at the framerate of the camera,
+        the capture Thread sleeps in between instead of competing with the measured stages
+        """
+        self.image = image
+        self.shape = image.shape
+        self.framerate = framerate
+
+    def read_into(self, buffer):
+        time.sleep(1 / self.framerate)
+        np.copyto(buffer, self.image)
+        return time.monotonic()
+
+    def close(self):
+        pass
+
+
+def synthetic_frame(size, marbles=3, seed=0):
+    """
+    :return: BGR image of size x size of gray noise and marbles in the color of the current light
+    """
+    random = np.random.RandomState(seed)
+    image = np.repeat(random.randint(0, 120, (size, size, 1)).astype(np.uint8), 3, axis=2)
+    color_lower, color_upper = AI.properties.light.get_color_space()
+    hsv = np.array([[[(color_lower[0] + min(color_upper[0], 179)) // 2,
+                      (color_lower[1] + min(color_upper[1], 255)) // 2, 200]]], dtype=np.uint8)
+    color = tuple(int(value) for value in cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0, 0])
+    for _ in range(marbles):
+        radius = int(size * random.uniform(0.04, 0.1))
+        center = tuple(int(value) for value in random.randint(radius, size - radius, 2))
+        cv2.circle(image, center, radius, color, -1)
+    return image
+
+
+def _inputs():
+    """
+    :return: list of (name, BGR image)
+    """
+    paths = sorted(glob.glob(os.path.join(IMAGES_DIRECTORY, "*")))
+    if not paths:
+        raise IOError("no images in {}".format(IMAGES_DIRECTORY))
+    inputs = [(os.path.basename(path), cv2.imread(path)) for path in paths]
+    inputs += [("synthetic_{}".format(size), synthetic_frame(size)) for size in SYNTHETIC_SIZES]
+    return [(name, image) for name, image in inputs if image is not None]
+
+
+def measure(func, repeats, warmup=5):
+    """
+        calls func repeats times, timed without and then again with tracing the allocations
+
+    :return: dictionary of the latency percentiles and the mean in milliseconds, the calls per second,
+             the allocated blocks and the peak of the allocated bytes per call
+    """
+    for _ in range(warmup):
+        func()
+    durations = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations[i] = time.perf_counter() - start
+
+    # tracing slows every allocation down, measured separately
+    allocation_repeats = max(repeats // 10, 1)
+    tracemalloc.start()
+    blocks = peak = 0
+    for _ in range(allocation_repeats):
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func()
+        peak += tracemalloc.get_traced_memory()[1] - current
+        blocks += sum(max(stat.count_diff, 0) for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+
+    result = {"p{}_ms".format(percentile): float(np.percentile(durations, percentile)) * 1000
+              for percentile in PERCENTILES}
+    result["mean_ms"] = float(durations.mean()) * 1000
+    result["per_second"] = repeats / float(durations.sum())
+    result["allocated_blocks"] = blocks / allocation_repeats
+    result["peak_bytes"] = peak / allocation_repeats
+    return result
+
+
+def benchmark_input(image, repeats):
+    """
+    :return: dictionary of every stage and the results of measure()
+    """
+    color_lower, color_upper = (np.array(bound) for bound in AI.properties.light.get_color_space())
+    detector = MarbleDetector(color_lower, color_upper)
+    resized = cv2.resize(image, (MarbleDetector.SIZE, MarbleDetector.SIZE))
+    full_frame = (0, 0, MarbleDetector.SIZE, MarbleDetector.SIZE)
+    detector._find_circles(resized, full_frame)
+
+    flags = {name: getattr(IMAGE_PROCESSING, name) for name in PINNED_FLAGS}
+    for name, value in PINNED_FLAGS.items():
+        setattr(IMAGE_PROCESSING, name, value)
+    raspi_camera.capture_service = CaptureService(_ArraySource(image)).start()
+    out = np.empty_like(image)
+    try:
+        return {
+            "capture": measure(lambda: raspi_camera.take_picture(), repeats),
+            "capture_into_buffer": measure(lambda: raspi_camera.take_picture(out=out), repeats),
+            "resize": measure(lambda: cv2.resize(image, (MarbleDetector.SIZE, MarbleDetector.SIZE),
+                                                 dst=detector.resized), repeats),
+            "threshold_and_circles": measure(lambda: detector._find_circles(resized, full_frame), repeats),
+            "circles": measure(lambda: detector._circles(detector.mask, full_frame), repeats),
+            "find_marbles": measure(lambda: image_processing._find_marbles(image, color_lower, color_upper), repeats),
+            "chain": measure(image_processing_interface.get_state, repeats)
+        }
+    finally:
+        raspi_camera.capture_service.stop().join()
+        raspi_camera.capture_service = None
+        for name, value in flags.items():
+            setattr(IMAGE_PROCESSING, name, value)
+
+
+def _commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeats=200):
+    """
+    :return: dictionary of the machine, the configuration and the results of every input and stage
+    """
+    return {
+        "commit": _commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(),
+                    "python": platform.python_version(), "numpy": np.__version__, "opencv": cv2.__version__},
+        "config": {"repeats": repeats, "detection_backend": IMAGE_PROCESSING.DETECTION_BACKEND,
+                   "pyramid": IMAGE_PROCESSING.PYRAMID, "roi_tracking": IMAGE_PROCESSING.ROI_TRACKING,
+                   "kalman_tracking": IMAGE_PROCESSING.KALMAN_TRACKING,
+                   "pinned": {name.lower(): value for name, value in PINNED_FLAGS.items()}},
+        "results": {name: dict(shape=list(image.shape), **benchmark_input(image, repeats))
+                    for name, image in _inputs()}
+    }
+
+
+def compare(results, baseline):
+    """
+    :return: lines of the p50 latency of every stage relative to the one of the baseline
+    """
+    lines = ["{} against {}".format(results["commit"], baseline["commit"])]
+    for name, stages in results["results"].items():
+        for stage, result in stages.items():
+            if stage == "shape" or stage not in baseline["results"].get(name, {}):
+                continue
+            old = baseline["results"][name][stage]["p50_ms"]
+            lines.append("{:24} {:22} {:8.3f} ms {:8.3f} ms {:+7.1%}".format(
+                name, stage, old, result["p50_ms"], result["p50_ms"] / max(old, 1e-9) - 1))
+    return lines
+
+
+def _main(args):
+    repeats = 200
+    output = None
+    baseline = None
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '-repeats' or arg == '-r':
+            i += 1
+            repeats = int(args[i])
+        elif arg == '-compare' or arg == '-c':
+            i += 1
+            baseline = args[i]
+        elif output is None:
+            output = arg
+        else:
+            raise ValueError("There is no argument {} for detection_benchmark.py".format(arg))
+        i += 1
+
+    results = run(repeats)
+    if output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        for name, stages in results["results"].items():
+            print("{:24} {}".format(name, " ".join(
+                "{} {:.3f}/{:.3f}/{:.3f} ms".format(stage, *(stages[stage]["p{}_ms".format(p)] for p in PERCENTILES))
+                for stage in ("capture", "find_marbles", "chain"))))
+    if baseline is not None:
+        with open(baseline) as f:
+            print("\n".join(compare(results, json.load(f))))
+
+
+# called when executed directly
+if __name__ == '__main__':
+    _main(sys.argv[1:])
@@ -0,0 +1,228 @@
+"""Marble detection in a long-lived worker process, e.g. of another python 3 interpreter having OpenCV installed.
+
+Requests and results are exchanged as JSON lines over the pipes of the worker,
+frames are passed through a memory mapped file shared by both processes.
+The worker imports constants and image_processing, so it needs python 3 like the rest of the project
+"""
+
+import json
+import mmap
+import os
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from constants import IMAGE_PROCESSING
+
+
+class DetectionWorkerException(Exception):
+    pass
+
+
+class DetectionWorker:
+
+    def __init__(self, python=IMAGE_PROCESSING.WORKER_PYTHON, timeout=IMAGE_PROCESSING.WORKER_TIMEOUT,
+                 start_timeout=IMAGE_PROCESSING.WORKER_START_TIMEOUT):
+        """
+        Detects marbles in a worker process started on first use and kept running for every further frame,
+        so OpenCV is imported once instead of per frame. A crashed worker or one answering something else than JSON
+        is restarted and the request is repeated,
+        a worker not answering in time is killed and restarted with the next request
+
+        :param python: python 3 interpreter running the worker, e.g. sys.executable
+        :param timeout: seconds to wait for the marbles of a frame
+        :param start_timeout: seconds to wait for the worker to import its modules
+        """
+        self.python = python
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.restarts = 0
+        self.__process = None
+        self.__memory = None
+        self.__memory_file = None
+        self.__request_id = 0
+        self.__lock = threading.Lock()
+
+    def detect(self, image, color_lower, color_upper, hint=None):
+        """
+            see image_processing.MarbleDetector.detect()
+
+        :param image: BGR image as numpy array
+        :raises DetectionWorkerException: if the worker fails twice in a row or does not answer in time
+        """
+        with self.__lock:
+            try:
+                return self.__request(image, color_lower, color_upper, hint)
+            except (OSError, EOFError, json.JSONDecodeError):
+                # crashed, e.g. killed by the OOM killer, or answered garbage. Repeated once by a new worker
+                self.__kill()
+                self.restarts += 1
+            try:
+                return self.__request(image, color_lower, color_upper, hint)
+            except (OSError, EOFError, json.JSONDecodeError) as e:
+                self.__kill()
+                raise DetectionWorkerException("detection worker crashed: {}".format(e))
+
+    def __request(self, image, color_lower, color_upper, hint):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        self.__start(image.nbytes)
+        np.frombuffer(self.__memory, dtype=np.uint8, count=image.size).reshape(image.shape)[...] = image
+
+        response = self.__exchange({
+            "shape": list(image.shape),
+            "color_lower": np.asarray(color_lower).tolist(),
+            "color_upper": np.asarray(color_upper).tolist(),
+            "hint": None if hint is None else [float(value) for value in hint]
+        })
+        return [tuple(marble) for marble in response["marbles"]]
+
+    def __exchange(self, request):
+        """
+            sends the request to the running worker
+        :return: the response of the worker
+        """
+        self.__request_id += 1
+        request["id"] = self.__request_id
+        self.__process.stdin.write((json.dumps(request) + "\n").encode())
+        self.__process.stdin.flush()
+
+        response = self.__read(self.timeout)
+        if response.get("id") != self.__request_id:
+            self.__kill()
+            raise DetectionWorkerException("unexpected response of the detection worker: {}".format(response))
+        if "error" in response:
+            raise DetectionWorkerException("detection worker failed: {}".format(response["error"]))
+        return response
+
+    def reset_tracking(self):
+        """
+            forgets the marbles tracked by the MarbleDetectors of the worker.
+            A worker that is not running has none, a failing one is killed and restarted untracked by the next request
+        """
+        with self.__lock:
+            if self.pid() is not None:
+                try:
+                    self.__exchange({"reset_tracking": True})
+                except (OSError, EOFError, json.JSONDecodeError):
+                    self.__kill()
+        return self
+
+    def __read(self, timeout):
+        """
+        :return: the next response of the worker
+        :raises DetectionWorkerException: on timeout, the worker is killed
+        :raises EOFError: if the worker exited
+        :raises json.JSONDecodeError: if the response is no JSON
+        """
+        stdout = self.__process.stdout
+        deadline = time.monotonic() + timeout
+        line = b""
+        while not line.endswith(b"\n"):
+            remaining = deadline - time.monotonic()
+            readable, _, _ = select.select([stdout], [], [], max(remaining, 0))
+            if not readable:
+                self.__kill()
+                self.restarts += 1
+                raise DetectionWorkerException("detection worker did not answer within {} s".format(timeout))
+            chunk = os.read(stdout.fileno(), 65536)
+            if not chunk:
+                raise EOFError("detection worker exited with {}".format(self.__process.poll()))
+            line += chunk
+        # one request at a time, there is never more than one response
+        return json.loads(line.decode())
+
+    def __start(self, size):
+        """
+            starts the worker unless it is running with a shared memory of at least the given size
+        """
+        if self.__process is not None and self.__process.poll() is None and len(self.__memory) >= size:
+            return
+        if self.__process is not None and self.__process.poll() is not None:
+            # exited since the last request
+            self.restarts += 1
+        self.__kill()
+
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        descriptor, self.__memory_file = tempfile.mkstemp(prefix="marble_frames_", dir=directory)
+        try:
+            os.ftruncate(descriptor, size)
+            self.__memory = mmap.mmap(descriptor, size)
+        finally:
+            os.close(descriptor)
+
+        self.__process = subprocess.Popen(
+            [self.python, os.path.abspath(__file__), self.__memory_file, str(size)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if not self.__read(self.start_timeout).get("ready"):
+            self.__kill()
+            raise DetectionWorkerException("detection worker did not start")
+
+    def __kill(self):
+        if self.__process is not None:
+            if self.__process.poll() is None:
+                self.__process.kill()
+            self.__process.wait()
+            self.__process.stdin.close()
+            self.__process.stdout.close()
+            self.__process = None
+        if self.__memory is not None:
+            self.__memory.close()
+            self.__memory = None
+        if self.__memory_file is not None:
+            os.remove(self.__memory_file)
+            self.__memory_file = None
+
+    def pid(self):
+        """
+        :return: process id of the running worker, None if there is none
+        """
+        process = self.__process
+        return None if process is None or process.poll() is not None else process.pid
+
+    def close(self):
+        with self.__lock:
+            self.__kill()
+        return self
+
+
+def _serve(memory_file, size):
+    """
+        runs in the worker process, answers requests read from stdin until it is closed
+    """
+    from image_processing import _find_marbles, reset_tracking
+
+    # anything printed by the detection must not mix with the responses
+    responses = sys.stdout
+    sys.stdout = sys.stderr
+    with open(memory_file, "r+b") as f:
+        memory = mmap.mmap(f.fileno(), size)
+
+    def respond(response):
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
+
+    respond({"ready": True})
+    for line in iter(sys.stdin.readline, ""):
+        request = json.loads(line)
+        try:
+            if request.get("reset_tracking"):
+                reset_tracking()
+                respond({"id": request["id"]})
+                continue
+            shape = tuple(request["shape"])
+            image = np.frombuffer(memory, dtype=np.uint8, count=int(np.prod(shape))).reshape(shape)
+            marbles = _find_marbles(image, np.array(request["color_lower"]), np.array(request["color_upper"]),
+                                    request["hint"])
+            respond({"id": request["id"], "marbles": [[int(value) for value in marble] for marble in marbles]})
+        except Exception as e:
+            respond({"id": request["id"], "error": repr(e)})
+
+
+# called as worker process
+if __name__ == '__main__':
+    _serve(sys.argv[1], int(sys.argv[2]))
@@ -0,0 +1,144 @@
+"""Runs without a camera on the images/ fixtures: python detection_worker_test.py (or pytest)"""
+import glob
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from constants import Light
+from detection_worker import DetectionWorker, DetectionWorkerException
+from image_processing import MarbleDetector
+
+IMAGES = sorted(glob.glob("images/*"))
+
+# workers starting up like the real one, but then never answering or answering garbage
+STALLING_WORKER = """import json, sys, time
+print(json.dumps({"ready": True}), flush=True)
+sys.stdin.readline()
+time.sleep(60)
+"""
+GARBAGE_WORKER = """import json, sys
+print(json.dumps({"ready": True}), flush=True)
+for line in sys.stdin:
+    print("no json", flush=True)
+"""
+
+
+def _interpreter(directory, name, source):
+    """
+    :return: path of an executable running the given source instead of the worker, in place of a python interpreter
+    """
+    script = os.path.join(directory, name + ".py")
+    with open(script, "w") as f:
+        f.write(source)
+    interpreter = os.path.join(directory, name)
+    with open(interpreter, "w") as f:
+        f.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, script))
+    os.chmod(interpreter, 0o755)
+    return interpreter
+
+
+def test_worker_detects_like_detector():
+    color_lower, color_upper = (np.array(bound) for bound in Light(Light.Intensity.LOW).get_color_space())
+    worker = DetectionWorker()
+    try:
+        for path in IMAGES:
+            image = cv2.imread(path)
+            expected = MarbleDetector(color_lower, color_upper).detect(image)
+            assert worker.detect(image, color_lower, color_upper) == expected, path
+        assert worker.restarts == 0
+    finally:
+        worker.close()
+    assert worker.pid() is None
+
+
+def test_worker_recovers_after_kill():
+    color_lower, color_upper = (np.array(bound) for bound in Light(Light.Intensity.LOW).get_color_space())
+    image = cv2.imread("images/pitest.jpg")
+    expected = MarbleDetector(color_lower, color_upper).detect(image)
+    worker = DetectionWorker()
+    try:
+        assert worker.detect(image, color_lower, color_upper) == expected
+        pid = worker.pid()
+        os.kill(pid, signal.SIGKILL)
+        while worker.pid() is not None:
+            time.sleep(0.01)
+        # restarted by the next request
+        assert worker.detect(image, color_lower, color_upper) == expected
+        assert worker.restarts == 1 and worker.pid() not in (None, pid)
+    finally:
+        worker.close()
+
+
+def test_worker_resets_tracking():
+    color_lower, color_upper = (np.array(bound) for bound in Light(Light.Intensity.LOW).get_color_space())
+    image = cv2.imread("images/pitest.jpg")
+    expected = MarbleDetector(color_lower, color_upper).detect(image)
+    worker = DetectionWorker()
+    try:
+        # nothing tracked without a running worker
+        assert worker.reset_tracking().pid() is None
+        assert worker.detect(image, color_lower, color_upper) == expected
+        pid = worker.pid()
+        worker.reset_tracking()
+        assert worker.pid() == pid and worker.restarts == 0
+        assert worker.detect(image, color_lower, color_upper) == expected
+    finally:
+        worker.close()
+
+
+def test_worker_restarted_after_timeout():
+    color_lower, color_upper = (np.array(bound) for bound in Light(Light.Intensity.LOW).get_color_space())
+    image = cv2.imread("images/pitest.jpg")
+    expected = MarbleDetector(color_lower, color_upper).detect(image)
+    directory = tempfile.mkdtemp()
+    worker = DetectionWorker(python=_interpreter(directory, "stalling", STALLING_WORKER), timeout=0.2)
+    try:
+        start = time.monotonic()
+        try:
+            worker.detect(image, color_lower, color_upper)
+            assert False, "the worker never answers"
+        except DetectionWorkerException:
+            pass
+        assert time.monotonic() - start < 5
+        # killed, the next request starts a new worker
+        assert worker.restarts == 1 and worker.pid() is None
+        worker.python = sys.executable
+        assert worker.detect(image, color_lower, color_upper) == expected
+        assert worker.restarts == 1
+    finally:
+        worker.close()
+        shutil.rmtree(directory)
+
+
+def test_worker_restarted_after_garbage():
+    color_lower, color_upper = (np.array(bound) for bound in Light(Light.Intensity.LOW).get_color_space())
+    image = cv2.imread("images/pitest.jpg")
+    expected = MarbleDetector(color_lower, color_upper).detect(image)
+    directory = tempfile.mkdtemp()
+    worker = DetectionWorker(python=_interpreter(directory, "garbage", GARBAGE_WORKER))
+    try:
+        # repeated once by a new worker answering garbage as well
+        try:
+            worker.detect(image, color_lower, color_upper)
+            assert False, "the worker answers no JSON"
+        except DetectionWorkerException:
+            pass
+        assert worker.restarts == 1 and worker.pid() is None
+        worker.python = sys.executable
+        assert worker.detect(image, color_lower, color_upper) == expected
+    finally:
+        worker.close()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
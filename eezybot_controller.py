@@ -1,19 +1,38 @@
-from constants import EEZYBOT_CONTROLLER as EEZYBOT
+import math
+
+from constants import EEZYBOT_CONTROLLER as EEZYBOT, SERVO_CONTROLLER
 from image_processing_interface import get_state
 from key_listener import KeyListener
-from servo_controller import ServoController, Servo, ServoKeyListener
+from motion_profile import FixedDurationProfile, TrapezoidalProfile, SCurveProfile
+from servo_controller import ServoController, Servo, ServoKeyListener, OutOfBoundsException
 
 if EEZYBOT.MANUEL_CONTROL.RESOLVE_REWARDS:
     import reward_calculation
 
 
+def _motion_profile(servo):
+    """
+        MotionProfile of the given Servo constants, None if NO_STEP_TIMES to rotate without delay
+    """
+    if EEZYBOT.NO_STEP_TIMES:
+        return None
+    return {
+        EEZYBOT.Profile.TRAPEZOIDAL: TrapezoidalProfile,
+        EEZYBOT.Profile.S_CURVE: SCurveProfile
+    }.get(EEZYBOT.PROFILE)(servo.MAX_VELOCITY, servo.MAX_ACCELERATION)
+
+
+class UnreachablePositionException(OutOfBoundsException):
+    pass
+
+
 class _Base(Servo):
 
     def __init__(self):
         super().__init__(EEZYBOT.BASE.CHANNEL, EEZYBOT.BASE.MIN, EEZYBOT.BASE.MAX,
                          default_angle=EEZYBOT.BASE.DEFAULT, name="Base",
-                         step_size=EEZYBOT.BASE.STEP_SIZE,
-                         step_time=EEZYBOT.BASE.STEP_TIME if not EEZYBOT.NO_STEP_TIMES else 0)
+                         step_time=0, profile=_motion_profile(EEZYBOT.BASE),
+                         update_interval=EEZYBOT.UPDATE_INTERVAL)
 
 
 class _ArmVertical(Servo):
@@ -21,8 +40,8 @@ class _ArmVertical(Servo):
     def __init__(self):
         super().__init__(EEZYBOT.VERTICAL.CHANNEL, EEZYBOT.VERTICAL.MIN, EEZYBOT.VERTICAL.MAX,
                          default_angle=EEZYBOT.VERTICAL.DEFAULT, name="Vertical Arm",
-                         step_size=EEZYBOT.VERTICAL.STEP_SIZE,
-                         step_time=EEZYBOT.VERTICAL.STEP_TIME if not EEZYBOT.NO_STEP_TIMES else 0)
+                         step_time=0, profile=_motion_profile(EEZYBOT.VERTICAL),
+                         update_interval=EEZYBOT.UPDATE_INTERVAL)
 
 
 class _ArmHorizontal(Servo):
@@ -30,8 +49,8 @@ class _ArmHorizontal(Servo):
     def __init__(self):
         super().__init__(EEZYBOT.HORIZONTAL.CHANNEL, EEZYBOT.HORIZONTAL.MIN, EEZYBOT.HORIZONTAL.MAX,
                          default_angle=EEZYBOT.HORIZONTAL.DEFAULT, name="Horizontal Arm",
-                         step_size=EEZYBOT.HORIZONTAL.STEP_SIZE,
-                         step_time=EEZYBOT.HORIZONTAL.STEP_TIME if not EEZYBOT.NO_STEP_TIMES else 0)
+                         step_time=0, profile=_motion_profile(EEZYBOT.HORIZONTAL),
+                         update_interval=EEZYBOT.UPDATE_INTERVAL)
 
 
 class _Clutch(Servo):
@@ -39,8 +58,8 @@ class _Clutch(Servo):
     def __init__(self):
         super().__init__(EEZYBOT.CLUTCH.CHANNEL, EEZYBOT.CLUTCH.MIN, EEZYBOT.CLUTCH.MAX,
                          default_angle=EEZYBOT.CLUTCH.DEFAULT, name="Clutch",
-                         step_size=EEZYBOT.CLUTCH.STEP_SIZE,
-                         step_time=EEZYBOT.HORIZONTAL.STEP_TIME if not EEZYBOT.NO_STEP_TIMES else 0)
+                         step_time=0, profile=_motion_profile(EEZYBOT.CLUTCH),
+                         update_interval=EEZYBOT.UPDATE_INTERVAL)
 
     def grab(self):
         return self.rotate_to(EEZYBOT.CLUTCH.GRAB)
@@ -97,14 +116,122 @@ class _EezybotKeyListener(ServoKeyListener):
 
 
 class _EezybotServoController(ServoController):
+    """
+        asyncio usage, all Servos driven by the event loop instead of Threads:
+            asyncio.ensure_future(eezybot.run_async())
+            await eezybot.base.rotate_to(90)
+            await eezybot.wait_for_all_async()
+            await eezybot.to_default_and_shutdown_async()
+
+        Cartesian moves, positions in millimeters (see kinematics.forward()):
+            eezybot.move_to(150, 50, 100).wait_for_all()
+            eezybot.move_along([(150, 50, 100), (50, 150, 100)]).wait_for_all()
+    """
 
     def __init__(self):
         self.base = _Base()
         self.verticalArm = _ArmVertical()
         self.horizontalArm = _ArmHorizontal()
         self.clutch = _Clutch()
-        super().__init__(self.base, self.verticalArm, self.horizontalArm, self.clutch)
+        super().__init__(self.base, self.verticalArm, self.horizontalArm, self.clutch,
+                         synchronized=EEZYBOT.SYNCHRONIZED or SERVO_CONTROLLER.SIMULATE_TIME)
+        self.coalesce_rotations(EEZYBOT.COALESCE_ROTATIONS)
         self.__key_listener_activated = False
+        # like the profiles of the Servos, move_along() moves without delay if NO_STEP_TIMES
+        self.__path_profile = None if EEZYBOT.NO_STEP_TIMES else \
+            TrapezoidalProfile(EEZYBOT.KINEMATICS.PATH_VELOCITY, EEZYBOT.KINEMATICS.PATH_ACCELERATION)
+
+    def __resolve(self, position, max_error):
+        """
+        :return: (base_angle, vertical_angle, horizontal_angle) moving the clutch to the given position
+        :raises UnreachablePositionException
+        """
+        from kinematics import inverse
+        base_angle, vertical_angle, horizontal_angle, error = inverse(*position)
+        if error > max_error:
+            raise UnreachablePositionException(
+                "Position {} out of reach: nearest reachable position is {:.1f}mm away".format(position, error))
+        return base_angle, vertical_angle, horizontal_angle
+
+    def __move_arm(self, angles, source, profile=None):
+        arm = (self.base, self.verticalArm, self.horizontalArm)
+        # every joint starts together, in synchronized mode they finish together as well
+        self.sync_point(*arm, source=source)
+        for servo, angle in zip(arm, angles):
+            servo.rotate_to(angle, source=source, profile=profile)
+
+    def position(self):
+        """
+        :return: (x, y, z) the clutch will be at after performing all queued rotations
+        """
+        from kinematics import forward
+        return tuple(forward(self.base.get_target_angle(), self.verticalArm.get_target_angle(),
+                             self.horizontalArm.get_target_angle()).tolist())
+
+    def move_to(self, x, y, z, max_error=EEZYBOT.KINEMATICS.MAX_ERROR, source=None):
+        """
+            moves the clutch to the given position in one coordinated move of base, vertical and horizontal arm,
+            after the queued rotations. The angles are resolved through the inverse kinematics table
+
+        :param max_error: millimeters the reached position may be away from the given one
+        :param source: name of the caller, written to the motion log if recording
+        :raises UnreachablePositionException
+        """
+        self.__move_arm(self.__resolve((x, y, z), max_error), source)
+        return self
+
+    def move_along(self, path, step=EEZYBOT.KINEMATICS.PATH_STEP, max_error=EEZYBOT.KINEMATICS.MAX_ERROR,
+                   source=None):
+        """
+            moves the clutch along straight lines through the given positions, starting at position().
+            The lines are split into waypoints step millimeters apart. The clutch does not stop at the waypoints:
+            it follows a trapezoidal profile of PATH_VELOCITY and PATH_ACCELERATION along the whole path,
+            between two waypoints every joint moves at constant velocity and all of them arrive together.
+            Segments a joint could not follow within its MAX_VELOCITY are slowed down.
+            Every waypoint is resolved before the first one is queued, so an unreachable path does not move the arm
+
+        :param path: iterable of (x, y, z) positions in millimeters
+        :param step: millimeters between two waypoints
+        :param max_error: millimeters every waypoint may be away from the line
+        :param source: name of the caller, written to the motion log if recording
+        :raises UnreachablePositionException
+        """
+        waypoints = []
+        start = self.position()
+        for end in path:
+            count = max(1, math.ceil(math.dist(start, end) / step))
+            for i in range(1, count + 1):
+                waypoints.append(tuple(a + (b - a) * i / count for a, b in zip(start, end)))
+            start = end
+
+        # (angles, millimeters along the path)
+        moves = []
+        length = 0.0
+        previous = self.position()
+        for waypoint in waypoints:
+            length += math.dist(previous, waypoint)
+            previous = waypoint
+            angles = self.__resolve(waypoint, max_error)
+            # neighbouring waypoints may resolve to the same entry of the table, the arm arrives at the later one
+            if moves and moves[-1][0] == angles:
+                moves[-1] = (angles, length)
+            else:
+                moves.append((angles, length))
+
+        arm = (self.base, self.verticalArm, self.horizontalArm)
+        velocities = (EEZYBOT.BASE.MAX_VELOCITY, EEZYBOT.VERTICAL.MAX_VELOCITY, EEZYBOT.HORIZONTAL.MAX_VELOCITY)
+        current = tuple(servo.get_target_angle() for servo in arm)
+        arrival = 0.0
+        for angles, travelled in moves:
+            duration = 0.0
+            if self.__path_profile is not None:
+                duration = self.__path_profile.time_at(length, travelled) - arrival
+                arrival += duration
+                duration = max([duration] + [abs(b - a) / velocity
+                                             for a, b, velocity in zip(current, angles, velocities)])
+            current = angles
+            self.__move_arm(angles, source, FixedDurationProfile(duration))
+        return self
 
     def to_default_and_shutdown(self, dump_rotations=False):
         """
@@ -121,6 +248,19 @@ class _EezybotServoController(ServoController):
         return super().finish_and_shutdown(base_angle, arm_vertical_angle, arm_horizontal_angle, clutch_angle,
                                            dump_rotations=dump_rotations)
 
+    async def to_default_and_shutdown_async(self, dump_rotations=False):
+        """
+            coroutine version of to_default_and_shutdown(), returns once every Servo is shut down
+        """
+        return await self.finish_and_shutdown_async(EEZYBOT.BASE.DEFAULT, EEZYBOT.VERTICAL.DEFAULT,
+                                                    EEZYBOT.HORIZONTAL.DEFAULT,
+                                                    EEZYBOT.CLUTCH.DEFAULT, dump_rotations=dump_rotations)
+
+    async def finish_and_shutdown_async(self, base_angle=None, arm_vertical_angle=None, arm_horizontal_angle=None,
+                                        clutch_angle=None, dump_rotations=False):
+        return await super().finish_and_shutdown_async(base_angle, arm_vertical_angle, arm_horizontal_angle,
+                                                       clutch_angle, dump_rotations=dump_rotations)
+
     def activate_key_listener(self):
         """
             Eezybot must be started to activate Key Listeners
@@ -0,0 +1,140 @@
+"""Runs against the fake adafruit_servokit: python eezybot_controller_test.py (or pytest)"""
+import os
+import tempfile
+
+import numpy
+
+from constants import EEZYBOT_CONTROLLER as EEZYBOT, SERVO_CONTROLLER
+
+SERVO_CONTROLLER.USE_FAKE_CONTROLLER = True
+# rotations are performed at once
+EEZYBOT.NO_STEP_TIMES = True
+
+# noinspection PyPep8
+from eezybot_controller import _EezybotServoController, UnreachablePositionException
+# noinspection PyPep8
+from kinematics import forward
+# noinspection PyPep8
+from motion_log import MotionRecorder, MotionReplayer, COMMAND
+# noinspection PyPep8
+from motion_profile import TrapezoidalProfile
+
+
+def _clutch_position(eezybot):
+    return forward(eezybot.base.get_angle(), eezybot.verticalArm.get_angle(), eezybot.horizontalArm.get_angle())
+
+
+def _distance_to_line(point, start, end):
+    point, start, end = (numpy.asarray(value, dtype=numpy.float64) for value in (point, start, end))
+    direction = end - start
+    t = min(max(numpy.dot(point - start, direction) / numpy.dot(direction, direction), 0), 1)
+    return numpy.linalg.norm(point - (start + t * direction))
+
+
+def test_move_to():
+    eezybot = _EezybotServoController().start()
+    try:
+        eezybot.move_to(150, 50, 100).wait_for_all()
+        assert numpy.linalg.norm(_clutch_position(eezybot) - (150, 50, 100)) <= EEZYBOT.KINEMATICS.MAX_ERROR
+        assert numpy.allclose(eezybot.position(), _clutch_position(eezybot))
+
+        angles = [servo.get_angle() for servo in (eezybot.base, eezybot.verticalArm, eezybot.horizontalArm)]
+        try:
+            eezybot.move_to(1000, 0, 0)
+            assert False, "position out of reach"
+        except UnreachablePositionException:
+            pass
+        eezybot.wait_for_all()
+        assert [servo.get_angle() for servo in (eezybot.base, eezybot.verticalArm, eezybot.horizontalArm)] == angles
+    finally:
+        eezybot.interrupt().join(1)
+
+
+def test_move_along():
+    path = os.path.join(tempfile.mkdtemp(), "move_along.bin")
+    eezybot = _EezybotServoController().start()
+    try:
+        eezybot.move_to(150, 50, 100).wait_for_all()
+        start = eezybot.position()
+        recorder = MotionRecorder(path)
+        eezybot.record(recorder)
+        eezybot.move_along([(50, 150, 100)], source="test").wait_for_all()
+        eezybot.record(None)
+        recorder.close()
+        assert numpy.linalg.norm(_clutch_position(eezybot) - (50, 150, 100)) <= EEZYBOT.KINEMATICS.MAX_ERROR
+
+        # the n-th rotation of base, vertical and horizontal arm form the n-th waypoint
+        commands = [record for record in MotionReplayer(path).commands() if record.type == COMMAND]
+        assert all(record.source == "test" for record in commands)
+        angles = [[record.value for record in commands if record.channel == servo.get_channel()]
+                  for servo in (eezybot.base, eezybot.verticalArm, eezybot.horizontalArm)]
+        assert len(angles[0]) == len(angles[1]) == len(angles[2]) > 1
+        waypoints = [forward(*waypoint) for waypoint in zip(*angles)]
+        for waypoint in waypoints:
+            assert _distance_to_line(waypoint, start, (50, 150, 100)) <= EEZYBOT.KINEMATICS.MAX_ERROR
+        for previous, waypoint in zip([start] + waypoints, waypoints):
+            assert numpy.linalg.norm(waypoint - previous) <= \
+                EEZYBOT.KINEMATICS.PATH_STEP + 2 * EEZYBOT.KINEMATICS.MAX_ERROR
+
+        # an unreachable waypoint does not move the arm
+        position = eezybot.position()
+        try:
+            eezybot.move_along([(50, 150, 300)])
+            assert False, "path out of reach"
+        except UnreachablePositionException:
+            pass
+        assert eezybot.position() == position
+    finally:
+        eezybot.interrupt().join(1)
+        os.remove(path)
+
+
+def test_move_along_is_continuous():
+    """
+        the clutch stays on the line between the waypoints as well and does not stop at them
+    """
+    for synchronized in (False, True):
+        path = os.path.join(tempfile.mkdtemp(), "move_along_continuous.bin")
+        EEZYBOT.NO_STEP_TIMES, EEZYBOT.SYNCHRONIZED = False, synchronized
+        try:
+            eezybot = _EezybotServoController().start()
+        finally:
+            EEZYBOT.NO_STEP_TIMES, EEZYBOT.SYNCHRONIZED = True, False
+        try:
+            eezybot.move_to(150, 50, 100).wait_for_all()
+            start = eezybot.position()
+            recorder = MotionRecorder(path)
+            eezybot.record(recorder)
+            eezybot.move_along([(50, 150, 100)]).wait_for_all()
+            eezybot.record(None)
+            recorder.close()
+        finally:
+            eezybot.interrupt().join(1)
+
+        replayer = MotionReplayer(path)
+        os.remove(path)
+        ticks = [numpy.array(replayer.ticks(servo.get_channel()))
+                 for servo in (eezybot.base, eezybot.verticalArm, eezybot.horizontalArm)]
+        begin = min(channel_ticks[0, 0] for channel_ticks in ticks)
+        end = max(channel_ticks[-1, 0] for channel_ticks in ticks)
+        # 10 millisecond samples
+        times = numpy.arange(begin, end, 0.01)
+        angles = [numpy.interp(times, channel_ticks[:, 0], channel_ticks[:, 1]) for channel_ticks in ticks]
+        positions = forward(*angles)
+        for position in positions:
+            assert _distance_to_line(position, start, (50, 150, 100)) <= EEZYBOT.KINEMATICS.MAX_ERROR, synchronized
+
+        # stopping at the waypoints takes longer and slows the clutch down between the ramps of the path
+        length = numpy.linalg.norm(numpy.subtract((50, 150, 100), start))
+        duration = TrapezoidalProfile(EEZYBOT.KINEMATICS.PATH_VELOCITY,
+                                      EEZYBOT.KINEMATICS.PATH_ACCELERATION).duration(length)
+        assert end - begin < 1.2 * duration, (synchronized, end - begin, duration)
+        velocities = numpy.linalg.norm(positions[10:] - positions[:-10], axis=1) / 0.1
+        cruise = velocities[len(velocities) // 5:len(velocities) * 4 // 5]
+        assert cruise.min() > EEZYBOT.KINEMATICS.PATH_VELOCITY / 2, (synchronized, cruise.min())
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
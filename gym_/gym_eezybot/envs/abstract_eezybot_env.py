@@ -7,16 +7,29 @@ from gym import spaces
 # noinspection PyUnresolvedReferences
 from mpl_toolkits import mplot3d
 
-from constants import AI
+from constants import AI, EEZYBOT_CONTROLLER as EEZYBOT
 from eezybot_controller import eezybot
-from image_processing_interface import get_state
+from image_processing_interface import get_settled_state, reset_tracking
+from motion_macro import MotionMacro, Keyframe
 from reward_calculation import resolve_rewards
-from servo_controller import AngleTooLittleException, AngleTooBigException
+from servo_controller import AngleTooLittleException, AngleTooBigException, robot_time
 
 env_properties = AI.properties.env
 light_properties = AI.properties.light
 visualize = AI.properties.visualize
 
+# picks up the marble in front of the clutch and drops it at a random position
+_GRAB = MotionMacro("grab", [
+    Keyframe("lower", "verticalArm", offset=-10),
+    Keyframe("reach", "horizontalArm", offset=50, after=("lower",)),
+    Keyframe("grab", "clutch", angle=EEZYBOT.CLUTCH.GRAB, after=("lower",)),
+    Keyframe("lift", "verticalArm", angle=EEZYBOT.VERTICAL.MAX, after=("grab",)),
+    Keyframe("turn", "base", angle=lambda servo: np.random.randint(140) + 20, after=("lift",)),
+    Keyframe("retract", "horizontalArm", angle=EEZYBOT.HORIZONTAL.MAX, after=("lift",)),
+    Keyframe("drop", "verticalArm", angle=lambda servo: np.random.randint(50) + 10),
+    Keyframe("release", "clutch", angle=EEZYBOT.CLUTCH.RELEASE, after=("turn", "retract", "drop"))
+])
+
 
 class AbstractEezybotEnv(gym.Env, ABC):
     """DO NOT REGISTER AS ENV"""
@@ -89,16 +102,9 @@ class AbstractEezybotEnv(gym.Env, ABC):
         eezybot.start()
 
     def grab(self):
-        eezybot.verticalArm.rotate(-10).wait()
-        eezybot.horizontalArm.rotate(50)
-        eezybot.clutch.grab().wait()
-        eezybot.verticalArm.rotate_to_relative(1).wait()
-        eezybot.base.rotate_to(np.random.randint(140) + 20)
-        movement = np.random.randint(50)
-        eezybot.horizontalArm.rotate_to_relative(1)
-        eezybot.verticalArm.rotate_to(movement + 10)
-        eezybot.clutch.wait_for_servo(eezybot.base, eezybot.verticalArm,
-                                      eezybot.horizontalArm).release()
+        reset_tracking()
+        # queued at once, every Servo only waits for the keyframes it depends on
+        return _GRAB.run(eezybot)
 
     def _is_episode_over(self, old_state, new_state, rotation_successful):
         if old_state == (0, 0, 0) and new_state == (0, 0, 0):
@@ -119,7 +125,7 @@ class AbstractEezybotEnv(gym.Env, ABC):
         rotation_state = 0
         try:
             if base_angle != 0:
-                eezybot.base.rotate(base_angle, ensure_bounds=False)
+                eezybot.base.rotate(base_angle, ensure_bounds=False, source="agent")
         except AngleTooBigException as e:
             rotation_successful = False
             rotation_state = 1
@@ -132,7 +138,7 @@ class AbstractEezybotEnv(gym.Env, ABC):
                 print(e)
         try:
             if arm_vertical_angle != 0:
-                eezybot.verticalArm.rotate(arm_vertical_angle, ensure_bounds=False)
+                eezybot.verticalArm.rotate(arm_vertical_angle, ensure_bounds=False, source="agent")
         except AngleTooBigException as e:
             rotation_successful = False
             rotation_state = 3
@@ -145,7 +151,7 @@ class AbstractEezybotEnv(gym.Env, ABC):
                 print(e)
         try:
             if arm_horizontal_angle != 0:
-                eezybot.horizontalArm.rotate(arm_horizontal_angle, ensure_bounds=False)
+                eezybot.horizontalArm.rotate(arm_horizontal_angle, ensure_bounds=False, source="agent")
         except AngleTooBigException as e:
             rotation_successful = False
             rotation_state = 5
@@ -175,8 +181,9 @@ class AbstractEezybotEnv(gym.Env, ABC):
         assert self.action_space.contains(action), "%r (%s) invalid" % (action, type(action))
         rotation_successful, rotation_state = self._take_action(action)
         old_state = self.state
-        eezybot.wait_for_all()
-        self.state = get_state()
+        # the tracker expects the marble to move with the performed rotations
+        control = self.action_tuples[action] if rotation_successful else None
+        self.state, observation_wait = get_settled_state(eezybot, control=control)
         episode_over = self._is_episode_over(old_state, self.state, rotation_successful)
         action = action
         reward, d_reward, r_reward = resolve_rewards(old_state, self.state, rotation_successful)
@@ -194,7 +201,10 @@ class AbstractEezybotEnv(gym.Env, ABC):
                 self.r_reward_sum_this_episode += r_reward
                 self.step_count_this_episode += 1
 
-        return self.state + (rotation_state,), reward, episode_over, {}
+        # robot_time: seconds on the servo clock, simulated seconds if SERVO_CONTROLLER.SIMULATE_TIME
+        # observation_wait: seconds waited for the Servos to settle and a picture exposed afterwards
+        return self.state + (rotation_state,), reward, episode_over, {"robot_time": robot_time(),
+                                                                     "observation_wait": observation_wait}
 
     def reset(self):
         """Resets the state of the environment and returns an initial observation.
@@ -202,6 +212,7 @@ class AbstractEezybotEnv(gym.Env, ABC):
              observation (object): the initial observation.
          """
 
+        reset_tracking()
         if self.reset_position is None:
             eezybot.to_default().wait_for_all()
             self.state = self._search_marble()
@@ -209,8 +220,7 @@ class AbstractEezybotEnv(gym.Env, ABC):
             eezybot.base.rotate_to(self.reset_position)
             eezybot.verticalArm.to_default()
             eezybot.horizontalArm.to_default()
-            eezybot.wait_for_all()
-            self.state = get_state()
+            self.state, _ = get_settled_state(eezybot)
 
         if visualize and self.successful_episode:
             self.x_states.clear()
@@ -273,14 +283,14 @@ class AbstractEezybotEnv(gym.Env, ABC):
         return [seed]
 
     def _search_marble(self):
-        state = get_state()
+        state, _ = get_settled_state(eezybot)
         while state == (0, 0, 0):
             while state == (0, 0, 0) and eezybot.base.get_angle() < eezybot.base.max_degree - 20:
-                eezybot.base.rotate(40).wait()
-                state = get_state()
+                eezybot.base.rotate(40)
+                state, _ = get_settled_state(eezybot)
             while state == (0, 0, 0) and eezybot.base.get_angle() > eezybot.base.min_degree + 20:
-                eezybot.base.rotate(-40).wait()
-                state = get_state()
+                eezybot.base.rotate(-40)
+                state, _ = get_settled_state(eezybot)
         self.reset_position = eezybot.base.get_angle()
         return state
 
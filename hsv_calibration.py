@@ -0,0 +1,258 @@
+"""Calibration of the HSV bounds of Light.get_color_space() by sweeping candidate bounds over labeled frames"""
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from constants import IMAGE_PROCESSING
+from image_processing import CONTOURS, MarbleDetector
+
+SIZE = MarbleDetector.SIZE
+LABELS_FILE = "labels.json"
+
+
+class CalibrationResult:
+
+    def __init__(self, color_lower, color_upper, true_positives, false_positives, false_negatives,
+                 pixel_precision, pixel_recall):
+        """
+        :param true_positives: detected marbles matching a labeled one
+        :param false_positives: detected marbles matching none
+        :param false_negatives: labeled marbles not detected
+        :param pixel_precision: fraction of the masked pixels lying on a labeled marble
+        :param pixel_recall: fraction of the pixels of labeled marbles being masked
+        """
+        self.color_lower = color_lower
+        self.color_upper = color_upper
+        self.true_positives = true_positives
+        self.false_positives = false_positives
+        self.false_negatives = false_negatives
+        self.pixel_precision = pixel_precision
+        self.pixel_recall = pixel_recall
+
+    def precision(self):
+        return self.true_positives / max(self.true_positives + self.false_positives, 1)
+
+    def recall(self):
+        return self.true_positives / max(self.true_positives + self.false_negatives, 1)
+
+    def f1(self):
+        precision, recall = self.precision(), self.recall()
+        return 2 * precision * recall / max(precision + recall, 1e-9)
+
+    def __str__(self):
+        return "{} {}: precision {:.3f} recall {:.3f} f1 {:.3f} (pixels: precision {:.3f} recall {:.3f})".format(
+            self.color_lower, self.color_upper, self.precision(), self.recall(), self.f1(),
+            self.pixel_precision, self.pixel_recall)
+
+
+class LabeledFrames:
+
+    def __init__(self, directory, cache_directory=IMAGE_PROCESSING.CALIBRATION_CACHE):
+        """
+        Frames of a directory and the marbles labeled in its labels.json, e.g.
+            {"pitest.jpg": [[36, 217, 20], [287, 154, 20]]}
+        holding (x, y, radius) of every marble like image_processing.detect() returns them.
+
+        Every frame is resized and converted to HSV once and cached in a memory mapped file,
+        keyed by the names, sizes and modification times of the frames.
+        So is a mask of the labeled marbles of every frame
+
+        :param cache_directory: directory of the cached conversions, relative to this file
+        """
+        with open(os.path.join(directory, LABELS_FILE)) as f:
+            labels = json.load(f)
+        self.names = sorted(labels)
+        self.labels = [[tuple(marble) for marble in labels[name]] for name in self.names]
+        paths = [os.path.join(directory, name) for name in self.names]
+
+        key = hashlib.sha1(repr(
+            [(name, os.path.getsize(path), os.path.getmtime(path), labels[name]) for name, path in
+             zip(self.names, paths)] + [SIZE, IMAGE_PROCESSING.X_OFFSET]).encode()).hexdigest()[:16]
+        cache_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), cache_directory)
+        self.hsv_path = os.path.join(cache_directory, "hsv_{}.npy".format(key))
+        self.label_path = os.path.join(cache_directory, "labels_{}.npy".format(key))
+        if not (os.path.exists(self.hsv_path) and os.path.exists(self.label_path)):
+            os.makedirs(cache_directory, exist_ok=True)
+            self.__convert(paths)
+        self.hsv = np.load(self.hsv_path, mmap_mode="r")
+        self.label_masks = np.load(self.label_path, mmap_mode="r")
+
+    def __convert(self, paths):
+        hsv = np.lib.format.open_memmap(self.hsv_path + ".tmp.npy", "w+", np.uint8, (len(paths), SIZE, SIZE, 3))
+        label_masks = np.lib.format.open_memmap(self.label_path + ".tmp.npy", "w+", np.uint8,
+                                                (len(paths), SIZE, SIZE))
+        resized = np.empty((SIZE, SIZE, 3), dtype=np.uint8)
+        for i, path in enumerate(paths):
+            image = cv2.imread(path)
+            if image is None:
+                raise IOError("can not read {}".format(path))
+            cv2.cvtColor(cv2.resize(image, (SIZE, SIZE), dst=resized), cv2.COLOR_BGR2HSV, dst=hsv[i])
+            label_masks[i] = 0
+            for x, y, radius in self.labels[i]:
+                cv2.circle(label_masks[i], _to_pixels(x, y), int(radius), 255, -1)
+        hsv.flush()
+        label_masks.flush()
+        del hsv, label_masks
+        os.replace(self.hsv_path + ".tmp.npy", self.hsv_path)
+        os.replace(self.label_path + ".tmp.npy", self.label_path)
+
+    def __getstate__(self):
+        # sent to worker processes without the memory maps, mapped again by __setstate__
+        state = dict(self.__dict__)
+        del state["hsv"], state["label_masks"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.hsv = np.load(self.hsv_path, mmap_mode="r")
+        self.label_masks = np.load(self.label_path, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.names)
+
+
+def _to_pixels(x, y):
+    """
+    :return: position in the processed frame of the given output of image_processing.detect()
+    """
+    return int(x + 128 - IMAGE_PROCESSING.X_OFFSET), int(y + 127)
+
+
+def _matches(detected, labeled):
+    """
+    :return: number of detected marbles whose center lies within a labeled marble, each matched at most once
+    """
+    unmatched = list(labeled)
+    count = 0
+    for x, y, _ in detected:
+        for marble in unmatched:
+            if (x - marble[0]) ** 2 + (y - marble[1]) ** 2 <= marble[2] ** 2:
+                unmatched.remove(marble)
+                count += 1
+                break
+    return count
+
+
+# state of the worker process, set by _init_worker
+_frames = None
+_detector = None
+
+
+def _init_worker(frames):
+    global _frames, _detector
+    cv2.setNumThreads(1)
+    # the memory mapped frames are shared by every process through the page cache
+    _frames = frames
+    _detector = MarbleDetector((0, 0, 0), (0, 0, 0), backend=CONTOURS)
+
+
+def _evaluate(bounds):
+    """
+        runs in a worker process, detects the marbles of every frame with the given bounds
+    """
+    color_lower, color_upper = bounds
+    lower, upper = np.array(color_lower), np.array(color_upper)
+    mask = np.empty((SIZE, SIZE), dtype=np.uint8)
+    overlap = np.empty((SIZE, SIZE), dtype=np.uint8)
+    true_positives = false_positives = false_negatives = 0
+    masked_pixels = labeled_pixels = overlapping_pixels = 0
+    for i in range(len(_frames)):
+        cv2.inRange(_frames.hsv[i], lower, upper, dst=mask)
+        label_mask = _frames.label_masks[i]
+        cv2.bitwise_and(mask, label_mask, dst=overlap)
+        masked_pixels += cv2.countNonZero(mask)
+        labeled_pixels += cv2.countNonZero(label_mask)
+        overlapping_pixels += cv2.countNonZero(overlap)
+
+        circles = _detector._circles(mask, (0, 0, SIZE, SIZE))
+        labeled = [_to_pixels(x, y) + (radius,) for x, y, radius in _frames.labels[i]]
+        matched = _matches(circles, labeled)
+        true_positives += matched
+        false_positives += len(circles) - matched
+        false_negatives += len(labeled) - matched
+    return CalibrationResult(tuple(color_lower), tuple(color_upper), true_positives, false_positives, false_negatives,
+                             overlapping_pixels / max(masked_pixels, 1), overlapping_pixels / max(labeled_pixels, 1))
+
+
+def candidate_bounds(hue_lower=range(80, 125, 5), hue_upper=range(110, 180, 10), saturation_lower=range(0, 250, 25),
+                     value_lower=(0,), saturation_upper=(255,), value_upper=(255,)):
+    """
+    :return: list of every combination of the given values as (color_lower, color_upper),
+             leaving out the ones with a lower bound above the upper one
+    """
+    return [((h_low, s_low, v_low), (h_up, s_up, v_up))
+            for h_low, h_up, s_low, s_up, v_low, v_up in itertools.product(
+                hue_lower, hue_upper, saturation_lower, saturation_upper, value_lower, value_upper)
+            if h_low <= h_up and s_low <= s_up and v_low <= v_up]
+
+
+def sweep(frames, bounds, processes=None):
+    """
+        evaluates every candidate bounds on the labeled frames in a pool of processes
+
+    :param frames: LabeledFrames
+    :param bounds: list of (color_lower, color_upper), e.g. candidate_bounds()
+    :param processes: number of worker processes, every core if None
+    :return: list of CalibrationResults, best f1 first
+    """
+    with multiprocessing.Pool(processes, _init_worker, (frames,)) as pool:
+        results = pool.map(_evaluate, bounds, chunksize=max(len(bounds) // (4 * (processes or os.cpu_count())), 1))
+    return sorted(results, key=lambda result: (result.f1(), result.pixel_precision), reverse=True)
+
+
+def _range(text):
+    """
+    :param text: single value or start:stop:step, stop included
+    """
+    values = [int(value) for value in text.split(":")]
+    if len(values) == 1:
+        return values
+    start, stop, step = values if len(values) == 3 else values + [1]
+    return range(start, stop + 1, step)
+
+
+def _main(args):
+    processes = None
+    top = 10
+    directory = None
+    ranges = {}
+    options = {"-hue_lower": "hue_lower", "-hue_upper": "hue_upper", "-saturation_lower": "saturation_lower",
+               "-saturation_upper": "saturation_upper", "-value_lower": "value_lower", "-value_upper": "value_upper"}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '-processes' or arg == '-p':
+            i += 1
+            processes = int(args[i])
+        elif arg == '-top' or arg == '-t':
+            i += 1
+            top = int(args[i])
+        elif arg in options:
+            i += 1
+            ranges[options[arg]] = _range(args[i])
+        elif directory is None:
+            directory = arg
+        else:
+            raise ValueError("There is no argument {} for hsv_calibration.py".format(arg))
+        i += 1
+    if directory is None:
+        raise ValueError("usage: hsv_calibration.py <directory with labels.json> [-processes n] [-top n] "
+                         "[-hue_lower start:stop:step] [-hue_upper ...] [-saturation_lower ...] ...")
+
+    frames = LabeledFrames(directory)
+    bounds = candidate_bounds(**ranges)
+    print("{} bounds on {} frames".format(len(bounds), len(frames)))
+    for result in sweep(frames, bounds, processes)[:top]:
+        print(result)
+
+
+# called when executed directly
+if __name__ == '__main__':
+    _main(sys.argv[1:])
@@ -0,0 +1,98 @@
+"""Runs on the images/ fixtures: python hsv_calibration_test.py (or pytest)"""
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+from constants import Light
+from hsv_calibration import LABELS_FILE, SIZE, LabeledFrames, _to_pixels, candidate_bounds, sweep
+from image_processing import MarbleDetector
+
+COLOR_LOWER, COLOR_UPPER = Light(Light.Intensity.LOW).get_color_space()
+FIXTURES = ("marble2.png", "marble5.jpg", "pitest.jpg", "pitest2.jpg")
+
+
+def _labeled_directory():
+    """
+    :return: temporary directory of some fixtures labeled with the marbles detected in the LOW color space
+    """
+    directory = tempfile.mkdtemp()
+    detector = MarbleDetector(np.array(COLOR_LOWER), np.array(COLOR_UPPER))
+    labels = {}
+    for name in FIXTURES:
+        shutil.copy(os.path.join("images", name), directory)
+        labels[name] = [list(marble) for marble in detector.detect(cv2.imread(os.path.join("images", name)))]
+    with open(os.path.join(directory, LABELS_FILE), "w") as f:
+        json.dump(labels, f)
+    return directory
+
+
+def test_cached_frames():
+    directory = _labeled_directory()
+    cache_directory = tempfile.mkdtemp()
+    try:
+        frames = LabeledFrames(directory, cache_directory)
+        assert len(frames) == len(FIXTURES) and frames.names == sorted(FIXTURES)
+        assert os.path.dirname(frames.hsv_path) == cache_directory
+        assert isinstance(frames.hsv, np.memmap) and frames.hsv.shape == (len(FIXTURES), SIZE, SIZE, 3)
+        for i, name in enumerate(frames.names):
+            image = cv2.resize(cv2.imread(os.path.join(directory, name)), (SIZE, SIZE))
+            assert np.array_equal(frames.hsv[i], cv2.cvtColor(image, cv2.COLOR_BGR2HSV)), name
+            for x, y, _ in frames.labels[i]:
+                assert frames.label_masks[i][_to_pixels(x, y)[::-1]] == 255, name
+        assert sorted(os.listdir(cache_directory)) == sorted(
+            os.path.basename(path) for path in (frames.hsv_path, frames.label_path))
+
+        # converted once, mapped again by every further instance and after pickling
+        modified = os.path.getmtime(frames.hsv_path)
+        cached = LabeledFrames(directory, cache_directory)
+        assert cached.hsv_path == frames.hsv_path and os.path.getmtime(cached.hsv_path) == modified
+        unpickled = pickle.loads(pickle.dumps(cached))
+        assert isinstance(unpickled.hsv, np.memmap) and np.array_equal(unpickled.hsv, frames.hsv)
+
+        # a changed frame is converted again
+        os.utime(os.path.join(directory, FIXTURES[0]), (0, 0))
+        assert LabeledFrames(directory, cache_directory).hsv_path != frames.hsv_path
+    finally:
+        shutil.rmtree(directory)
+        shutil.rmtree(cache_directory)
+
+
+def test_candidate_bounds():
+    bounds = candidate_bounds(hue_lower=(100, 140), hue_upper=(120, 170), saturation_lower=(50,))
+    assert bounds == [((100, 50, 0), (120, 255, 255)), ((100, 50, 0), (170, 255, 255)),
+                      ((140, 50, 0), (170, 255, 255))]
+
+
+def test_sweep_finds_labeled_bounds():
+    directory = _labeled_directory()
+    cache_directory = tempfile.mkdtemp()
+    try:
+        frames = LabeledFrames(directory, cache_directory)
+        bounds = candidate_bounds(hue_lower=(80, 100, 120), hue_upper=(130, 170), saturation_lower=(0, 50, 150))
+        results = sweep(frames, bounds, processes=1)
+    finally:
+        shutil.rmtree(directory)
+        shutil.rmtree(cache_directory)
+    assert len(results) == len(bounds)
+    assert sorted((result.color_lower, result.color_upper) for result in results) == sorted(bounds)
+    f1 = [result.f1() for result in results]
+    assert f1 == sorted(f1, reverse=True)
+    # the bounds the labels were detected with find every labeled marble and nothing else
+    labeled = next(result for result in results if result.color_lower == (100, 50, 0) and
+                   result.color_upper == (170, 255, 255))
+    assert labeled.f1() == 1 and results[0].f1() == 1
+    assert labeled.true_positives == sum(len(marbles) for marbles in frames.labels) > 0
+    # the labels are the enclosing circles of the masked marbles, not every pixel of them is masked
+    assert labeled.pixel_precision > 0.9 and 0.5 < labeled.pixel_recall < 1
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
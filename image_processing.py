@@ -1,4 +1,4 @@
-import subprocess
+import ast
 import sys
 
 import cv2
@@ -8,62 +8,397 @@ from imutils import contours
 
 from constants import IMAGE_PROCESSING
 
+# backends of the MarbleDetector
+CONTOURS = "contours"
+COMPONENTS = "components"
 
-def _find_marbles(image, color_lower, color_upper):
-    if image.shape != (512, 512, 3):
-        image = cv2.resize(image, (512, 512))
 
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+class MarbleDetector:
+    # every frame is processed at this size
+    SIZE = 512
 
-    mask = cv2.inRange(hsv, color_lower, color_upper)
-    res = cv2.bitwise_and(image, image, mask=mask)
+    def __init__(self, color_lower, color_upper, debug=False, tracking=False, roi_scale=IMAGE_PROCESSING.ROI_SCALE,
+                 backend=IMAGE_PROCESSING.DETECTION_BACKEND, pyramid=False):
+        """
+        Finds marbles by their HSV color range. Owns a buffer for every stage, reused for every frame,
+        so detecting allocates nothing but the contours
 
-    res = cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
+        :param color_lower: lower HSV bound, e.g. Light.get_color_space()[0]
+        :param color_upper: upper HSV bound
+        :param debug: draws the detected marbles into overlay, a copy of the processed frame
+        :param tracking: processes a window around the biggest marble of the last frame first.
+                The full frame is only processed if no marble is found entirely inside the window,
+                so on a hit only the marbles inside the window are returned
+        :param roi_scale: half the size of the window in radii of the last detected marble
+        :param backend: CONTOURS finds every marble by the contours of the mask.
+                COMPONENTS labels the connected components of the mask and filters them by their bounding boxes
+                in one go, only the biggest marble is measured exactly and returned
+        :param pyramid: instead of processing the whole frame at SIZE, candidates are searched in a frame of
+                PYRAMID_SIZE and measured in crops of the original image around them.
+                Falls back to the whole frame if a marble reaches beyond its crop. Always finds every marble.
+                Only used for square frames bigger than SIZE, others are processed as a whole
+        """
+        if backend not in (CONTOURS, COMPONENTS):
+            raise ValueError("unknown detection backend {}".format(backend))
+        self.backend = backend
+        self.color_lower = np.array(color_lower)
+        self.color_upper = np.array(color_upper)
+        self.debug = debug
+        self.tracking = tracking
+        self.roi_scale = roi_scale
+        self.resized = np.empty((self.SIZE, self.SIZE, 3), dtype=np.uint8)
+        self.hsv = np.empty((self.SIZE, self.SIZE, 3), dtype=np.uint8)
+        self.mask = np.empty((self.SIZE, self.SIZE), dtype=np.uint8)
+        self.labels = np.empty((self.SIZE, self.SIZE), dtype=np.int32) if backend == COMPONENTS else None
+        self.pyramid = pyramid
+        if pyramid:
+            size = IMAGE_PROCESSING.PYRAMID_SIZE
+            self.coarse = np.empty((size, size, 3), dtype=np.uint8)
+            self.coarse_hsv = np.empty((size, size, 3), dtype=np.uint8)
+            self.coarse_mask = np.empty((size, size), dtype=np.uint8)
+            self.coarse_labels = np.empty((size, size), dtype=np.int32)
+            # crops of the original image, grown to the biggest image seen
+            self.crop_hsv = np.empty(0, dtype=np.uint8)
+            self.crop_mask = np.empty(0, dtype=np.uint8)
+        self.overlay = np.empty((self.SIZE, self.SIZE, 3), dtype=np.uint8) if debug else None
 
-    conts = cv2.findContours(res, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    conts = imutils.grab_contours(conts)
+        # (x, y, radius) of the biggest marble of the last frame in pixels of the processed frame
+        self.track = None
+        # Statistics
+        self.frames = 0
+        self.hits = 0
+        self.misses = 0
+        self.processed_pixels = 0
 
-    if len(conts) > 0:
-        conts = contours.sort_contours(conts)[0]
+    def detect(self, image, hint=None):
+        """
+        :param image: BGR image of any size, resized to SIZE x SIZE
+        :param hint: expected (x, y, radius) of the marble, e.g. predicted by a KalmanMarbleTracker.
+                The window around it is searched first like in tracking mode
+        :return: list of (x, y, radius) of every marble, sorted from left to right
+        """
+        original = image
+        # on smaller or non-square frames the measurement in the crops differs from the one of the resized frame
+        pyramid = self.pyramid and image.shape[0] == image.shape[1] > self.SIZE
+        if image.shape != self.resized.shape and not pyramid:
+            image = cv2.resize(image, (self.SIZE, self.SIZE), dst=self.resized)
+        self.frames += 1
 
-    detected_marbles = []
-    for cont in conts:
-        ((x, y), radius) = cv2.minEnclosingCircle(cont)
-        if radius < IMAGE_PROCESSING.MIN_RADIUS:
-            continue
-        x, y, radius = int(x - 128 + IMAGE_PROCESSING.X_OFFSET), int(y-127), int(radius)
-        cv2.circle(image, (x, y), 2, (0, 0, 255), -1)
-        cv2.circle(image, (x, y), radius, (255, 0, 0), 2)
-        detected_marbles.append((x, y, radius))
+        track = self.track if self.tracking else None
+        if hint is not None:
+            track = (hint[0] + 128 - IMAGE_PROCESSING.X_OFFSET, hint[1] + 127, hint[2])
+        window = None if track is None else self.__window(*track)
+        circles = None
+        if window is not None:
+            image = self.__resize(image)
+            circles = self._find_circles(image, window)
+            if circles:
+                self.hits += 1
+            else:
+                self.misses += 1
+                circles = None
+        elif track is not None:
+            # the hint lies outside of the frame
+            self.misses += 1
+        if circles is None and pyramid:
+            circles = self._pyramid_circles(original)
+        if circles is None:
+            image = self.__resize(image)
+            circles = self._find_circles(image, (0, 0, self.SIZE, self.SIZE))
+        self.track = max(circles, key=lambda circle: circle[2]) if circles else None
 
-    return detected_marbles
+        if self.debug:
+            np.copyto(self.overlay, self.__resize(image))
 
+        detected_marbles = []
+        for x, y, radius in circles:
+            x, y, radius = int(x - 128 + IMAGE_PROCESSING.X_OFFSET), int(y - 127), int(radius)
+            if self.debug:
+                cv2.circle(self.overlay, (x, y), 2, (0, 0, 255), -1)
+                cv2.circle(self.overlay, (x, y), radius, (255, 0, 0), 2)
+            detected_marbles.append((x, y, radius))
 
-def _main(color_lower, color_upper):
+        return detected_marbles
+
+    def __resize(self, image):
+        if image.shape != self.resized.shape:
+            return cv2.resize(image, (self.SIZE, self.SIZE), dst=self.resized)
+        return image
+
+    def __window(self, x, y, radius):
+        """
+        :return: (left, top, right, bottom) of the window around the given marble, inside of the frame.
+                 None if the window lies entirely outside of the frame
+        """
+        half_size = max(self.roi_scale * radius, 2 * IMAGE_PROCESSING.MIN_RADIUS)
+        left, top = max(int(x - half_size), 0), max(int(y - half_size), 0)
+        right, bottom = min(int(x + half_size) + 1, self.SIZE), min(int(y + half_size) + 1, self.SIZE)
+        if left >= right or top >= bottom:
+            return None
+        return left, top, right, bottom
+
+    def _find_circles(self, image, window):
+        """
+        :param image: BGR image of SIZE x SIZE
+        :param window: (left, top, right, bottom) part of the image to be processed
+        :return: list of (x, y, radius) of the marbles in the window sorted from left to right in pixels of the image.
+                 Empty if a marble touches a border of the window which is not a border of the image
+        """
+        left, top, right, bottom = window
+        width, height = right - left, bottom - top
+        self.processed_pixels += width * height
+        # contiguous part of the preallocated buffers
+        hsv = self.hsv.reshape(-1)[:width * height * 3].reshape(height, width, 3)
+        mask = self.mask.reshape(-1)[:width * height].reshape(height, width)
+
+        cv2.cvtColor(image[top:bottom, left:right], cv2.COLOR_BGR2HSV, dst=hsv)
+        cv2.inRange(hsv, self.color_lower, self.color_upper, dst=mask)
+        return self._circles(mask, window)
+
+    def _circles(self, mask, window):
+        """
+        :param mask: binary mask of the marble colors in the window
+        :param window: (left, top, right, bottom) part of the image the mask belongs to
+        :return: see _find_circles()
+        """
+        if self.backend == COMPONENTS:
+            return self._biggest_component(mask, window)
+        left, top, right, bottom = window
+        # the mask is not modified by findContours since OpenCV 3.2
+        conts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(left, top))
+        conts = imutils.grab_contours(conts)
+
+        if len(conts) > 0:
+            conts = contours.sort_contours(conts)[0]
+
+        circles = []
+        for cont in conts:
+            ((x, y), radius) = cv2.minEnclosingCircle(cont)
+            if radius < IMAGE_PROCESSING.MIN_RADIUS:
+                continue
+            cont_left, cont_top, cont_width, cont_height = cv2.boundingRect(cont)
+            if (cont_left == left > 0 or cont_top == top > 0 or cont_left + cont_width == right < self.SIZE
+                    or cont_top + cont_height == bottom < self.SIZE):
+                # cut by the window, the radius would be too small
+                return []
+            circles.append((x, y, radius))
+        return circles
+
+    def _pyramid_circles(self, image):
+        """
+        :param image: BGR image of any size
+        :return: list of (x, y, radius) of the marbles sorted from left to right in pixels of the SIZE x SIZE frame,
+                 None if a marble reaches beyond the crop it is measured in
+        """
+        size = IMAGE_PROCESSING.PYRAMID_SIZE
+        height, width = image.shape[:2]
+        # sampled rather than averaged, INTER_AREA would read every pixel and cost more than all other stages
+        cv2.resize(image, (size, size), dst=self.coarse, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(self.coarse, cv2.COLOR_BGR2HSV, dst=self.coarse_hsv)
+        cv2.inRange(self.coarse_hsv, self.color_lower, self.color_upper, dst=self.coarse_mask)
+        count, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+            self.coarse_mask, 8, cv2.CV_32S, cv2.CCL_GRANA, self.coarse_labels)
+        self.processed_pixels += size * size * self.SIZE * self.SIZE // (width * height)
+
+        # half the minimal radius: the border of small marbles gets lost in the coarse frame
+        stats = stats[1:count]
+        boxes = stats[np.hypot(stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]) / 2 >=
+                      IMAGE_PROCESSING.MIN_RADIUS * size / self.SIZE / 2]
+        # two coarse pixels of margin around every candidate, in pixels of the image
+        margin = 2
+        scale_x, scale_y = width / size, height / size
+        crops = np.stack((np.maximum(boxes[:, cv2.CC_STAT_LEFT] - margin, 0) * scale_x,
+                          np.maximum(boxes[:, cv2.CC_STAT_TOP] - margin, 0) * scale_y,
+                          np.minimum(boxes[:, cv2.CC_STAT_LEFT] + boxes[:, cv2.CC_STAT_WIDTH] + margin, size) * scale_x,
+                          np.minimum(boxes[:, cv2.CC_STAT_TOP] + boxes[:, cv2.CC_STAT_HEIGHT] + margin, size) * scale_y),
+                         axis=-1).astype(int).tolist()
+
+        if self.crop_mask.size < width * height:
+            self.crop_hsv = np.empty(width * height * 3, dtype=np.uint8)
+            self.crop_mask = np.empty(width * height, dtype=np.uint8)
+        # the processed frame is scaled by these
+        scale_x, scale_y = self.SIZE / width, self.SIZE / height
+        scale_radius = self.SIZE / np.sqrt(width * height)
+        circles = []
+        for left, top, right, bottom in _merge_rectangles(crops):
+            crop_width, crop_height = right - left, bottom - top
+            self.processed_pixels += crop_width * crop_height * self.SIZE * self.SIZE // (width * height)
+            hsv = self.crop_hsv[:crop_width * crop_height * 3].reshape(crop_height, crop_width, 3)
+            mask = self.crop_mask[:crop_width * crop_height].reshape(crop_height, crop_width)
+            cv2.cvtColor(image[top:bottom, left:right], cv2.COLOR_BGR2HSV, dst=hsv)
+            cv2.inRange(hsv, self.color_lower, self.color_upper, dst=mask)
+            conts = imutils.grab_contours(
+                cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(left, top)))
+            for cont in conts:
+                ((x, y), radius) = cv2.minEnclosingCircle(cont)
+                if radius * scale_radius < IMAGE_PROCESSING.MIN_RADIUS:
+                    continue
+                cont_left, cont_top, cont_width, cont_height = cv2.boundingRect(cont)
+                if (cont_left == left > 0 or cont_top == top > 0 or cont_left + cont_width == right < width
+                        or cont_top + cont_height == bottom < height):
+                    return None
+                # pixel centers are mapped onto each other
+                circles.append(((x + 0.5) * scale_x - 0.5, (y + 0.5) * scale_y - 0.5, radius * scale_radius))
+        return sorted(circles)
+
+    def _biggest_component(self, mask, window):
+        """
+        :return: list of (x, y, radius) of the biggest marble in the window in pixels of the image,
+                 empty if there is none or if a marble touches a border of the window which is not a border of the image
+        """
+        left, top, right, bottom = window
+        height, width = mask.shape
+        labels = self.labels.reshape(-1)[:width * height].reshape(height, width)
+        # the block based algorithm of Grana is several times faster than the default one on these masks
+        count, labels, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+            mask, 8, cv2.CV_32S, cv2.CCL_GRANA, labels)
+
+        stats = stats[1:count]
+        # the enclosing circle of a component lies between the half of its longer side and the half of its diagonal
+        upper_radii = np.hypot(stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]) / 2
+        candidates = np.flatnonzero(upper_radii >= IMAGE_PROCESSING.MIN_RADIUS)
+        # biggest upper bound first
+        candidates = candidates[np.argsort(-upper_radii[candidates], kind="stable")]
+
+        boxes = stats[candidates]
+        cut = np.zeros(len(candidates), dtype=bool)
+        if left > 0:
+            cut |= boxes[:, cv2.CC_STAT_LEFT] == 0
+        if top > 0:
+            cut |= boxes[:, cv2.CC_STAT_TOP] == 0
+        if right < self.SIZE:
+            cut |= boxes[:, cv2.CC_STAT_LEFT] + boxes[:, cv2.CC_STAT_WIDTH] == width
+        if bottom < self.SIZE:
+            cut |= boxes[:, cv2.CC_STAT_TOP] + boxes[:, cv2.CC_STAT_HEIGHT] == height
+
+        biggest = None
+        for i, candidate in enumerate(candidates):
+            if biggest is not None and upper_radii[candidate] < biggest[2] and not cut[i]:
+                # can not be bigger, measuring it is only needed to know whether the window cuts it
+                continue
+            x, y, radius = self.__enclosing_circle(labels, candidate + 1, boxes[i])
+            if radius < IMAGE_PROCESSING.MIN_RADIUS:
+                continue
+            if cut[i]:
+                # cut by the window, the radius would be too small
+                return []
+            if biggest is None or radius > biggest[2]:
+                biggest = (x + left, y + top, radius)
+        return [] if biggest is None else [biggest]
+
+    @staticmethod
+    def __enclosing_circle(labels, label, box):
+        """
+        :return: (x, y, radius) of the minimal enclosing circle of the given component
+        """
+        box_left, box_top = box[cv2.CC_STAT_LEFT], box[cv2.CC_STAT_TOP]
+        component = labels[box_top:box_top + box[cv2.CC_STAT_HEIGHT], box_left:box_left + box[cv2.CC_STAT_WIDTH]]
+        points = cv2.findNonZero((component == label).view(np.uint8))
+        ((x, y), radius) = cv2.minEnclosingCircle(points)
+        return x + box_left, y + box_top, radius
+
+    def reset_tracking(self):
+        self.track = None
+        return self
+
+    def statistics(self):
+        """
+        :return: dictionary of the frames, tracking hits and misses and
+                 the processed pixels relative to processing every frame entirely
+        """
+        return {
+            "frames": self.frames,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / max(self.hits + self.misses, 1),
+            "pixel_fraction": self.processed_pixels / max(self.frames * self.SIZE * self.SIZE, 1)
+        }
+
+
+def _merge_rectangles(rectangles):
+    """
+    :param rectangles: list of (left, top, right, bottom)
+    :return: list of rectangles covering the given ones, none of them overlapping
+    """
+    merged = []
+    for rectangle in rectangles:
+        left, top, right, bottom = rectangle
+        i = 0
+        while i < len(merged):
+            other = merged[i]
+            if left < other[2] and other[0] < right and top < other[3] and other[1] < bottom:
+                # merged again with the ones it overlaps now
+                left, top = min(left, other[0]), min(top, other[1])
+                right, bottom = max(right, other[2]), max(bottom, other[3])
+                del merged[i]
+                i = 0
+            else:
+                i += 1
+        merged.append((left, top, right, bottom))
+    return merged
+
+
+# MarbleDetectors by color range, created on first use
+_detectors = {}
+
+
+def _find_marbles(image, color_lower, color_upper, hint=None):
+    key = (tuple(np.asarray(color_lower).tolist()), tuple(np.asarray(color_upper).tolist()))
+    if key not in _detectors:
+        _detectors[key] = MarbleDetector(color_lower, color_upper, tracking=IMAGE_PROCESSING.ROI_TRACKING,
+                                         pyramid=IMAGE_PROCESSING.PYRAMID)
+    return _detectors[key].detect(image, hint)
+
+
+# DetectionWorker if IMAGE_PROCESSING.USE_DETECTION_WORKER, started on first use
+_worker = None
+
+
+def reset_tracking():
+    """
+        forgets the marbles tracked by the MarbleDetectors, of the detection worker as well
+    """
+    for detector in _detectors.values():
+        detector.reset_tracking()
+    if _worker is not None:
+        _worker.reset_tracking()
+
+
+def _take_image(after=None):
     if IMAGE_PROCESSING.USE_IMAGE_NOT_CAMERA:
-        image = cv2.imread('images/pitest.jpg')
-    else:
-        import raspi_camera
+        return cv2.imread('images/pitest.jpg')
+    import raspi_camera
+
+    return raspi_camera.take_picture(after=after)
 
-        image = raspi_camera.take_picture()
 
+def _main(color_lower, color_upper, after=None, hint=None):
+    image = _take_image(after)
     return {
         "shape": image.shape,
-        "marbles": _find_marbles(image, np.array(color_lower), np.array(color_upper))
+        "marbles": _find_marbles(image, np.array(color_lower), np.array(color_upper), hint)
     }
 
 
-def detect(color_lower, color_upper):
-    if IMAGE_PROCESSING.EXECUTE_IN_PYTHON2:
-        python = 'python2'
-        cmdLine = [python, 'image_processing.py', '"' + str(color_lower) + '"', '"' + str(color_upper) + '"']
-        completed_process = subprocess.run(cmdLine)
-        # parse list string to list object
-        print(completed_process.stdout)
-        return eval(completed_process.stdout)
-    return _main(color_lower, color_upper)
+def detect(color_lower, color_upper, after=None, hint=None):
+    """
+    :param after: time.monotonic() timestamp the picture has to be exposed after, None for the newest one
+    :param hint: expected (x, y, radius) of the marble, searched around first
+    """
+    if IMAGE_PROCESSING.USE_DETECTION_WORKER:
+        global _worker
+        from detection_worker import DetectionWorker
+
+        if _worker is None:
+            _worker = DetectionWorker()
+        image = _take_image(after)
+        return {
+            "shape": image.shape,
+            "marbles": _worker.detect(image, color_lower, color_upper, hint)
+        }
+    return _main(color_lower, color_upper, after, hint)
 
 
 # called when executed directly
 if __name__ == '__main__':
-    print(_main(eval(sys.argv[1]), eval(sys.argv[2])))
+    print(_main(ast.literal_eval(sys.argv[1]), ast.literal_eval(sys.argv[2])))
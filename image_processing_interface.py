@@ -1,12 +1,19 @@
+import time
+
 from constants import AI, IMAGE_PROCESSING
+from marble_tracker import KalmanMarbleTracker
 
 if not IMAGE_PROCESSING.USE_FAKE_IMAGE_PROCESSING:
-    from image_processing import detect
+    from image_processing import detect, reset_tracking as _reset_detectors
 else:  # debug
     import numpy as np
 
 
-    def detect(colorMin, colorMax):
+    def _reset_detectors():
+        pass
+
+
+    def detect(colorMin, colorMax, after=None, hint=None):
         return {
             "marbles": [
                 tuple([np.random.randint(50), np.random.randint(50), np.random.randint(90)])],
@@ -16,23 +23,87 @@ else:  # debug
 light_properties = AI.properties.light
 env_properties = AI.properties.env
 
+tracker = None
+if IMAGE_PROCESSING.KALMAN_TRACKING:
+    tracker = KalmanMarbleTracker(IMAGE_PROCESSING.MAX_DROPOUTS, control_matrix=IMAGE_PROCESSING.CONTROL_MATRIX)
+# height of the last picture, scales between detected pixels and states
+_shape = 1024
+
+
+def _to_state(marble):
+    scale = 2.0 / _shape
+    return tuple(
+        [env_properties.input_data_type(
+            (round(x * env_properties.input_grid_radius * scale + 1.0))) for x in marble])
+
+
+def _from_state(state):
+    scale = 2.0 / _shape
+    return tuple([(x - 1.0) / (env_properties.input_grid_radius * scale) for x in state])
+
 
-def get_state():
-    map = detect(*light_properties.get_color_space())
+def get_state(after=None, control=None):
+    """
+    :param after: time.monotonic() timestamp the picture has to be exposed after, None for the newest one
+    :param control: (base, vertical, horizontal) degrees rotated since the last state, used by the tracker
+    """
+    global _shape
+
+    hint = None
+    if tracker is not None:
+        prediction = tracker.predict(control)
+        if prediction is not None:
+            hint = _from_state(prediction)
+
+    map = detect(*light_properties.get_color_space(), after=after, hint=hint)
     marbles = map["marbles"]
+    _shape = map["shape"][0]
+
+    biggest = None
+    if marbles is not None and len(marbles) > 0:
+        biggest = marbles[0]
+        for i in range(len(marbles)):
+            if marbles[i][2] > biggest[2]:
+                biggest = marbles[i]
 
-    if marbles is None or len(marbles) == 0:
+    if tracker is not None:
+        # the tracker works on states, so it predicts the same way whatever the picture size is
+        estimate = tracker.update(None if biggest is None else _to_state(biggest))
+        if estimate is None:
+            return tuple([0, 0, 0])
+        return tuple([env_properties.input_data_type(round(x)) for x in estimate])
+
+    if biggest is None:
         return tuple([0, 0, 0])
+    return _to_state(biggest)
 
-    biggest = marbles[0]
-    for i in range(len(marbles)):
-        if marbles[i][2] > biggest[2]:
-            biggest = marbles[i]
 
-    scale = 2.0 / map["shape"][0]
-    return tuple(
-        [env_properties.input_data_type(
-            (round(x * env_properties.input_grid_radius * scale + 1.0))) for x in biggest])
+def reset_tracking():
+    """
+        forgets the tracked marble, e.g. after the arm moved it.
+        Resets the tracker and the regions of interest of the MarbleDetectors
+    """
+    if tracker is not None:
+        tracker.reset()
+    _reset_detectors()
+
+
+def get_settled_state(controller, settle_delay=IMAGE_PROCESSING.SETTLE_DELAY, control=None):
+    """
+        waits until every Servo of the controller performed its rotations and
+        returns the state of the first picture exposed settle_delay after their last write.
+        Pictures taken while the arm moves or is still shaking are skipped.
+        If the last write is older than settle_delay, the newest picture is taken without waiting
+
+    :param controller: ServoController moving the camera
+    :param control: see get_state()
+    :return: (state, seconds waited for the Servos and the picture)
+    """
+    start = time.monotonic()
+    controller.wait_for_all()
+    settled = controller.get_last_write_time() + settle_delay
+    state = get_state(after=None if settled <= time.monotonic() else settled, control=control)
+    return state, time.monotonic() - start
 
 
 if __name__ == '__main__':
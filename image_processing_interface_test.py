@@ -0,0 +1,82 @@
+"""Runs without a camera on the images/pitest.jpg fixture: python image_processing_interface_test.py (or pytest)"""
+import time
+from types import SimpleNamespace
+
+from constants import IMAGE_PROCESSING
+
+IMAGE_PROCESSING.USE_IMAGE_NOT_CAMERA = True
+IMAGE_PROCESSING.USE_DETECTION_WORKER = False
+
+# noinspection PyPep8
+import image_processing
+# noinspection PyPep8
+import image_processing_interface
+# noinspection PyPep8
+from marble_tracker import KalmanMarbleTracker
+
+
+def _untracked_state():
+    default_tracker = image_processing_interface.tracker
+    image_processing_interface.tracker = None
+    try:
+        return image_processing_interface.get_state()
+    finally:
+        image_processing_interface.tracker = default_tracker
+
+
+def test_get_state_tracks_marble():
+    expected = _untracked_state()
+    assert expected != (0, 0, 0)
+    default_tracker = image_processing_interface.tracker
+    tracker = image_processing_interface.tracker = KalmanMarbleTracker()
+    try:
+        # the marble does not move, neither does the estimate
+        for _ in range(3):
+            assert image_processing_interface.get_state() == expected
+        assert tracker.is_tracking()
+        detectors = list(image_processing._detectors.values())
+        assert detectors and all(detector.track is not None for detector in detectors)
+        image_processing_interface.reset_tracking()
+        assert not tracker.is_tracking()
+        # the regions of interest of the detectors are forgotten as well
+        assert all(detector.track is None for detector in detectors)
+    finally:
+        image_processing_interface.tracker = default_tracker
+
+
+def test_get_state_with_prediction_outside_of_frame():
+    expected = _untracked_state()
+    default_tracker = image_processing_interface.tracker
+    tracker = image_processing_interface.tracker = KalmanMarbleTracker()
+    try:
+        for prediction in ((600, 100, 20), (-300, 100, 20), (100, 500, 20)):
+            tracker.reset().update(image_processing_interface._to_state(prediction))
+            # the window around the prediction is empty, the marble is found in the full frame
+            assert image_processing_interface.get_state() != (0, 0, 0)
+            assert tracker.dropouts == 0
+            tracker.reset()
+            assert image_processing_interface.get_state() == expected
+    finally:
+        image_processing_interface.tracker = default_tracker
+
+
+def test_get_settled_state_waits_only_while_settling():
+    requested = []
+    default_get_state = image_processing_interface.get_state
+    image_processing_interface.get_state = lambda after=None, control=None: requested.append(after) or (1, 1, 1)
+    try:
+        # settled long ago the newest picture is taken, else the first one exposed after settling
+        for age, waits in ((1, False), (0, True)):
+            last_write = time.monotonic() - age
+            controller = SimpleNamespace(wait_for_all=lambda: None, get_last_write_time=lambda: last_write)
+            assert image_processing_interface.get_settled_state(controller, settle_delay=0.5)[0] == (1, 1, 1)
+            assert requested[-1] == (last_write + 0.5 if waits else None)
+    finally:
+        image_processing_interface.get_state = default_get_state
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
@@ -0,0 +1,142 @@
+"""Runs without a camera on the images/ fixtures: python image_processing_test.py (or pytest)
+Run directly, it also compares the time the backends and the pyramid mode need per frame"""
+import glob
+import os
+import time
+
+import cv2
+
+from constants import Light
+from image_processing import COMPONENTS, CONTOURS, MarbleDetector
+
+# the fixtures next to this file, wherever the tests are started from
+IMAGES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+IMAGES = sorted(glob.glob(os.path.join(IMAGES_DIRECTORY, "*")))
+assert IMAGES, "no images in {}".format(IMAGES_DIRECTORY)
+# size of the camera frames
+CAMERA_SIZE = 1024
+COLOR_SPACES = [Light(intensity).get_color_space() for intensity in Light.Intensity]
+
+
+def _biggest(marbles):
+    """
+    :return: radius of the biggest marbles and their positions
+    """
+    if not marbles:
+        return None, set()
+    radius = max(marble[2] for marble in marbles)
+    return radius, {marble[:2] for marble in marbles if marble[2] == radius}
+
+
+def test_components_backend_finds_biggest_marble():
+    for color_lower, color_upper in COLOR_SPACES:
+        contours = MarbleDetector(color_lower, color_upper, backend=CONTOURS)
+        components = MarbleDetector(color_lower, color_upper, backend=COMPONENTS)
+        for path in IMAGES:
+            image = cv2.imread(path)
+            radius, positions = _biggest(contours.detect(image))
+            marbles = components.detect(image)
+            assert len(marbles) <= 1, path
+            assert _biggest(marbles)[0] == radius, path
+            assert not marbles or marbles[0][:2] in positions, path
+
+
+def test_components_backend_tracks_like_contours():
+    for color_lower, color_upper in COLOR_SPACES:
+        contours = MarbleDetector(color_lower, color_upper, tracking=True, backend=CONTOURS)
+        components = MarbleDetector(color_lower, color_upper, tracking=True, backend=COMPONENTS)
+        for path in IMAGES:
+            image = cv2.imread(path)
+            # the second frame is searched in the window around the first one
+            for _ in range(2):
+                radius, _ = _biggest(contours.detect(image))
+                assert _biggest(components.detect(image))[0] == radius, path
+        assert components.hits == contours.hits and components.misses == contours.misses
+
+
+def test_hint_outside_of_frame():
+    for color_lower, color_upper in COLOR_SPACES:
+        full_frame = MarbleDetector(color_lower, color_upper)
+        for path in IMAGES:
+            image = cv2.imread(path)
+            expected = full_frame.detect(image)
+            for backend in (CONTOURS, COMPONENTS):
+                detector = MarbleDetector(color_lower, color_upper, backend=backend)
+                # the window around the hint is empty, the full frame is searched instead
+                for hint in ((600, 100, 20), (-300, 100, 20), (100, 500, 20), (100, -400, 20)):
+                    marbles = detector.detect(image, hint)
+                    assert _biggest(marbles)[0] == _biggest(expected)[0], (path, hint)
+                    assert backend == COMPONENTS or marbles == expected, (path, hint)
+                assert detector.misses == 4 and detector.hits == 0
+
+
+def _camera_frames():
+    """
+    :return: the square fixtures scaled to the size of the camera frames
+    """
+    images = [cv2.imread(path) for path in IMAGES]
+    return [cv2.resize(image, (CAMERA_SIZE, CAMERA_SIZE)) for image in images if image.shape[0] == image.shape[1]]
+
+
+def test_pyramid_measures_like_full_frame():
+    for color_lower, color_upper in COLOR_SPACES:
+        full_frame = MarbleDetector(color_lower, color_upper)
+        pyramid = MarbleDetector(color_lower, color_upper, pyramid=True)
+        for image in _camera_frames():
+            expected = full_frame.detect(image)
+            marbles = pyramid.detect(image)
+            assert len(marbles) == len(expected)
+            for marble, expected_marble in zip(marbles, expected):
+                assert max(abs(a - b) for a, b in zip(marble, expected_marble)) <= 2, (marble, expected_marble)
+
+
+def test_pyramid_skips_small_and_non_square_frames():
+    for color_lower, color_upper in COLOR_SPACES:
+        full_frame = MarbleDetector(color_lower, color_upper)
+        pyramid = MarbleDetector(color_lower, color_upper, pyramid=True)
+        for path in IMAGES:
+            image = cv2.imread(path)
+            height, width = image.shape[:2]
+            if height == width > MarbleDetector.SIZE:
+                continue
+            # e.g. marble1.png of 400 x 265 and the 256 x 256 fixtures, processed as a whole
+            pixels = pyramid.processed_pixels
+            assert pyramid.detect(image) == full_frame.detect(image), path
+            assert pyramid.processed_pixels - pixels == MarbleDetector.SIZE * MarbleDetector.SIZE, path
+
+
+def compare_backends(repeats=50):
+    color_lower, color_upper = Light(Light.Intensity.LOW).get_color_space()
+    images = [cv2.resize(cv2.imread(path), (MarbleDetector.SIZE, MarbleDetector.SIZE)) for path in IMAGES]
+    for backend in (CONTOURS, COMPONENTS):
+        detector = MarbleDetector(color_lower, color_upper, backend=backend)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for image in images:
+                detector.detect(image)
+        duration = (time.perf_counter() - start) / (repeats * len(images))
+        print("{}: {:.3f} ms per frame".format(backend, duration * 1000))
+
+
+def compare_pyramid(repeats=50):
+    color_lower, color_upper = Light(Light.Intensity.LOW).get_color_space()
+    images = _camera_frames()
+    for pyramid in (False, True):
+        detector = MarbleDetector(color_lower, color_upper, pyramid=pyramid)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for image in images:
+                detector.detect(image)
+        duration = (time.perf_counter() - start) / (repeats * len(images))
+        print("{}: {:.3f} ms per {} x {} frame, {:.0%} of the pixels processed".format(
+            "pyramid" if pyramid else "full frame", duration * 1000, CAMERA_SIZE, CAMERA_SIZE,
+            detector.statistics()["pixel_fraction"]))
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
+    compare_backends()
+    compare_pyramid()
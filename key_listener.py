@@ -1,7 +1,21 @@
+import atexit
+import codecs
+import os
+import select
 import sys
 import threading
 import time
 
+try:
+    import termios
+except ImportError:
+    # not available on Windows, keys are read line buffered there
+    termios = None
+
+# seconds between two checks of the while_func while no key is pressed
+_POLL_TIME = 0.1
+_ESCAPE = "\x1b"
+
 
 class KeyListener:
 
@@ -9,26 +23,152 @@ class KeyListener:
     def always_true():
         return True
 
-    def __init__(self, dictionary, update_time, while_func=always_true):
+    def __init__(self, dictionary, update_time, while_func=always_true, input_file=None):
         """
 
-            calls given function when corresponding key is entered on console
+            calls given function when corresponding key is entered on console.
+            The terminal is switched to non canonical mode without echo while listening, so every key press is
+            handled at once without pressing Enter. Its settings are restored when the listener stops,
+            also if the program exits while listening
 
         :param dictionary:  a python dictionary containing Tuples with a function and args as values
                             Bsp:    {"key":(func, arg1, arg2...),
                                     "key2":(func2, arg1, arg2...)}
-        :param update_time: time between reads
-        :param while_func:  function returning a boolean, stopping the  key checking Thread if True
+                            escape sequences of special keys are single keys, e.g. "\x1b[A" for arrow up
+        :param update_time: minimal time between two calls of the same key.
+                            repeated presses of a held key coming in faster are dropped instead of piling up
+        :param while_func:  function returning a boolean, stopping the  key checking Thread if False
                             default function returns always True
+        :param input_file:  file the keys are read from, sys.stdin if None. e.g. PseudoTerminal().slave
+        """
+        self.dictionary = dictionary
+        self.update_time = update_time
+        self.while_func = while_func
+        self.input_file = sys.stdin if input_file is None else input_file
+        self.__stop = False
+        self.__last_calls = {}
+        self.__terminal_settings = None
+        self.__thread = threading.Thread(target=self.__check_keys, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+            stops the key checking Thread, restoring the terminal
+        """
+        self.__stop = True
+        return self
+
+    def join(self, timeout=None):
+        self.__thread.join(timeout)
+        return self
+
+    def is_running(self):
+        return self.__thread.is_alive()
+
+    def __check_keys(self):
+        fd = self.input_file.fileno()
+        self.__enter_raw_mode(fd)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        pending = ""
+        try:
+            while not self.__stop and self.while_func():
+                readable, _, _ = select.select([fd], [], [], _POLL_TIME)
+                if not readable:
+                    continue
+                data = os.read(fd, 1024)
+                if not data:
+                    # end of file
+                    break
+                pending += decoder.decode(data)
+                pending = self.__dispatch(pending)
+        finally:
+            self.__restore(fd)
+
+    def __dispatch(self, text):
+        """
+            calls the functions of every complete key in the given text
+
+        :return: the start of an escape sequence not yet read completely
         """
+        i = 0
+        while i < len(text):
+            key = text[i]
+            if key == _ESCAPE and i + 1 < len(text) and text[i + 1] in "[O":
+                # escape sequence: ESC [ or ESC O, parameters and a final letter or ~
+                end = i + 2
+                while end < len(text) and not (text[end].isalpha() or text[end] == "~"):
+                    end += 1
+                if end == len(text):
+                    return text[i:]
+                key = text[i:end + 1]
+            elif key == _ESCAPE and i + 1 == len(text):
+                return text[i:]
+            i += len(key)
+            self.__call(key)
+        return ""
 
-        def _check_key():
-            while while_func():
-                input_key = sys.stdin.read(1)
+    def __call(self, key):
+        func_tuple = self.dictionary.get(key)
+        if func_tuple is None:
+            return
+        now = time.monotonic()
+        if now - self.__last_calls.get(key, -self.update_time) < self.update_time:
+            return
+        self.__last_calls[key] = now
+        func_tuple[0](*func_tuple[1:])
 
-                for key, funcTuple in dictionary.items():
-                    if input_key is key:
-                        funcTuple[0](*tuple(list(funcTuple)[1:]))
-                time.sleep(update_time)
+    def __enter_raw_mode(self, fd):
+        if termios is None or not os.isatty(fd):
+            return
+        self.__terminal_settings = termios.tcgetattr(fd)
+        settings = termios.tcgetattr(fd)
+        # keep ISIG, Ctrl+C still interrupts the program
+        settings[3] &= ~(termios.ICANON | termios.ECHO)
+        settings[6][termios.VMIN] = 1
+        settings[6][termios.VTIME] = 0
+        termios.tcsetattr(fd, termios.TCSANOW, settings)
+        # daemon Threads are killed on exit without running finally blocks
+        atexit.register(self.__restore, fd)
+
+    def __restore(self, fd):
+        if self.__terminal_settings is None:
+            return
+        atexit.unregister(self.__restore)
+        try:
+            termios.tcsetattr(fd, termios.TCSADRAIN, self.__terminal_settings)
+        except termios.error:
+            # the terminal is already closed
+            pass
+        self.__terminal_settings = None
+
+
+class PseudoTerminal:
+
+    def __init__(self):
+        """
+        Stand-in for the console to drive a KeyListener without a terminal, e.g. in tests:
+            terminal = PseudoTerminal()
+            KeyListener(dictionary, 0, input_file=terminal.slave)
+            terminal.press("q")
+        """
+        if termios is None:
+            raise OSError("pseudo terminals are not supported on this platform")
+        self.__master, slave = os.openpty()
+        self.slave = os.fdopen(slave, "rb", buffering=0)
+
+    def press(self, keys):
+        """
+            types the given keys, as if they were pressed one after another
+        """
+        os.write(self.__master, keys.encode("utf-8"))
+        return self
+
+    def is_raw(self):
+        """
+            True while a KeyListener switched the terminal to non canonical mode
+        """
+        return not termios.tcgetattr(self.slave.fileno())[3] & termios.ICANON
 
-        threading.Thread(target=_check_key, daemon=True).start()
+    def close(self):
+        self.slave.close()
+        os.close(self.__master)
@@ -0,0 +1,56 @@
+"""Runs headless on a pseudo terminal: python key_listener_test.py (or pytest)"""
+import time
+
+from key_listener import KeyListener, PseudoTerminal
+
+
+def _wait_for(condition, timeout=1.0):
+    end_time = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end_time:
+        time.sleep(0.001)
+    return condition()
+
+
+def test_keys_without_enter():
+    terminal = PseudoTerminal()
+    pressed = []
+    listener = KeyListener({"q": (pressed.append, "q"), "a": (pressed.append, "a"),
+                            "\x1b[A": (pressed.append, "up")}, 0, input_file=terminal.slave)
+    assert _wait_for(terminal.is_raw)
+    terminal.press("q")
+    assert _wait_for(lambda: pressed == ["q"])
+    terminal.press("ax\x1b[A")
+    assert _wait_for(lambda: pressed == ["q", "a", "up"]), pressed
+    listener.stop().join(1)
+    assert not listener.is_running()
+    assert not terminal.is_raw()
+    terminal.close()
+
+
+def test_key_repeat_dropped():
+    terminal = PseudoTerminal()
+    pressed = []
+    listener = KeyListener({"q": (pressed.append, "q")}, 0.5, input_file=terminal.slave)
+    terminal.press("qqqq")
+    assert _wait_for(lambda: pressed == ["q"])
+    time.sleep(0.05)
+    assert pressed == ["q"]
+    listener.stop().join(1)
+    terminal.close()
+
+
+def test_while_func_stops_listener():
+    terminal = PseudoTerminal()
+    running = [True]
+    listener = KeyListener({}, 0, while_func=lambda: running[0], input_file=terminal.slave)
+    running[0] = False
+    assert _wait_for(lambda: not listener.is_running())
+    assert not terminal.is_raw()
+    terminal.close()
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
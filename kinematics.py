@@ -0,0 +1,211 @@
+"""Kinematics of the EEZYbotARM: servo angles to the position of the clutch and back"""
+
+import hashlib
+import math
+import os
+
+import numpy
+
+from constants import EEZYBOT_CONTROLLER as EEZYBOT
+
+GEOMETRY = EEZYBOT.KINEMATICS
+
+
+def _angles(servo, resolution):
+    """
+    :return: angles from servo.MIN to servo.MAX (both included) in steps of resolution degrees
+    """
+    return numpy.append(numpy.arange(servo.MIN, servo.MAX, resolution), servo.MAX).astype(numpy.float64)
+
+
+def planar_forward(vertical_angle, horizontal_angle):
+    """
+        position of the clutch in the plane of the arm. Vectorized, the angles may be numpy arrays of any shape
+
+    :return: (reach, height) in millimeters, reach measured from the axis of the base
+    """
+    lower = numpy.radians(GEOMETRY.LOWER_ARM_ZERO + GEOMETRY.LOWER_ARM_DIRECTION * numpy.asarray(vertical_angle))
+    upper = numpy.radians(GEOMETRY.UPPER_ARM_ZERO + GEOMETRY.UPPER_ARM_DIRECTION * numpy.asarray(horizontal_angle))
+    reach = GEOMETRY.LOWER_ARM * numpy.cos(lower) + GEOMETRY.UPPER_ARM * numpy.cos(upper) + GEOMETRY.CLUTCH_OFFSET
+    height = GEOMETRY.BASE_HEIGHT + GEOMETRY.LOWER_ARM * numpy.sin(lower) + GEOMETRY.UPPER_ARM * numpy.sin(upper)
+    return reach, height
+
+
+def forward(base_angle, vertical_angle, horizontal_angle):
+    """
+        position of the clutch. Vectorized, the angles may be numpy arrays broadcasting against each other
+
+    :return: array of shape (..., 3) holding x, y, z in millimeters.
+             The origin lies on the ground below the base, x points along base angle 0
+    """
+    reach, height = planar_forward(vertical_angle, horizontal_angle)
+    base = numpy.radians(numpy.asarray(base_angle))
+    return numpy.stack(numpy.broadcast_arrays(reach * numpy.cos(base), reach * numpy.sin(base), height), axis=-1)
+
+
+def workspace(resolution=1.0):
+    """
+        forward kinematics over the whole grid of servo angles between MIN and MAX of each Servo
+
+    :return: (base_angles, vertical_angles, horizontal_angles, positions),
+             positions has the shape (len(base_angles), len(vertical_angles), len(horizontal_angles), 3)
+    """
+    base = _angles(EEZYBOT.BASE, resolution)
+    vertical = _angles(EEZYBOT.VERTICAL, resolution)
+    horizontal = _angles(EEZYBOT.HORIZONTAL, resolution)
+    positions = forward(base[:, None, None], vertical[None, :, None], horizontal[None, None, :])
+    return base, vertical, horizontal, positions
+
+
+class InverseKinematicsTable:
+
+    def __init__(self, resolution=GEOMETRY.TABLE_RESOLUTION, cache_directory=GEOMETRY.CACHE_DIRECTORY):
+        """
+        Nearest neighbour inverse kinematics over the precomputed positions of every vertical/horizontal angle pair.
+        The arm is symmetric around the axis of the base, so the base angle is solved exactly and
+        the table only covers the plane of the arm. Positions are bucketed into a grid of cells,
+        a lookup only compares the entries of the 3x3 cells around the requested position.
+
+        The table is cached on disk, keyed by geometry, servo limits and resolution
+
+        :param resolution: degrees between two entries of the table
+        :param cache_directory: directory of the cached tables, relative to this file. None disables the cache
+        """
+        self.resolution = resolution
+        # an upper bound of the distance between neighbouring entries
+        self.cell_size = 2 * (GEOMETRY.LOWER_ARM + GEOMETRY.UPPER_ARM) * math.radians(resolution)
+        self.path = None
+        if cache_directory is not None:
+            self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), cache_directory,
+                                     "ik_table_{}.npz".format(self.__key()))
+        if not self.__load():
+            self.__build()
+            self.__save()
+
+    def __key(self):
+        parameters = (self.resolution,
+                      GEOMETRY.BASE_HEIGHT, GEOMETRY.LOWER_ARM, GEOMETRY.UPPER_ARM, GEOMETRY.CLUTCH_OFFSET,
+                      GEOMETRY.LOWER_ARM_ZERO, GEOMETRY.LOWER_ARM_DIRECTION,
+                      GEOMETRY.UPPER_ARM_ZERO, GEOMETRY.UPPER_ARM_DIRECTION,
+                      EEZYBOT.VERTICAL.MIN, EEZYBOT.VERTICAL.MAX, EEZYBOT.HORIZONTAL.MIN, EEZYBOT.HORIZONTAL.MAX)
+        return hashlib.sha1(repr(parameters).encode()).hexdigest()[:16]
+
+    def __build(self):
+        vertical, horizontal = numpy.meshgrid(_angles(EEZYBOT.VERTICAL, self.resolution),
+                                              _angles(EEZYBOT.HORIZONTAL, self.resolution), indexing="ij")
+        vertical, horizontal = vertical.ravel(), horizontal.ravel()
+        points = numpy.stack(planar_forward(vertical, horizontal), axis=-1)
+
+        self.origin = points.min(axis=0)
+        self.shape = tuple(((points.max(axis=0) - self.origin) // self.cell_size).astype(int) + 1)
+        cells = self.__cell_keys(points)
+        order = numpy.argsort(cells, kind="stable")
+        self.angles = numpy.stack((vertical, horizontal), axis=-1)[order]
+        self.points = points[order]
+        # entries of cell k are self.points[self.cell_starts[k]:self.cell_starts[k + 1]]
+        self.cell_starts = numpy.searchsorted(cells[order], numpy.arange(self.shape[0] * self.shape[1] + 1))
+
+    def __cell_keys(self, points):
+        cells = ((points - self.origin) // self.cell_size).astype(int)
+        return cells[:, 0] * self.shape[1] + cells[:, 1]
+
+    def __load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        try:
+            with numpy.load(self.path) as data:
+                self.origin = data["origin"]
+                self.shape = tuple(data["shape"])
+                self.angles = data["angles"]
+                self.points = data["points"]
+                self.cell_starts = data["cell_starts"]
+        except (OSError, KeyError, ValueError):
+            # unreadable cache, rebuilt and overwritten
+            return False
+        return True
+
+    def __save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path = self.path + ".tmp.npz"
+        numpy.savez(temporary_path, origin=self.origin, shape=numpy.array(self.shape), angles=self.angles,
+                    points=self.points, cell_starts=self.cell_starts)
+        os.replace(temporary_path, self.path)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _nearest(self, reach, height):
+        """
+        :return: (index, distance) of the table entry nearest to the given position in the plane of the arm
+        """
+        column = int((reach - self.origin[0]) // self.cell_size)
+        row = int((height - self.origin[1]) // self.cell_size)
+        best, best_distance = -1, math.inf
+        if 0 <= row + 1 and row - 1 < self.shape[1]:
+            first_row, last_row = max(row - 1, 0), min(row + 1, self.shape[1] - 1)
+            for cell_column in range(max(column - 1, 0), min(column + 2, self.shape[0])):
+                # the rows of one column are consecutive cells
+                start = self.cell_starts[cell_column * self.shape[1] + first_row]
+                end = self.cell_starts[cell_column * self.shape[1] + last_row + 1]
+                if end > start:
+                    points = self.points[start:end]
+                    distances = numpy.hypot(points[:, 0] - reach, points[:, 1] - height)
+                    index = int(numpy.argmin(distances))
+                    if distances[index] < best_distance:
+                        best, best_distance = start + index, float(distances[index])
+        # anything outside of the searched cells is at least cell_size away
+        if best_distance <= self.cell_size:
+            return best, best_distance
+        # outside of the workspace, compare every entry
+        distances = numpy.hypot(self.points[:, 0] - reach, self.points[:, 1] - height)
+        best = int(numpy.argmin(distances))
+        return best, float(distances[best])
+
+    def lookup(self, x, y, z):
+        """
+        :return: (base_angle, vertical_angle, horizontal_angle, error) of the reachable position nearest to
+                 the given one, error being the distance between both in millimeters
+        """
+        base_angle = math.degrees(math.atan2(y, x))
+        reach = math.hypot(x, y)
+        if not EEZYBOT.BASE.MIN <= base_angle <= EEZYBOT.BASE.MAX:
+            # reach over the axis of the base, the arm leans backwards
+            base_angle = base_angle + 180 if base_angle < 0 else base_angle - 180
+            reach = -reach
+        base_angle = min(max(base_angle, EEZYBOT.BASE.MIN), EEZYBOT.BASE.MAX)
+        index, _ = self._nearest(reach, z)
+        vertical_angle, horizontal_angle = self.angles[index].tolist()
+        table_reach, table_height = self.points[index].tolist()
+        base = math.radians(base_angle)
+        error = math.sqrt((table_reach * math.cos(base) - x) ** 2 + (table_reach * math.sin(base) - y) ** 2 +
+                          (table_height - z) ** 2)
+        return base_angle, vertical_angle, horizontal_angle, error
+
+    def lookup_many(self, points):
+        """
+        :param points: iterable of (x, y, z) positions
+        :return: array of shape (len(points), 4) holding the results of lookup()
+        """
+        return numpy.array([self.lookup(*point) for point in points], dtype=numpy.float64).reshape(-1, 4)
+
+
+_table = None
+
+
+def inverse_kinematics_table():
+    """
+    :return: the InverseKinematicsTable shared by every caller, loaded or built on first use
+    """
+    global _table
+    if _table is None:
+        _table = InverseKinematicsTable()
+    return _table
+
+
+def inverse(x, y, z):
+    """
+        see InverseKinematicsTable.lookup()
+    """
+    return inverse_kinematics_table().lookup(x, y, z)
@@ -0,0 +1,88 @@
+"""Runs without the arm: python kinematics_test.py (or pytest)"""
+import os
+import shutil
+import tempfile
+
+import numpy
+
+import kinematics
+from constants import EEZYBOT_CONTROLLER as EEZYBOT
+from kinematics import InverseKinematicsTable, forward
+
+# degrees between the entries of the tables built by the tests, coarser than the default to build fast
+RESOLUTION = 2.0
+
+
+def _random_angles(count, seed=0):
+    random = numpy.random.RandomState(seed)
+    return [(random.uniform(EEZYBOT.BASE.MIN, EEZYBOT.BASE.MAX),
+             random.uniform(EEZYBOT.VERTICAL.MIN, EEZYBOT.VERTICAL.MAX),
+             random.uniform(EEZYBOT.HORIZONTAL.MIN, EEZYBOT.HORIZONTAL.MAX)) for _ in range(count)]
+
+
+def test_forward_is_vectorized():
+    angles = numpy.array(_random_angles(20))
+    positions = forward(angles[:, 0], angles[:, 1], angles[:, 2])
+    assert positions.shape == (20, 3)
+    for position, (base_angle, vertical_angle, horizontal_angle) in zip(positions, angles):
+        assert numpy.allclose(position, forward(base_angle, vertical_angle, horizontal_angle))
+
+
+def test_inverse_round_trip():
+    table = kinematics.inverse_kinematics_table()
+    for angles in _random_angles(200):
+        position = forward(*angles)
+        base_angle, vertical_angle, horizontal_angle, error = table.lookup(*position)
+        # every reachable position lies within half a cell of an entry of the table
+        assert error <= table.cell_size / 2, (angles, error)
+        assert EEZYBOT.BASE.MIN <= base_angle <= EEZYBOT.BASE.MAX
+        assert EEZYBOT.VERTICAL.MIN <= vertical_angle <= EEZYBOT.VERTICAL.MAX
+        assert EEZYBOT.HORIZONTAL.MIN <= horizontal_angle <= EEZYBOT.HORIZONTAL.MAX
+        reached = forward(base_angle, vertical_angle, horizontal_angle)
+        assert abs(numpy.linalg.norm(reached - position) - error) < 1e-6
+
+
+def test_inverse_of_unreachable_position():
+    _, _, _, error = kinematics.inverse(1000, 0, 0)
+    assert error > 500
+
+
+def test_table_cache():
+    directory = tempfile.mkdtemp()
+    try:
+        built = InverseKinematicsTable(RESOLUTION, cache_directory=directory)
+        assert os.path.exists(built.path) and os.path.dirname(built.path) == directory
+        modified = os.path.getmtime(built.path)
+
+        loaded = InverseKinematicsTable(RESOLUTION, cache_directory=directory)
+        assert loaded.path == built.path and os.path.getmtime(loaded.path) == modified
+        assert loaded.shape == built.shape and len(loaded) == len(built)
+        for name in ("origin", "angles", "points", "cell_starts"):
+            assert numpy.array_equal(getattr(loaded, name), getattr(built, name)), name
+        position = forward(30, 100, 80)
+        assert loaded.lookup(*position) == built.lookup(*position)
+
+        # another resolution is cached separately
+        assert InverseKinematicsTable(RESOLUTION * 2, cache_directory=directory).path != built.path
+
+        # an unreadable cache is rebuilt and overwritten
+        with open(built.path, "wb") as f:
+            f.write(b"broken")
+        rebuilt = InverseKinematicsTable(RESOLUTION, cache_directory=directory)
+        assert numpy.array_equal(rebuilt.points, built.points)
+        assert InverseKinematicsTable(RESOLUTION, cache_directory=directory).shape == built.shape
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_table_without_cache():
+    table = InverseKinematicsTable(RESOLUTION, cache_directory=None)
+    assert table.path is None
+    assert table.lookup(*forward(30, 100, 80))[3] <= table.cell_size / 2
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
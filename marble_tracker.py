@@ -0,0 +1,98 @@
+"""Kalman Filter tracking the marble through dropped detections"""
+
+import numpy as np
+
+
+class KalmanMarbleTracker:
+
+    def __init__(self, max_dropouts=3, process_noise=4.0, measurement_noise=9.0, control_matrix=None):
+        """
+        Constant velocity Kalman Filter of the marble state (x, y, radius), one time step per observation.
+        Predicts through up to max_dropouts missed detections in a row before losing the marble
+
+        :param max_dropouts: missed detections in a row predicted through
+        :param process_noise: variance of the change of velocity per step
+        :param measurement_noise: variance of a detection
+        :param control_matrix: 3 x n matrix mapping the commanded joint deltas (e.g. base, vertical, horizontal)
+                               to the expected change of (x, y, radius). None ignores the arm motion
+        """
+        self.max_dropouts = max_dropouts
+        self.control_matrix = None if control_matrix is None else np.asarray(control_matrix, dtype=np.float64)
+
+        # state: x, y, radius and their velocities
+        self.transition = np.eye(6)
+        self.transition[:3, 3:] = np.eye(3)
+        self.observation = np.eye(3, 6)
+        # velocities change randomly, positions through them
+        self.process_covariance = process_noise * np.diag([0.25, 0.25, 0.25, 1.0, 1.0, 1.0])
+        self.measurement_covariance = measurement_noise * np.eye(3)
+
+        self.state = None
+        self.covariance = None
+        self.dropouts = 0
+
+    def reset(self):
+        """
+            forgets the marble, e.g. after it was moved
+        """
+        self.state = None
+        self.covariance = None
+        self.dropouts = 0
+        return self
+
+    def is_tracking(self):
+        return self.state is not None
+
+    def estimate(self):
+        """
+        :return: (x, y, radius) of the current estimate, None if not tracking
+        """
+        if self.state is None:
+            return None
+        return tuple(self.state[:3].tolist())
+
+    def predict(self, control=None):
+        """
+            advances the estimate by one step
+
+        :param control: commanded joint deltas since the last step, see control_matrix
+        :return: predicted (x, y, radius), None if not tracking
+        """
+        if self.state is None:
+            return None
+        self.state = self.transition @ self.state
+        if control is not None and self.control_matrix is not None:
+            self.state[:3] += self.control_matrix @ np.asarray(control, dtype=np.float64)
+        self.covariance = self.transition @ self.covariance @ self.transition.T + self.process_covariance
+        return self.estimate()
+
+    def update(self, measurement):
+        """
+            corrects the predicted estimate by a detection
+
+        :param measurement: detected (x, y, radius), None if the detection was dropped
+        :return: (x, y, radius) of the corrected estimate,
+                 None if the marble is lost after more than max_dropouts missing detections
+        """
+        if measurement is None:
+            if self.state is None:
+                return None
+            self.dropouts += 1
+            if self.dropouts > self.max_dropouts:
+                self.reset()
+                return None
+            return self.estimate()
+
+        measurement = np.asarray(measurement, dtype=np.float64)
+        self.dropouts = 0
+        if self.state is None:
+            self.state = np.concatenate((measurement, np.zeros(3)))
+            self.covariance = np.diag([1.0, 1.0, 1.0, 100.0, 100.0, 100.0]) * self.measurement_covariance[0, 0]
+            return self.estimate()
+
+        residual = measurement - self.observation @ self.state
+        residual_covariance = self.observation @ self.covariance @ self.observation.T + self.measurement_covariance
+        gain = self.covariance @ self.observation.T @ np.linalg.inv(residual_covariance)
+        self.state = self.state + gain @ residual
+        self.covariance = (np.eye(6) - gain @ self.observation) @ self.covariance
+        return self.estimate()
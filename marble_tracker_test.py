@@ -0,0 +1,59 @@
+"""Runs without a camera: python marble_tracker_test.py (or pytest)"""
+import numpy as np
+
+from marble_tracker import KalmanMarbleTracker
+
+
+def test_first_detection_starts_tracking():
+    tracker = KalmanMarbleTracker()
+    assert not tracker.is_tracking() and tracker.predict() is None and tracker.update(None) is None
+    assert tracker.update((10, 20, 5)) == (10.0, 20.0, 5.0)
+    assert tracker.is_tracking()
+
+
+def test_predicts_constant_velocity():
+    tracker = KalmanMarbleTracker()
+    for step in range(20):
+        tracker.predict()
+        tracker.update((2.0 * step, 100 - 3.0 * step, 10))
+    x, y, radius = tracker.predict()
+    assert abs(x - 40) < 1 and abs(y - 40) < 1 and abs(radius - 10) < 1
+
+
+def test_predicts_through_dropouts():
+    tracker = KalmanMarbleTracker(max_dropouts=2)
+    for step in range(20):
+        tracker.predict()
+        tracker.update((2.0 * step, 50, 10))
+    for step in range(20, 22):
+        x, _, _ = tracker.predict()
+        assert tracker.update(None) is not None and abs(x - 2 * step) < 1
+    tracker.predict()
+    # lost after more than max_dropouts missing detections in a row
+    assert tracker.update(None) is None and not tracker.is_tracking()
+
+
+def test_control_moves_prediction():
+    control_matrix = np.zeros((3, 3))
+    control_matrix[0, 0] = -2
+    tracker = KalmanMarbleTracker(control_matrix=control_matrix)
+    tracker.update((100, 50, 10))
+    x, y, _ = tracker.predict(control=(5, 0, 0))
+    assert x == 90 and y == 50
+    # without a control matrix the control is ignored
+    tracker = KalmanMarbleTracker()
+    tracker.update((100, 50, 10))
+    assert tracker.predict(control=(5, 0, 0))[0] == 100
+
+
+def test_reset():
+    tracker = KalmanMarbleTracker()
+    tracker.update((10, 20, 5))
+    assert tracker.reset().estimate() is None and not tracker.is_tracking()
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
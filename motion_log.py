@@ -0,0 +1,267 @@
+"""Binary log of the commands accepted by Servos and the angles they executed, with record and replay"""
+
+import struct
+import sys
+import threading
+import time
+
+_MAGIC = b"EZML"
+_VERSION = 1
+
+# record types
+SOURCE = 0
+COMMAND = 1
+BARRIER = 2
+DUMP = 3
+TICK = 4
+SYNC = 5
+AWAIT = 6
+
+# every record starts with its type, followed by the timestamp of the servo clock and the channel
+_SOURCE = struct.Struct("<BHH")  # type, source id, length of the utf-8 name following
+_COMMAND = struct.Struct("<BdBfH")  # type, timestamp, channel, target angle, source id
+_BARRIER = struct.Struct("<BdBBH")  # type, timestamp, channel, channel waited for, source id
+_DUMP = struct.Struct("<BdBH")  # type, timestamp, channel, source id
+_TICK = struct.Struct("<BdBf")  # type, timestamp, channel, written angle
+_SYNC = struct.Struct("<BdBIH")  # type, timestamp, channel, bit mask of the synchronized channels, source id
+# type, timestamp, channel, channel waited for, index of the waited for COMMAND among the ones of its channel, source id
+_AWAIT = struct.Struct("<BdBBIH")
+_STRUCTS = {COMMAND: _COMMAND, BARRIER: _BARRIER, DUMP: _DUMP, TICK: _TICK, SYNC: _SYNC, AWAIT: _AWAIT}
+
+UNKNOWN_SOURCE = "unknown"
+
+
+class MotionRecorder:
+
+    def __init__(self, path):
+        """
+        Appends every accepted command and every written angle to a binary log file.
+        Attach it with ServoController.record(recorder)
+
+        :param path: log file, created if missing and appended to otherwise
+        """
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__sources = {}
+        # COMMANDs written per channel, referenced by AWAIT records
+        self.__commands = {}
+        self.__file = open(path, "ab")
+        if self.__file.tell() == 0:
+            self.__file.write(_MAGIC + struct.pack("<H", _VERSION))
+        else:
+            # indices continue the ones of the commands already in the log
+            for record in read_log(path):
+                if record.type == COMMAND:
+                    self.__commands[record.channel] = self.__commands.get(record.channel, 0) + 1
+
+    def __source_id(self, source):
+        """
+            source names are written once and referenced by id afterwards
+        """
+        source = UNKNOWN_SOURCE if source is None else str(source)
+        if source not in self.__sources:
+            source_id = len(self.__sources)
+            name = source.encode("utf-8")
+            self.__file.write(_SOURCE.pack(SOURCE, source_id, len(name)) + name)
+            self.__sources[source] = source_id
+        return self.__sources[source]
+
+    def command(self, timestamp, channel, target, source=None):
+        """
+        :return: index of the command among the ones of its channel
+        """
+        with self.__lock:
+            self.__file.write(_COMMAND.pack(COMMAND, timestamp, channel, target, self.__source_id(source)))
+            index = self.__commands.get(channel, 0)
+            self.__commands[channel] = index + 1
+            return index
+
+    def barrier(self, timestamp, channel, waited_channel, source=None):
+        with self.__lock:
+            self.__file.write(_BARRIER.pack(BARRIER, timestamp, channel, waited_channel, self.__source_id(source)))
+
+    def dump(self, timestamp, channel, source=None):
+        with self.__lock:
+            self.__file.write(_DUMP.pack(DUMP, timestamp, channel, self.__source_id(source)))
+
+    def await_command(self, timestamp, channel, waited_channel, index, source=None):
+        with self.__lock:
+            self.__file.write(_AWAIT.pack(AWAIT, timestamp, channel, waited_channel, index, self.__source_id(source)))
+
+    def sync(self, timestamp, channel, channels, source=None):
+        with self.__lock:
+            self.__file.write(_SYNC.pack(SYNC, timestamp, channel, channels, self.__source_id(source)))
+
+    def tick(self, timestamp, channel, angle):
+        with self.__lock:
+            self.__file.write(_TICK.pack(TICK, timestamp, channel, angle))
+
+    def flush(self):
+        with self.__lock:
+            self.__file.flush()
+        return self
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+class MotionRecord:
+
+    def __init__(self, record_type, timestamp, channel, value=None, source=None):
+        """
+        A single entry of a motion log
+
+        :param record_type: COMMAND, BARRIER, AWAIT, DUMP, SYNC or TICK
+        :param timestamp: timestamp of the servo clock
+        :param channel: channel of the Servo
+        :param value: target angle of a COMMAND, channel waited for of a BARRIER, written angle of a TICK,
+                      bit mask of the synchronized channels of a SYNC,
+                      (channel, index of the COMMAND of that channel) waited for by an AWAIT
+        :param source: name of the source of a command
+        """
+        self.type = record_type
+        self.timestamp = timestamp
+        self.channel = channel
+        self.value = value
+        self.source = source
+
+    def __repr__(self):
+        name = {COMMAND: "COMMAND", BARRIER: "BARRIER", DUMP: "DUMP", TICK: "TICK", SYNC: "SYNC",
+                AWAIT: "AWAIT"}.get(self.type)
+        return "{:.4f} {} channel {}: {} ({})".format(self.timestamp, name, self.channel, self.value, self.source)
+
+
+def read_log(path):
+    """
+    :return: list of every MotionRecord in the given log file
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:len(_MAGIC)] != _MAGIC:
+        raise ValueError("{} is not a motion log".format(path))
+    version, = struct.unpack_from("<H", data, len(_MAGIC))
+    if version != _VERSION:
+        raise ValueError("unsupported motion log version {}".format(version))
+
+    sources = {}
+    records = []
+    offset = len(_MAGIC) + 2
+    while offset < len(data):
+        record_type = data[offset]
+        if record_type == SOURCE:
+            _, source_id, length = _SOURCE.unpack_from(data, offset)
+            offset += _SOURCE.size
+            sources[source_id] = data[offset:offset + length].decode("utf-8")
+            offset += length
+            continue
+        fields = _STRUCTS[record_type].unpack_from(data, offset)
+        offset += _STRUCTS[record_type].size
+        if record_type == DUMP:
+            records.append(MotionRecord(DUMP, fields[1], fields[2], source=sources.get(fields[3])))
+        elif record_type == TICK:
+            records.append(MotionRecord(TICK, fields[1], fields[2], fields[3]))
+        elif record_type == AWAIT:
+            records.append(MotionRecord(AWAIT, fields[1], fields[2], (fields[3], fields[4]), sources.get(fields[5])))
+        else:
+            records.append(MotionRecord(record_type, fields[1], fields[2], fields[3], sources.get(fields[4])))
+    return records
+
+
+class MotionReplayer:
+
+    def __init__(self, path):
+        """
+        Replays the commands of a motion log on any ServoController
+
+        :param path: log file written by a MotionRecorder
+        """
+        self.records = read_log(path)
+
+    def commands(self):
+        return [record for record in self.records if record.type != TICK]
+
+    def ticks(self, channel=None):
+        """
+        :return: the executed (timestamp, angle) tuples, of every channel if channel is None
+        """
+        return [(record.timestamp, record.value) for record in self.records
+                if record.type == TICK and (channel is None or record.channel == channel)]
+
+    def replay(self, controller, speed=1.0):
+        """
+            sends the recorded commands to the Servos of the given controller with the same channel numbers.
+            returns once the last command was sent, use controller.wait_for_all() to wait for the motion
+
+        :param controller: started ServoController
+        :param speed: 1.0 keeps the recorded timing, 2.0 replays twice as fast. None sends every command at once
+        """
+        from servo_controller import Rendezvous
+        servos = {servo.get_channel(): servo for servo in controller.servos}
+        # Rendezvous of SYNC records by channel mask, until queued in every synchronized Servo
+        rendezvous = {}
+        # RotationFutures of the replayed COMMANDs per channel, referenced by AWAIT records
+        futures = {channel: [] for channel in servos}
+        commands = self.commands()
+        if not commands:
+            return controller
+        first_timestamp = commands[0].timestamp
+        start_time = time.monotonic()
+        for record in commands:
+            if speed is not None:
+                delay = start_time + (record.timestamp - first_timestamp) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            servo = servos[record.channel]
+            if record.type == COMMAND:
+                futures[record.channel].append(servo.rotate_to(record.value, source=record.source))
+            elif record.type == AWAIT:
+                waited_channel, index = record.value
+                servo.wait_for_rotations(futures[waited_channel][index], source=record.source)
+            elif record.type == BARRIER:
+                servo.wait_for_servo(servos[record.value], source=record.source)
+            elif record.type == DUMP:
+                servo.dump_rotations(source=record.source)
+            elif record.type == SYNC:
+                if record.value not in rendezvous:
+                    synchronized = [servos[channel] for channel in sorted(servos) if record.value >> channel & 1]
+                    rendezvous[record.value] = [Rendezvous(synchronized), len(synchronized)]
+                entry = rendezvous[record.value]
+                servo._wait_at(entry[0], source=record.source)
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del rendezvous[record.value]
+        return controller
+
+
+def _main(args):
+    replay = False
+    max_speed = False
+    path = None
+    for arg in args:
+        if arg == '-replay' or arg == '-r':
+            replay = True
+        elif arg == '-max' or arg == '-m':
+            max_speed = True
+        elif path is None:
+            path = arg
+        else:
+            raise ValueError("There is no argument {} for motion_log.py".format(arg))
+    if path is None:
+        raise ValueError("usage: motion_log.py <log file> [-replay] [-max]")
+
+    replayer = MotionReplayer(path)
+    if not replay:
+        for record in replayer.records:
+            print(record)
+        return
+    from eezybot_controller import eezybot
+    eezybot.start()
+    replayer.replay(eezybot, speed=None if max_speed else 1.0)
+    eezybot.wait_for_all()
+    eezybot.interrupt().join()
+
+
+# called when executed directly
+if __name__ == '__main__':
+    _main(sys.argv[1:])
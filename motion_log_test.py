@@ -0,0 +1,132 @@
+"""Runs against the fake adafruit_servokit: python motion_log_test.py (or pytest)"""
+import contextlib
+import io
+import os
+import struct
+import tempfile
+
+from constants import SERVO_CONTROLLER
+
+SERVO_CONTROLLER.USE_FAKE_CONTROLLER = True
+
+# noinspection PyPep8
+import motion_log
+# noinspection PyPep8
+from motion_log import (AWAIT, BARRIER, COMMAND, DUMP, SYNC, TICK, UNKNOWN_SOURCE, MotionRecorder, MotionReplayer,
+                        read_log)
+# noinspection PyPep8
+from servo_controller import Servo, ServoController
+
+
+def _fields(records):
+    return [(record.type, record.timestamp, record.channel, record.value, record.source) for record in records]
+
+
+def test_round_trip():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "motion.bin")
+        recorder = MotionRecorder(path)
+        assert recorder.command(0.5, 0, 90.0, "agent") == 0
+        assert recorder.command(0.75, 0, 45.5) == 1
+        recorder.barrier(1.0, 1, 0, "agent")
+        recorder.await_command(1.25, 2, 0, 1, "macro")
+        recorder.sync(1.5, 1, 0b110, "macro")
+        recorder.dump(1.75, 0)
+        recorder.tick(2.0, 0, 45.5)
+        recorder.close()
+        expected = [(COMMAND, 0.5, 0, 90.0, "agent"), (COMMAND, 0.75, 0, 45.5, UNKNOWN_SOURCE),
+                    (BARRIER, 1.0, 1, 0, "agent"), (AWAIT, 1.25, 2, (0, 1), "macro"),
+                    (SYNC, 1.5, 1, 0b110, "macro"), (DUMP, 1.75, 0, None, UNKNOWN_SOURCE), (TICK, 2.0, 0, 45.5, None)]
+        assert _fields(read_log(path)) == expected
+
+        # appended to, the indices of the commands continue and the sources are written again
+        recorder = MotionRecorder(path)
+        assert recorder.command(3.0, 0, 10.0, "agent") == 2
+        assert recorder.command(3.0, 1, 20.0, "other") == 0
+        recorder.close()
+        records = read_log(path)
+        assert _fields(records[:len(expected)]) == expected
+        assert _fields(records[len(expected):]) == [(COMMAND, 3.0, 0, 10.0, "agent"), (COMMAND, 3.0, 1, 20.0, "other")]
+
+        replayer = MotionReplayer(path)
+        assert [record.type for record in replayer.commands()] == [COMMAND] * 2 + [BARRIER, AWAIT, SYNC, DUMP] + \
+            [COMMAND] * 2
+        assert replayer.ticks() == [(2.0, 45.5)] and replayer.ticks(1) == []
+
+
+def test_rejects_other_files():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "motion.bin")
+        for data in (b"not a motion log", b"EZML" + struct.pack("<H", 99)):
+            with open(path, "wb") as f:
+                f.write(data)
+            try:
+                read_log(path)
+                assert False, "read {}".format(data)
+            except ValueError:
+                pass
+
+
+def test_main_prints_records():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "motion.bin")
+        recorder = MotionRecorder(path)
+        recorder.command(0.5, 0, 90.0, "agent")
+        recorder.await_command(1.0, 1, 0, 0)
+        recorder.close()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            motion_log._main([path])
+    assert output.getvalue().splitlines() == ["0.5000 COMMAND channel 0: 90.0 (agent)",
+                                              "1.0000 AWAIT channel 1: (0, 0) (unknown)"]
+    for args in ([], [path, "other"]):
+        try:
+            motion_log._main(args)
+            assert False, args
+        except ValueError:
+            pass
+
+
+def test_replay_awaits_and_sync_points():
+    with tempfile.TemporaryDirectory() as directory:
+        recorded, replayed = os.path.join(directory, "recorded.bin"), os.path.join(directory, "replayed.bin")
+        servos = [Servo(channel, 0, 180, step_size=10, step_time=0.01) for channel in range(3)]
+        controller = ServoController(*servos).start()
+        for servo in servos:
+            servo.rotate_to(0)
+        controller.wait_for_all()
+
+        recorder = MotionRecorder(recorded)
+        controller.record(recorder)
+        lift = servos[0].rotate_to(100, source="test")
+        servos[1].wait_for_rotations(lift, source="test")
+        servos[1].rotate_to(60, source="test")
+        controller.sync_point(servos[1], servos[2], source="test")
+        servos[2].rotate_to(30, source="test")
+        controller.wait_for_all().record(None)
+        recorder.close()
+        commands = MotionReplayer(recorded).commands()
+        assert [record.type for record in commands] == [COMMAND, AWAIT, COMMAND, SYNC, SYNC, COMMAND]
+        assert commands[1].value == (0, 0) and commands[3].value == 0b110
+
+        for servo in servos:
+            servo.rotate_to(0)
+        controller.wait_for_all()
+        recorder = MotionRecorder(replayed)
+        controller.record(recorder)
+        MotionReplayer(recorded).replay(controller, speed=None)
+        controller.wait_for_all().record(None)
+        recorder.close()
+        controller.interrupt().join(1)
+        assert [servo.get_angle() for servo in servos] == [100, 60, 30]
+        # the replay issues the same commands again
+        assert [(record.type, record.channel, record.value, record.source) for record in
+                MotionReplayer(replayed).commands()] == \
+            [(record.type, record.channel, record.value, record.source) for record in commands]
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
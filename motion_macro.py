@@ -0,0 +1,167 @@
+"""Motion Macros: keyframe sequences of several Servos, precompiled into a schedule with the least waiting"""
+
+
+class InvalidMacroException(Exception):
+    pass
+
+
+class Keyframe:
+
+    def __init__(self, name, servo, angle=None, offset=None, after=()):
+        """
+        A single rotation of a MotionMacro
+
+        :param name: unique within the macro, referenced by the after parameter of other Keyframes
+        :param servo: attribute name of the Servo on the controller, e.g. "verticalArm"
+        :param angle: target angle or function returning it when the macro is run, called with the Servo
+        :param offset: rotation relative to the target the Servo has when the keyframe is queued,
+                       e.g. the target of its previous keyframe
+        :param after: names of keyframes of other Servos to be finished before this one starts.
+                      Keyframes of the same Servo are performed in the given order anyway
+        """
+        if (angle is None) == (offset is None):
+            raise InvalidMacroException("Keyframe {} needs either an angle or an offset".format(name))
+        self.name = name
+        self.servo = servo
+        self.angle = angle
+        self.offset = offset
+        self.after = tuple(after)
+
+
+class _Step:
+
+    def __init__(self, keyframe, waits):
+        """
+        :param keyframe: Keyframe to be queued
+        :param waits: names of the keyframes of other Servos the Servo has to wait for before
+        """
+        self.keyframe = keyframe
+        self.waits = waits
+
+
+class MotionMacro:
+
+    def __init__(self, name, keyframes):
+        """
+        Named sequence of keyframes with explicit dependencies between the Servos.
+        Validated on creation and compiled into a schedule once per controller:
+        every dependency implied by another one or by the order of a Servo's own keyframes is dropped,
+        so every Servo only waits for exactly the rotations it depends on and moves as early as possible.
+        Nothing blocks the calling Thread, the whole macro is queued at once
+
+        :param name: name of the macro, written to the motion log as source of its rotations
+        :param keyframes: list of Keyframes
+        :raises InvalidMacroException: on duplicate or unknown keyframe names and cyclic dependencies
+        """
+        self.name = name
+        self.keyframes = list(keyframes)
+        self.__schedule = self.__compile()
+        # controllers the servo names and angles were checked against
+        self.__validated = set()
+
+    def __compile(self):
+        """
+        :return: list of _Steps in an order every dependency is queued before its dependents
+        """
+        keyframes = {}
+        for keyframe in self.keyframes:
+            if keyframe.name in keyframes:
+                raise InvalidMacroException("{}: duplicate keyframe {}".format(self.name, keyframe.name))
+            keyframes[keyframe.name] = keyframe
+
+        # direct dependencies: the previous keyframe of the same Servo and the ones given by after
+        previous = {}
+        last_of_servo = {}
+        for keyframe in self.keyframes:
+            previous[keyframe.name] = last_of_servo.get(keyframe.servo)
+            last_of_servo[keyframe.servo] = keyframe.name
+            for dependency in keyframe.after:
+                if dependency not in keyframes:
+                    raise InvalidMacroException(
+                        "{}: keyframe {} depends on unknown keyframe {}".format(self.name, keyframe.name, dependency))
+
+        def dependencies(name):
+            result = set(keyframes[name].after)
+            if previous[name] is not None:
+                result.add(previous[name])
+            return result
+
+        # topological order, keeping the given order where possible
+        order = []
+        ancestors = {}
+        remaining = [keyframe.name for keyframe in self.keyframes]
+        while remaining:
+            ready = next((name for name in remaining if dependencies(name) <= ancestors.keys()), None)
+            if ready is None:
+                raise InvalidMacroException("{}: cyclic dependencies between {}".format(self.name, remaining))
+            remaining.remove(ready)
+            ancestors[ready] = set()
+            for dependency in dependencies(ready):
+                ancestors[ready] |= ancestors[dependency] | {dependency}
+            order.append(ready)
+
+        schedule = []
+        for name in order:
+            keyframe = keyframes[name]
+            implied = ancestors[previous[name]] | {previous[name]} if previous[name] is not None else set()
+            waits = []
+            for dependency in set(keyframe.after):
+                if keyframes[dependency].servo == keyframe.servo or dependency in implied:
+                    continue
+                # implied by another dependency
+                if any(dependency in ancestors[other] for other in keyframe.after if other != dependency):
+                    continue
+                waits.append(dependency)
+            schedule.append(_Step(keyframe, sorted(waits)))
+        return schedule
+
+    def __validate(self, controller):
+        for step in self.__schedule:
+            keyframe = step.keyframe
+            servo = getattr(controller, keyframe.servo, None)
+            if servo is None:
+                raise InvalidMacroException("{}: controller has no Servo {}".format(self.name, keyframe.servo))
+            if isinstance(keyframe.angle, (int, float)) and \
+                    not servo.min_degree <= keyframe.angle <= servo.max_degree:
+                raise InvalidMacroException("{}: angle {} of keyframe {} out of bounds of {}".format(
+                    self.name, keyframe.angle, keyframe.name, servo.name))
+        self.__validated.add(id(controller))
+
+    def waits(self):
+        """
+        :return: dictionary of every keyframe name and the keyframes its Servo waits for in the compiled schedule
+        """
+        return {step.keyframe.name: step.waits for step in self.__schedule}
+
+    def run(self, controller, source=None):
+        """
+            queues every keyframe on the Servos of the given controller.
+            Every keyframe is performed even if the Servos coalesce rotations
+
+        :param controller: started ServoController, e.g. eezybot
+        :param source: name written to the motion log, the name of the macro if None
+        :return: dictionary of every keyframe name and the RotationFuture of its rotation
+        """
+        if id(controller) not in self.__validated:
+            self.__validate(controller)
+        if source is None:
+            source = self.name
+        futures = {}
+        # last queued rotation of every Servo
+        previous = {}
+        for step in self.__schedule:
+            keyframe = step.keyframe
+            servo = getattr(controller, keyframe.servo)
+            if step.waits:
+                servo.wait_for_rotations(*[futures[name] for name in step.waits], source=source)
+            elif servo.is_coalescing_rotations() and keyframe.servo in previous:
+                # a coalescing Servo would replace its previous keyframe instead of performing both
+                servo.wait_for_rotations(previous[keyframe.servo], source=source)
+            if keyframe.offset is not None:
+                futures[keyframe.name] = servo.rotate(keyframe.offset, source=source)
+            elif callable(keyframe.angle):
+                futures[keyframe.name] = servo.rotate_to(keyframe.angle(servo), source=source)
+            else:
+                futures[keyframe.name] = servo.rotate_to(keyframe.angle, source=source)
+            previous[keyframe.servo] = futures[keyframe.name]
+        return futures
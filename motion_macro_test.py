@@ -0,0 +1,80 @@
+"""Runs against the fake adafruit_servokit: python motion_macro_test.py (or pytest)"""
+from constants import SERVO_CONTROLLER
+
+SERVO_CONTROLLER.USE_FAKE_CONTROLLER = True
+
+# noinspection PyPep8
+from motion_macro import MotionMacro, Keyframe, InvalidMacroException
+# noinspection PyPep8
+from servo_controller import Servo, ServoController
+
+# the dependencies of the grab macro of the gym environment
+_KEYFRAMES = [
+    Keyframe("lower", "arm", offset=-10),
+    Keyframe("grab", "clutch", angle=40, after=("lower",)),
+    Keyframe("lift", "arm", angle=150, after=("grab",)),
+    Keyframe("turn", "base", angle=120, after=("lift",)),
+    Keyframe("drop", "arm", angle=60),
+    Keyframe("release", "clutch", angle=170, after=("turn", "drop"))
+]
+
+
+class _Controller(ServoController):
+    def __init__(self):
+        self.arm = Servo(0, 0, 180, step_size=10, step_time=0.01, name="arm")
+        self.clutch = Servo(1, 0, 180, step_size=10, step_time=0.01, name="clutch")
+        self.base = Servo(2, 0, 180, step_size=10, step_time=0.01, name="base")
+        super().__init__(self.arm, self.clutch, self.base)
+
+
+def test_compiled_waits():
+    macro = MotionMacro("grab", _KEYFRAMES)
+    # release waits for drop only, turn is implied: drop is queued behind lift, turn waits for lift
+    assert macro.waits() == {"lower": [], "grab": ["lower"], "lift": ["grab"], "turn": ["lift"], "drop": [],
+                             "release": ["drop", "turn"]}
+
+
+def test_invalid_macros():
+    for keyframes in ([Keyframe("a", "arm", angle=10), Keyframe("a", "arm", angle=20)],
+                      [Keyframe("a", "arm", angle=10, after=("b",))],
+                      [Keyframe("a", "arm", angle=10, after=("b",)), Keyframe("b", "base", angle=10, after=("a",))]):
+        try:
+            MotionMacro("invalid", keyframes)
+            assert False, "invalid macro accepted"
+        except InvalidMacroException:
+            pass
+    try:
+        MotionMacro("out of bounds", [Keyframe("a", "arm", angle=200)]).run(_Controller())
+        assert False, "angle out of bounds accepted"
+    except InvalidMacroException:
+        pass
+
+
+def _run(coalesce):
+    controller = _Controller().coalesce_rotations(coalesce).start()
+    for servo in controller.servos:
+        servo.rotate_to(90)
+    controller.wait_for_all()
+    finished = []
+    futures = MotionMacro("grab", _KEYFRAMES).run(controller)
+    for name, future in futures.items():
+        future.add_done_callback(lambda _, name=name: finished.append(name))
+    controller.wait_for_all()
+    controller.interrupt().join(1)
+    return futures, finished
+
+
+def test_every_keyframe_performed():
+    for coalesce in (False, True):
+        futures, finished = _run(coalesce)
+        assert not any(future.cancelled() for future in futures.values()), (coalesce, finished)
+        # the arm lifts before the base turns and drops afterwards
+        assert finished.index("lift") < finished.index("turn"), (coalesce, finished)
+        assert finished.index("lift") < finished.index("drop") < finished.index("release"), (coalesce, finished)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
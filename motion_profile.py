@@ -0,0 +1,198 @@
+"""Motion Profiles: angle of a Servo over time while performing a rotation"""
+
+import math
+
+
+class Motion:
+
+    def __init__(self, profile, start_angle, target_angle, start_time):
+        """
+        A single rotation planned by a MotionProfile
+
+        :param profile: MotionProfile this rotation follows
+        :param start_angle: angle the rotation starts at
+        :param target_angle: angle the rotation ends at
+        :param start_time: time.monotonic() timestamp the rotation starts at
+        """
+        self.profile = profile
+        self.start_angle = start_angle
+        self.target_angle = target_angle
+        self.start_time = start_time
+        self.distance = abs(target_angle - start_angle)
+        self.duration = profile.duration(self.distance)
+        self.__time_scale = 1.0
+
+    @property
+    def end_time(self):
+        return self.start_time + self.duration
+
+    def stretch(self, duration):
+        """
+            slows the rotation down to take the given duration, keeping the shape of its profile.
+            Used to let coordinated rotations finish together. Rotations are never sped up
+        """
+        if duration > self.duration:
+            self.__time_scale = self.profile.duration(self.distance) / duration
+            self.duration = duration
+        return self
+
+    def angle_at(self, now):
+        """
+        :param now: time.monotonic() timestamp
+        :return: the angle this rotation has at the given time
+        """
+        if now >= self.end_time:
+            return self.target_angle
+        elapsed = max(0.0, now - self.start_time) * self.__time_scale
+        travelled = self.profile.distance_at(self.distance, elapsed)
+        if self.target_angle < self.start_angle:
+            return self.start_angle - travelled
+        return self.start_angle + travelled
+
+    def is_finished(self, now):
+        return now >= self.end_time
+
+
+class MotionProfile:
+    """
+        Base class. Describes the distance travelled over the time of a rotation
+    """
+
+    def plan(self, start_angle, target_angle, start_time):
+        return Motion(self, start_angle, target_angle, start_time)
+
+    def duration(self, distance):
+        """
+        :return: seconds a rotation of the given distance takes
+        """
+        raise NotImplementedError
+
+    def distance_at(self, distance, elapsed):
+        """
+        :return: degrees travelled after elapsed seconds of a rotation of the given distance
+        """
+        raise NotImplementedError
+
+    def time_at(self, distance, travelled):
+        """
+            inverse of distance_at(), found by bisection as the distance travelled never decreases
+        :return: seconds after which a rotation of the given distance travelled the given degrees
+        """
+        low, high = 0.0, self.duration(distance)
+        for _ in range(60):
+            middle = (low + high) / 2
+            if self.distance_at(distance, middle) < travelled:
+                low = middle
+            else:
+                high = middle
+        return high
+
+
+class LinearProfile(MotionProfile):
+
+    def __init__(self, velocity):
+        """
+        Constant velocity without acceleration, like stepping step_size degrees every step_time seconds
+
+        :param velocity: degrees per second. math.inf jumps to the target at once
+        """
+        self.velocity = velocity
+
+    def duration(self, distance):
+        if math.isinf(self.velocity):
+            return 0.0
+        return distance / self.velocity
+
+    def distance_at(self, distance, elapsed):
+        if math.isinf(self.velocity):
+            return distance
+        return min(distance, self.velocity * elapsed)
+
+
+class FixedDurationProfile(MotionProfile):
+
+    def __init__(self, duration):
+        """
+        Constant velocity chosen to take the given duration whatever the distance,
+        lets rotations of different Servos arrive together
+
+        :param duration: seconds every rotation takes, 0 jumps to the target at once
+        """
+        self.__duration = duration
+
+    def duration(self, distance):
+        return self.__duration
+
+    def distance_at(self, distance, elapsed):
+        if elapsed >= self.__duration:
+            return distance
+        return distance * elapsed / self.__duration
+
+
+class TrapezoidalProfile(MotionProfile):
+    # ramp time relative to the one of constant acceleration
+    _RAMP_FACTOR = 1.0
+
+    def __init__(self, max_velocity, max_acceleration):
+        """
+        Accelerates with max_acceleration up to max_velocity, cruises and decelerates symmetrically.
+        Short rotations never reach max_velocity (triangular profile)
+
+        :param max_velocity: degrees per second
+        :param max_acceleration: degrees per second squared
+        """
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+
+    def _phases(self, distance):
+        """
+        :return: (peak velocity, time of each ramp, time of cruising)
+        """
+        ramp_time = self._RAMP_FACTOR * self.max_velocity / self.max_acceleration
+        if self.max_velocity * ramp_time <= distance:
+            return self.max_velocity, ramp_time, (distance - self.max_velocity * ramp_time) / self.max_velocity
+        peak_velocity = math.sqrt(distance * self.max_acceleration / self._RAMP_FACTOR)
+        return peak_velocity, self._RAMP_FACTOR * peak_velocity / self.max_acceleration, 0.0
+
+    def _ramp_distance(self, peak_velocity, ramp_time, elapsed):
+        """
+        :return: degrees travelled after elapsed seconds of accelerating from 0 to peak_velocity in ramp_time
+        """
+        return 0.5 * peak_velocity / ramp_time * elapsed ** 2
+
+    def duration(self, distance):
+        if distance <= 0:
+            return 0.0
+        _, ramp_time, cruise_time = self._phases(distance)
+        return 2 * ramp_time + cruise_time
+
+    def distance_at(self, distance, elapsed):
+        if distance <= 0:
+            return 0.0
+        peak_velocity, ramp_time, cruise_time = self._phases(distance)
+        duration = 2 * ramp_time + cruise_time
+        if elapsed >= duration:
+            return distance
+        if elapsed < ramp_time:
+            return self._ramp_distance(peak_velocity, ramp_time, elapsed)
+        if elapsed < ramp_time + cruise_time:
+            return peak_velocity * ramp_time / 2 + peak_velocity * (elapsed - ramp_time)
+        return distance - self._ramp_distance(peak_velocity, ramp_time, duration - elapsed)
+
+
+class SCurveProfile(TrapezoidalProfile):
+    # sinusoidal ramps need pi / 2 times longer to stay within max_acceleration
+    _RAMP_FACTOR = math.pi / 2
+
+    def __init__(self, max_velocity, max_acceleration):
+        """
+        Like the TrapezoidalProfile but accelerating along a half sine wave,
+        avoiding the jerk of switching acceleration on and off
+
+        :param max_velocity: degrees per second
+        :param max_acceleration: peak acceleration in degrees per second squared
+        """
+        super().__init__(max_velocity, max_acceleration)
+
+    def _ramp_distance(self, peak_velocity, ramp_time, elapsed):
+        return peak_velocity / 2 * (elapsed - ramp_time / math.pi * math.sin(math.pi * elapsed / ramp_time))
@@ -0,0 +1,94 @@
+"""Runs without servos: python motion_profile_test.py (or pytest)"""
+import math
+
+from motion_profile import FixedDurationProfile, LinearProfile, SCurveProfile, TrapezoidalProfile
+
+PROFILES = [TrapezoidalProfile(max_velocity=50, max_acceleration=300),
+            SCurveProfile(max_velocity=50, max_acceleration=300)]
+# short rotations never reach max_velocity, long ones cruise
+DISTANCES = [0.5, 5, 30, 150]
+SAMPLES = 1000
+
+
+def _samples(profile, distance):
+    duration = profile.duration(distance)
+    times = [duration * i / SAMPLES for i in range(SAMPLES + 1)]
+    return times, [profile.distance_at(distance, elapsed) for elapsed in times]
+
+
+def test_endpoints():
+    for profile in PROFILES:
+        assert profile.duration(0) == 0 and profile.distance_at(0, 1) == 0
+        for distance in DISTANCES:
+            duration = profile.duration(distance)
+            assert profile.distance_at(distance, 0) == 0
+            assert abs(profile.distance_at(distance, duration) - distance) < 1e-9
+            assert profile.distance_at(distance, duration + 1) == distance
+            # symmetric ramps, half the distance after half the time
+            assert abs(profile.distance_at(distance, duration / 2) - distance / 2) < 1e-9
+
+
+def test_monotonic_within_limits():
+    for profile in PROFILES:
+        for distance in DISTANCES:
+            times, distances = _samples(profile, distance)
+            step = times[1] - times[0]
+            velocities = [(b - a) / step for a, b in zip(distances, distances[1:])]
+            assert all(velocity >= -1e-9 for velocity in velocities), (profile, distance)
+            assert max(velocities) <= profile.max_velocity * (1 + 1e-6), (profile, distance)
+            accelerations = [(b - a) / step for a, b in zip(velocities, velocities[1:])]
+            assert max(abs(acceleration) for acceleration in accelerations) <= \
+                profile.max_acceleration * 1.01, (profile, distance)
+
+
+def test_duration():
+    for profile in PROFILES:
+        ramp_factor = 1 if type(profile) is TrapezoidalProfile else math.pi / 2
+        ramp_time = ramp_factor * profile.max_velocity / profile.max_acceleration
+        # cruising at max_velocity, every ramp covers half the distance it would at max_velocity
+        assert abs(profile.duration(150) - (150 / profile.max_velocity + ramp_time)) < 1e-9
+        # never faster than moving at max_velocity all the time
+        for distance in DISTANCES:
+            assert profile.duration(distance) > distance / profile.max_velocity
+        assert profile.duration(5) < profile.duration(30) < profile.duration(150)
+    # the smooth ramps take longer
+    assert PROFILES[1].duration(30) > PROFILES[0].duration(30)
+
+
+def test_stretched_motion():
+    for profile in PROFILES + [LinearProfile(100)]:
+        motion = profile.plan(150, 30, 10.0)
+        duration = motion.duration
+        assert motion.stretch(duration / 2).duration == duration
+        motion.stretch(2 * duration)
+        assert motion.end_time == 10.0 + 2 * duration
+        assert motion.angle_at(10.0) == 150 and abs(motion.angle_at(10.0 + duration) - 90) < 1e-9
+        assert motion.angle_at(motion.end_time) == 30 and motion.is_finished(motion.end_time)
+        angles = [motion.angle_at(10.0 + 2 * duration * i / 100) for i in range(101)]
+        assert all(a >= b for a, b in zip(angles, angles[1:]))
+
+
+def test_time_at():
+    for profile in PROFILES + [LinearProfile(100), FixedDurationProfile(0.5)]:
+        for distance in DISTANCES:
+            for travelled in (0, distance / 3, distance / 2, distance):
+                elapsed = profile.time_at(distance, travelled)
+                assert 0 <= elapsed <= profile.duration(distance)
+                assert abs(profile.distance_at(distance, elapsed) - travelled) < 1e-9, (profile, distance, travelled)
+
+
+def test_fixed_duration():
+    profile = FixedDurationProfile(0.5)
+    for distance in DISTANCES + [0]:
+        assert profile.duration(distance) == 0.5
+        assert profile.distance_at(distance, 0.25) == distance / 2 and profile.distance_at(distance, 1) == distance
+    # rotations of different distances arrive together
+    assert profile.plan(0, 10, 1.0).end_time == profile.plan(0, 90, 1.0).end_time == 1.5
+    assert FixedDurationProfile(0).distance_at(30, 0) == 30
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
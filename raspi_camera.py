@@ -1,13 +1,45 @@
 import time
 
-from picamera import PiCamera
-from picamera.array import PiRGBArray
+from constants import IMAGE_PROCESSING
 
 camera = None
+# CaptureService streaming frames in the background if IMAGE_PROCESSING.CONTINUOUS_CAPTURE
+capture_service = None
+
+
+def _capture_service():
+    global capture_service
+
+    if capture_service is None:
+        from camera_capture import CaptureService, FileSource, PiCameraSource
+
+        if IMAGE_PROCESSING.CAPTURE_FILE is not None:
+            source = FileSource(IMAGE_PROCESSING.CAPTURE_FILE, framerate=IMAGE_PROCESSING.CAPTURE_FRAMERATE)
+        else:
+            source = PiCameraSource((1024, 1024), framerate=IMAGE_PROCESSING.CAPTURE_FRAMERATE)
+        capture_service = CaptureService(source, IMAGE_PROCESSING.CAPTURE_BUFFERS).start()
+    return capture_service
+
+
+def take_picture(after=None, out=None):
+    """
+    :param after: time.monotonic() timestamp, returns the first frame exposed after it instead of the newest one
+    :param out: array the image is copied into. Continuous capture only
+    :return: BGR image
+    """
+    if IMAGE_PROCESSING.CONTINUOUS_CAPTURE:
+        service = _capture_service()
+        if after is None:
+            frame = service.latest(out, timeout=IMAGE_PROCESSING.CAPTURE_TIMEOUT)
+        else:
+            frame = service.frame_after(after, out, timeout=IMAGE_PROCESSING.CAPTURE_TIMEOUT)
+        if frame is None:
+            raise AssertionError("no image")
+        return frame.image
 
-
-def take_picture():
     global camera
+    from picamera import PiCamera
+    from picamera.array import PiRGBArray
 
     if camera is None:
         camera = PiCamera()
@@ -15,6 +47,8 @@ def take_picture():
         # allow the camera to warmup
         time.sleep(1)
 
+    if after is not None:
+        time.sleep(max(0.0, after - time.monotonic()))
     raw_capture = PiRGBArray(camera)
 
     # grab an image from the camera
@@ -1,12 +1,17 @@
 """Base Class Provider"""
 
-import sys
+import asyncio
+import math
 import threading
 import time
+from collections import deque
 from typing import Tuple
 
 from constants import SERVO_CONTROLLER as SERVO
 from key_listener import KeyListener
+from motion_profile import LinearProfile
+from servo_output import KitOutput, PCA9685Output, FakeI2CDevice
+from servo_simulation import MonotonicClock, VirtualClock, SimulatedServoKit
 
 if not SERVO.USE_FAKE_CONTROLLER:
     import adafruit_servokit
@@ -31,6 +36,39 @@ Set channels to the number of servo channels on your kit.
 """
 _kit = adafruit_servokit.ServoKit(channels=8)
 
+"""
+Clock timing every rotation.
+Simulated time lets rotations advance a VirtualClock instead of sleeping, recording their trajectory in the kit
+"""
+_clock = MonotonicClock()
+if SERVO.USE_FAKE_CONTROLLER and SERVO.SIMULATE_TIME:
+    _clock = VirtualClock()
+    _kit = SimulatedServoKit(_clock, channels=8)
+
+"""
+Every angle is written through this Output Layer.
+Batched output writes all channels updated in a tick of a synchronized ServoController in one I2C transaction
+"""
+if SERVO.BATCHED_OUTPUT:
+    # noinspection PyProtectedMember
+    _output = PCA9685Output(FakeI2CDevice() if SERVO.USE_FAKE_CONTROLLER else _kit._pca.i2c_device)
+else:
+    _output = KitOutput(_kit)
+
+
+def robot_time():
+    """
+        seconds on the clock timing the Servos. Simulated seconds if SERVO_CONTROLLER.SIMULATE_TIME
+    """
+    return _clock.monotonic()
+
+
+def simulated_kit():
+    """
+    :return: the SimulatedServoKit recording the trajectories if SERVO_CONTROLLER.SIMULATE_TIME, else None
+    """
+    return _kit if isinstance(_kit, SimulatedServoKit) else None
+
 
 class OutOfBoundsException(Exception):
     pass
@@ -68,10 +106,163 @@ def ensure_in_bounds(angle, min_degree, max_degree):
         return angle
 
 
+class RotationFuture:
+
+    def __init__(self, servo, angle, profile=None):
+        """
+        Returned by Servo.rotate_to(). Resolves when the Servo reached the angle
+        or is cancelled if the rotation was dumped or replaced by a coalesced rotation
+        or if performing the rotations of the Servo raised an exception
+
+        :param servo: Servo performing the rotation
+        :param angle: target angle of the rotation
+        :param profile: MotionProfile of the rotation, None for the one of the Servo
+        """
+        self.servo = servo
+        self.angle = angle
+        self.profile = profile
+        self.__event = threading.Event()
+        self.__lock = threading.Lock()
+        self.__cancelled = False
+        self.__exception = None
+        self.__callbacks = []
+        # index of the command in the motion log, if recorded
+        self._log_index = None
+
+    def done(self):
+        """
+            True if the rotation was performed or cancelled
+        """
+        return self.__event.is_set()
+
+    def cancelled(self):
+        return self.__cancelled
+
+    def exception(self):
+        """
+        :return: the exception raised while performing the rotations of the Servo, None if there was none
+        """
+        return self.__exception
+
+    def wait(self, timeout=None):
+        """
+            blocks until the rotation was performed or cancelled
+
+        :param timeout: if timeout is not None, this function will stop blocking if the timeout is reached.
+        :return: True if the rotation is done, False on timeout
+        """
+        return self.__event.wait(timeout)
+
+    def add_done_callback(self, func):
+        """
+            func gets called with this future once it is done. Called at once if already done
+            Note: called in the Thread performing the rotation, should not block
+        """
+        with self.__lock:
+            if not self.__event.is_set():
+                self.__callbacks.append(func)
+                return self
+        func(self)
+        return self
+
+    def __await__(self):
+        """
+            awaiting the future on an event loop suspends until the rotation was performed or cancelled
+        """
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def resolve_waiter():
+            if waiter.done():
+                return
+            if self.__exception is not None:
+                waiter.set_exception(self.__exception)
+            else:
+                waiter.set_result(self)
+
+        self.add_done_callback(lambda _: loop.call_soon_threadsafe(resolve_waiter))
+        return waiter.__await__()
+
+    def _resolve(self, cancelled=False, exception=None):
+        with self.__lock:
+            if self.__event.is_set():
+                return
+            self.__cancelled = cancelled or exception is not None
+            self.__exception = exception
+            self.__event.set()
+            callbacks, self.__callbacks = self.__callbacks, []
+        for func in callbacks:
+            func(self)
+
+    def __repr__(self):
+        state = "cancelled" if self.__cancelled else "done" if self.done() else "pending"
+        return "<RotationFuture {} to {}: {}>".format(self.servo.name, self.angle, state)
+
+
+class _RotationBarrier:
+
+    def __init__(self, futures):
+        """
+        Task making a Servo wait until the given RotationFutures of other Servos are done
+        (see Servo.wait_for_rotations())
+        """
+        self.futures = tuple(futures)
+        self.__listeners = []
+        for future in self.futures:
+            future.add_done_callback(self.__notify)
+
+    def __notify(self, _):
+        for listener in list(self.__listeners):
+            listener()
+
+    def _is_idle(self):
+        return all(future.done() for future in self.futures)
+
+    def _add_listener(self, func):
+        self.__listeners.append(func)
+
+    def _remove_listener(self, func):
+        self.__listeners.remove(func)
+
+
+class Rendezvous:
+
+    def __init__(self, servos):
+        """
+        Task queued in several Servos at once (see ServoController.sync_point()).
+        A Servo reaching it waits until every other one reached it as well.
+        Dumping the queue of a Servo counts as reaching it, so the others are not blocked forever
+
+        :param servos: Servos the task is queued in
+        """
+        self.servos = tuple(servos)
+        self.__arrived = 0
+        self.__lock = threading.Lock()
+        self.__listeners = []
+
+    def _arrive(self):
+        with self.__lock:
+            self.__arrived += 1
+        for listener in list(self.__listeners):
+            listener()
+
+    def _is_idle(self):
+        """
+            True once every Servo reached this task
+        """
+        return self.__arrived >= len(self.servos)
+
+    def _add_listener(self, func):
+        self.__listeners.append(func)
+
+    def _remove_listener(self, func):
+        self.__listeners.remove(func)
+
+
 class Servo:
 
     def __init__(self, channel_number, min_angle, max_angle, default_angle=None, name=None, step_size=1,
-                 step_time=0.02):
+                 step_time=0.02, profile=None, update_interval=None):
         """
         Basic Servo class
 
@@ -84,17 +275,12 @@ class Servo:
                 Note: Autogenerated if None
         :param step_size: How big every step dividing a rotation shall be
         :param step_time: How much waiting time between every step before presuming with next step
+        :param profile: MotionProfile every rotation follows, e.g. TrapezoidalProfile(max_velocity, max_acceleration)
+                Note: LinearProfile with step_size / step_time degrees per second if None
+        :param update_interval: time between two angle updates while rotating
+                Note: step_time if None
         """
 
-        # IGNORE ERROR: imports depending on Python version
-        is_pi2 = sys.version_info < (3, 0)
-        if is_pi2:
-            # noinspection PyUnresolvedReferences
-            from Queue import Queue
-        else:
-            # noinspection PyUnresolvedReferences
-            from queue import Queue
-
         # Meta
         self.__channel_number = channel_number
         if name is None:
@@ -114,13 +300,42 @@ class Servo:
         self.step_size = step_size
         self.step_time = step_time
 
+        # Motion
+        if profile is None:
+            profile = LinearProfile(step_size / step_time if step_time > 0 else math.inf)
+        self.profile = profile
+        if update_interval is None:
+            update_interval = step_time if step_time > 0 else 0.02
+        self.update_interval = update_interval
+
         # Components
         self.__rotation_controller_thread = None
-        # https://docs.python.org/2/library/queue.html
-        self.__rotation_queue = Queue()
+        # guards the rotation queue and the flags, notified on every change of them
+        self.__condition = threading.Condition()
+        self.__rotation_queue = deque()
+        # queued tasks plus the task currently performed
+        self.__unfinished_tasks = 0
+        # functions waking other Threads or coroutines waiting on this Servo (see _add_listener())
+        self.__listeners = []
+
+        # Shadow State: angles known without reading back the servo kit. None until first resync()
+        # last angle written to the servo kit
+        self.__angle = None
+        # angle this Servo will be at after performing all queued rotations
+        self.__target = None
+        # time.monotonic() of the last write, wall time even if the rotations are timed by a VirtualClock
+        self.__last_write_time = -math.inf
+
+        # Synchronized Execution (see ServoController)
+        self.__bound_to_executor = False
+        self.__motion = None
+        self.__rotation = None
+        self.__barrier = None
 
         # Flags
         self.__print_rotations = False
+        self.__coalesce_rotations = False
+        self.__recorder = None
         self.__dump_rotations = False
         self.__block_rotate_method = False
         self.__shutdown_rotation_controller = False
@@ -146,6 +361,7 @@ class Servo:
             Is not waiting for all rotations to be performed
         """
         self.__shutdown_rotation_controller = True
+        self.__notify()
         return self
 
     def _finish_and_shutdown(self, final_rotation=None, dump_rotations=False):
@@ -168,9 +384,31 @@ class Servo:
                 self.dump_rotations()
             self.wait()
             if final_rotation is not None:
-                self.__rotation_queue.put(final_rotation)
+                self.__queue_rotation(final_rotation, "shutdown")
             self.wait()
-            self.__shutdown_rotation_controller = True
+            self.shutdown()
+        return self
+
+    async def finish_and_shutdown_async(self, final_rotation=None, dump_rotations=False):
+        """
+            coroutine version of _finish_and_shutdown() suspending instead of blocking while waiting
+
+        :param final_rotation: the last rotation before shutting down will be of this angle
+        :param dump_rotations: if True, currently performed rotation as well as all queued rotations will be canceled.
+
+        :raises NotStartedException
+        """
+        if not self.is_running():
+            raise NotStartedException(
+                "{} wasn't running but tried to shut down".format(self.name))
+        self.__block_rotate_method = True
+        if dump_rotations:
+            self.dump_rotations()
+        await self.wait_async()
+        if final_rotation is not None:
+            self.__queue_rotation(final_rotation, "shutdown")
+        await self.wait_async()
+        self.shutdown()
         return self
 
     def finish_and_shutdown(self, final_rotation=None, dump_rotations=False):
@@ -194,10 +432,13 @@ class Servo:
 
     """-----------------------------ADD ROTATION TO QUEUE----------------------------------------------------"""
 
-    def rotate_to(self, angle):
+    def rotate_to(self, angle, source=None, profile=None):
         """
             adds the given angle to the queue of rotations to be performed by the rotation controller thread.
 
+        :param source: name of the caller, written to the motion log if recording
+        :param profile: MotionProfile of this rotation instead of the one of the Servo. Not written to the motion log
+        :return: RotationFuture resolving when the angle is reached
         :raises ShutDownException: if shutdown is currently performed
         :raises AngleTooLittleException
         :raises AngleTooBigException
@@ -215,34 +456,47 @@ class Servo:
                 "{} Rotation out of Bounds: cur: {} > max: {}".format(self.name, angle,
                                                                       self.max_degree))
         else:
-            self.__rotation_queue.put(angle)
-        return self
+            return self.__queue_rotation(angle, source, profile)
+
+    def __queue_rotation(self, angle, source, profile=None):
+        """
+            adds the rotation to the queue without checks, logged to the motion log if recording
+        """
+        future = RotationFuture(self, angle, profile)
+        if self.__recorder is not None:
+            future._log_index = self.__recorder.command(_clock.monotonic(), self.__channel_number, angle, source)
+        self.__put(future)
+        return future
 
     def rotate_to_relative(self, value):
         """
             resolves absolute angle from given relative value then calls rotate with resolved angle
 
         :param value: 1 >= value >= 0
+        :return: RotationFuture resolving when the angle is reached
         """
-        self.rotate_to(self.degree_from_relative(value))
-        return self
+        return self.rotate_to(self.degree_from_relative(value))
 
-    def rotate(self, value, ensure_bounds=True):
+    def rotate(self, value, ensure_bounds=True, source=None):
         """
-            changes rotation by the given value
+            changes rotation by the given value.
+            applied to the target of the queued rotations, not to the angle the Servo is currently passing
 
-        :param value: offset to be applied to the current angle
+        :param value: offset to be applied to the target angle
         :param ensure_bounds: ensures the step stays in bounds
+        :param source: name of the caller, written to the motion log if recording
+        :return: RotationFuture resolving when the angle is reached
         """
-        rotation = self.ensure_in_bounds(self.get_angle()) + value
+        rotation = self.get_target_angle() + value
         if ensure_bounds:
             rotation = self.ensure_in_bounds(rotation)
-        self.rotate_to(rotation)
-        return self
+        return self.rotate_to(rotation, source=source)
 
     def to_default(self):
-        self.rotate_to(self.default_degree)
-        return self
+        """
+        :return: RotationFuture resolving when the default angle is reached
+        """
+        return self.rotate_to(self.default_degree)
 
     """-----------------------------WAIT----------------------------------------------------"""
 
@@ -253,108 +507,465 @@ class Servo:
         :param timeout: if timeout is not None, this function will stop blocking if the timeout is reached.
                         Note: No Exception is thrown, check for timeouts through is_running() function
         """
-        self.__rotation_controller_thread.join(timeout)
+        if self.__rotation_controller_thread is not None:
+            self.__rotation_controller_thread.join(timeout)
         return self
 
     def wait(self):
         """
             calling Thread waits until the rotation queue of this Servo is empty
         """
-        self.__rotation_queue.join()
+        with self.__condition:
+            self.__condition.wait_for(self._is_idle)
+        return self
+
+    async def wait_async(self):
+        """
+            suspends the calling coroutine until the rotation queue of this Servo is empty
+        """
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def listener():
+            loop.call_soon_threadsafe(changed.set)
+
+        self._add_listener(listener)
+        try:
+            while not self._is_idle():
+                await changed.wait()
+                changed.clear()
+        finally:
+            self._remove_listener(listener)
         return self
 
-    def wait_for_servo(self, *servos):
+    def wait_for_servo(self, *servos, source=None):
         """
             makes this Servo wait for other Servos emptying their queue
 
         :param servos: servos to be waited for
+        :param source: name of the caller, written to the motion log if recording
         """
         for servo in servos:
-            self.__rotation_queue.put(servo)
+            if self.__recorder is not None:
+                self.__recorder.barrier(_clock.monotonic(), self.__channel_number, servo.get_channel(), source)
+            self.__put(servo)
+        return self
+
+    def wait_for_rotations(self, *futures, source=None):
+        """
+            makes this Servo wait until the given rotations of other Servos are performed or cancelled.
+            Unlike wait_for_servo() rotations queued behind them are not waited for
+
+        :param futures: RotationFutures returned by rotate_to() of other Servos
+        :param source: name of the caller, written to the motion log if recording
+        """
+        if self.__recorder is not None:
+            for future in futures:
+                if future._log_index is not None:
+                    self.__recorder.await_command(_clock.monotonic(), self.__channel_number,
+                                                  future.servo.get_channel(), future._log_index, source)
+        self.__put(_RotationBarrier(futures))
         return self
 
+    def _wait_at(self, rendezvous, source=None):
+        """
+            queues the given Rendezvous, see ServoController.sync_point()
+        """
+        if self.__recorder is not None:
+            channels = sum(1 << servo.get_channel() for servo in rendezvous.servos)
+            self.__recorder.sync(_clock.monotonic(), self.__channel_number, channels, source)
+        self.__put(rendezvous)
+        return self
+
+    """-----------------------------QUEUE----------------------------------------------------"""
+
+    def __put(self, task):
+        replaced = None
+        with self.__condition:
+            if self.__coalesce_rotations and isinstance(task, RotationFuture) and len(self.__rotation_queue) > 0 \
+                    and isinstance(self.__rotation_queue[-1], RotationFuture):
+                # the latest target replaces the pending one. Never collapses across wait_for_servo() barriers
+                replaced = self.__rotation_queue[-1]
+                self.__rotation_queue[-1] = task
+            else:
+                self.__rotation_queue.append(task)
+                self.__unfinished_tasks += 1
+            if isinstance(task, RotationFuture):
+                self.__target = task.angle
+        if replaced is not None:
+            replaced._resolve(cancelled=True)
+        self.__notify()
+
+    def __task_done(self, count=1):
+        with self.__condition:
+            self.__unfinished_tasks -= count
+        self.__notify()
+
+    def __clear_queue(self, exception=None):
+        """
+        :param exception: set on every dumped rotation, e.g. the one raised while performing the rotations
+        """
+        with self.__condition:
+            dumped = list(self.__rotation_queue)
+            self.__unfinished_tasks -= len(self.__rotation_queue)
+            self.__rotation_queue.clear()
+            self.__dump_rotations = False
+            self.__target = self.__angle
+        for task in dumped:
+            if isinstance(task, RotationFuture):
+                task._resolve(cancelled=True, exception=exception)
+            elif isinstance(task, Rendezvous):
+                task._arrive()
+        self.__notify()
+
+    def __notify(self):
+        """
+            wakes every Thread waiting on this Servo: its own Rotation Control Thread, callers of wait()
+            and listeners like Servos waiting for this one or the executor of a ServoController
+        """
+        self.__wake()
+        for listener in list(self.__listeners):
+            listener()
+
+    def __wake(self):
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def _add_listener(self, func):
+        """
+            the given function gets called on every change of the queue or the flags of this Servo.
+            Note: called without holding any lock of this Servo, should not block
+        """
+        self.__listeners.append(func)
+
+    def _remove_listener(self, func):
+        self.__listeners.remove(func)
+
     """-----------------------------ROTATION EXECUTION----------------------------------------------------"""
 
     def __rotation_control(self):
         """
-            runs permanently checking for new rotation requests. Runs in a new Thread after calling start() Function
+            waits for new rotation requests and performs them. Runs in a new Thread after calling start() Function.
+            Sleeps until the queue or the flags change instead of polling them
 
         :flag self.__shutdown_rotation_controller: breaks the loop, ending the Thread
         :flag self.__dump_rotations: Empty the queue
-        :flag not self.__wait_for_other_servo_queue.empty(): waits on every Servo in the queue
-        """
-        from queue import Empty
-        while not self.__shutdown_rotation_controller:
-            if self.__dump_rotations:
-                while not self.__rotation_queue.empty():
-                    self.__rotation_queue.get_nowait()
-                    self.__rotation_queue.task_done()
-                self.__dump_rotations = False
+        :task Servo: waits until the given Servo emptied its queue
+        :task Rendezvous: waits until every Servo of the Rendezvous reached it
+        :task _RotationBarrier: waits until the rotations of other Servos are done
+        """
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__shutdown_rotation_controller or self.__dump_rotations
+                                          or len(self.__rotation_queue) > 0)
+                if self.__shutdown_rotation_controller:
+                    break
+                dump = self.__dump_rotations
+                if not dump:
+                    task = self.__rotation_queue.popleft()
+            if dump:
+                # listeners are notified outside of the lock
+                self.__clear_queue()
+                continue
             try:
-                # blocking if queue is empty
-                task = self.__rotation_queue.get(timeout=0.1)
-                if isinstance(task, Servo):
-                    task.wait()
-                elif isinstance(task, (int, float)):
-                    self.__run_rotation(task)
+                if isinstance(task, (Servo, _RotationBarrier)):
+                    self.__wait_for_idle(task)
+                elif isinstance(task, Rendezvous):
+                    task._arrive()
+                    self.__wait_for_idle(task)
+                elif isinstance(task, RotationFuture):
+                    performed = self.__run_rotation(task)
+                    task._resolve(cancelled=not performed)
                 else:
                     raise TypeError("Unsupported Task Type in rotation queue: {}".format(task.__class__.__name__))
-                self.__rotation_queue.task_done()
-            except Empty:
-                # raised on timeout
-                # brilliant Exception Name...
-                pass
+            except Exception as e:
+                # the Thread keeps running, waiting callers learn about the exception from the futures
+                if isinstance(task, RotationFuture):
+                    task._resolve(exception=e)
+                self.__clear_queue(e)
+            self.__task_done()
         self.__block_rotate_method = False
         self.__shutdown_rotation_controller = False
 
-    def __run_rotation(self, angle):
+    def _is_interrupted(self):
+        return self.__dump_rotations or self.__shutdown_rotation_controller
+
+    def __sleep(self, seconds):
+        """
+            sleeps the given time unless the rotation is interrupted by dump_rotations() or shutdown()
+        """
+        if _clock.virtual:
+            _clock.sleep(seconds)
+            return
+        with self.__condition:
+            self.__condition.wait_for(self._is_interrupted, timeout=seconds)
+
+    def __wait_for_idle(self, servo):
+        """
+            blocks until the given Servo emptied its queue (or the given Rendezvous or _RotationBarrier is passed)
+            unless interrupted by dump_rotations() or shutdown()
+        """
+        servo._add_listener(self.__wake)
+        try:
+            with self.__condition:
+                self.__condition.wait_for(lambda: servo._is_idle() or self._is_interrupted())
+        finally:
+            servo._remove_listener(self.__wake)
+
+    def __run_rotation(self, rotation):
         """
-            performs actual rotation to a given angle
-            
+            performs actual rotation to the angle of the given RotationFuture
+
+        :return: False if the rotation was interrupted
         :flag self.__dump_rotations: cancel performed rotation
+        :flag self.__shutdown_rotation_controller: cancel performed rotation
         """
 
-        cur_angle = self.ensure_in_bounds(_kit.servo[self.__channel_number].angle)
-        delta = angle - cur_angle
+        profile = rotation.profile or self.profile
+        motion = profile.plan(self.ensure_in_bounds(self.__current_angle()), rotation.angle, _clock.monotonic())
+
+        # angles are written at absolute deadlines, so sleep jitter and write latency do not add up
+        deadline = motion.start_time
+        while True:
+            deadline = min(max(deadline + self.update_interval, _clock.monotonic()), motion.end_time)
+            self.__sleep(deadline - _clock.monotonic())
+            if self._is_interrupted():
+                return False
+            self.__write(motion.angle_at(deadline))
+            if motion.is_finished(deadline):
+                break
+        if self.__print_rotations:
+            print("{} performed movement to: {}".format(self.name, self.__angle))
+        return True
 
-        # divide delta in steps which will be added on the current angle until the destined angle is reached
-        for _ in range(int(abs(delta) / self.step_size)):
-            if delta < 0:
-                cur_angle -= self.step_size
-            else:
-                cur_angle += self.step_size
-            if self.__dump_rotations:
-                return
-            _kit.servo[self.__channel_number].angle = cur_angle
-            time.sleep(self.step_time)
+    """-----------------------------SYNCHRONIZED EXECUTION----------------------------------------------------"""
+
+    def _bind_executor(self, executor, executor_listener):
+        """
+            lets the executor of a ServoController perform the queued rotations of this Servo
+            instead of an own Rotation Control Thread
+
+        :param executor: Thread of the executor or an object providing is_alive() and join(timeout)
+        :param executor_listener: function waking the executor while no bound Servo has work
+        :raises AlreadyStartedException
+        """
+        if self.is_running():
+            raise AlreadyStartedException("{} is already started".format(self.name))
+        self.__rotation_controller_thread = executor
+        self.__bound_to_executor = True
+        self.__motion = None
+        self.__rotation = None
+        self.__barrier = None
+        self._add_listener(executor_listener)
+        return self
+
+    def _release_executor(self, executor_listener):
+        """
+            called by the executor once this Servo was shut down
+        """
+        self.__cancel_executed_task()
+        self._remove_listener(executor_listener)
+        self.__rotation_controller_thread = None
+        self.__bound_to_executor = False
+        self.__motion = None
+        self.__rotation = None
+        self.__barrier = None
+        self.__block_rotate_method = False
+        self.__shutdown_rotation_controller = False
+
+    def _is_bound_to_executor(self):
+        return self.__bound_to_executor
+
+    def _is_shutting_down(self):
+        return self.__shutdown_rotation_controller
+
+    def _is_idle(self):
+        """
+            True if no rotation is queued or performed
+        """
+        return self.__unfinished_tasks == 0
+
+    def _has_work(self):
+        """
+            True if the executor has to tick for this Servo
+        """
+        return self.__unfinished_tasks > 0 or self._is_interrupted()
+
+    def _begin_motion(self, now):
+        """
+            called every tick by the executor Thread.
+            takes the next rotation from the queue if no rotation is currently performed
+
+        :param now: timestamp of the servo clock of the current tick
+        :return: the newly started motion_profile.Motion or None
+        :flag self.__dump_rotations: cancel performed rotation and empty the queue
+        """
         if self.__dump_rotations:
+            self.__cancel_executed_task()
+            self.__clear_queue()
+        if self.__motion is not None:
+            return None
+        while True:
+            if self.__barrier is not None:
+                if not self.__barrier._is_idle():
+                    return None
+                self.__barrier = None
+                self.__task_done()
+            with self.__condition:
+                if len(self.__rotation_queue) == 0:
+                    return None
+                task = self.__rotation_queue.popleft()
+            if isinstance(task, (Servo, _RotationBarrier)):
+                self.__barrier = task
+            elif isinstance(task, Rendezvous):
+                task._arrive()
+                self.__barrier = task
+            elif isinstance(task, RotationFuture):
+                try:
+                    start_angle = self.ensure_in_bounds(self.__current_angle())
+                    motion = (task.profile or self.profile).plan(start_angle, task.angle, now)
+                except Exception as e:
+                    # already taken from the queue, _fail() does not see it
+                    task._resolve(exception=e)
+                    self.__task_done()
+                    raise
+                self.__rotation = task
+                self.__motion = motion
+                return self.__motion
+            else:
+                self.__task_done()
+                raise TypeError("Unsupported Task Type in rotation queue: {}".format(task.__class__.__name__))
+
+    def _fail(self, exception):
+        """
+            called by the executor if performing the rotations of its Servos raised the given exception.
+            cancels the performed and every queued rotation, setting the exception on them
+        """
+        self.__cancel_executed_task(exception)
+        self.__clear_queue(exception)
+
+    def __cancel_executed_task(self, exception=None):
+        """
+            cancels the rotation or barrier the executor is currently performing for this Servo
+        """
+        if self.__motion is not None:
+            self.__motion = None
+            self.__rotation._resolve(cancelled=True, exception=exception)
+            self.__task_done()
+        if self.__barrier is not None:
+            self.__barrier = None
+            self.__task_done()
+
+    def _advance(self, now):
+        """
+            called every tick by the executor Thread. Writes the angle the current rotation has at the given time
+
+        :param now: timestamp of the servo clock of the current tick
+        """
+        if self.__motion is None:
             return
-        if angle != cur_angle:
-            _kit.servo[self.__channel_number].angle = angle
-            time.sleep(self.step_time)
-        if self.__print_rotations:
-            print("{} performed movement to: {}".format(self.name,
-                                                        _kit.servo[self.__channel_number].angle))
+        self.__write(self.__motion.angle_at(now))
+        if self.__motion.is_finished(now):
+            self.__motion = None
+            self.__rotation._resolve()
+            if self.__print_rotations:
+                print("{} performed movement to: {}".format(self.name, self.__angle))
+            self.__task_done()
 
     """-----------------------------MISC----------------------------------------------------"""
 
-    def dump_rotations(self):
+    def dump_rotations(self, source=None):
         """
             stop current rotation and clear all rotations from the queue
+
+        :param source: name of the caller, written to the motion log if recording
         """
+        if self.__recorder is not None:
+            self.__recorder.dump(_clock.monotonic(), self.__channel_number, source)
         self.__dump_rotations = True
+        self.__notify()
         return self
 
+    def get_channel(self):
+        return self.__channel_number
+
+    def get_last_write_time(self):
+        """
+            time.monotonic() this Servo was last commanded to a new angle. Once idle, it settles shortly after
+        """
+        return self.__last_write_time
+
     def get_angle(self, ensure_bounds=True):
-        angle = _kit.servo[self.__channel_number].angle
+        """
+            angle last written to the servo kit. Does not read back the servo kit, see resync()
+        """
+        angle = self.__current_angle()
         if ensure_bounds:
             return self.ensure_in_bounds(angle)
         return angle
 
+    def get_target_angle(self):
+        """
+            angle this Servo will be at after performing all queued rotations
+        """
+        with self.__condition:
+            if self.__target is None:
+                self.__target = self.ensure_in_bounds(self.__current_angle())
+            return self.__target
+
+    def resync(self):
+        """
+            reads back the angle from the servo kit, overriding the Shadow State.
+            the target angle is reset as well if no rotation is queued
+        """
+        angle = _output.read(self.__channel_number)
+        if angle is None:
+            # never written since the servo kit was powered on
+            angle = self.default_degree
+        with self.__condition:
+            self.__angle = angle
+            if self._is_idle():
+                self.__target = self.ensure_in_bounds(angle)
+        return self
+
+    def __current_angle(self):
+        if self.__angle is None:
+            self.resync()
+        return self.__angle
+
+    def __write(self, angle):
+        _output.write(self.__channel_number, angle)
+        # the executor flushes once per tick for all bound Servos
+        if not self.__bound_to_executor:
+            _output.flush()
+        self.__angle = angle
+        self.__last_write_time = time.monotonic()
+        if self.__recorder is not None:
+            self.__recorder.tick(_clock.monotonic(), self.__channel_number, angle)
+
+    def _set_recorder(self, recorder):
+        """
+        :param recorder: motion_log.MotionRecorder logging the commands and angles of this Servo, None to stop
+        """
+        self.__recorder = recorder
+        return self
+
     def print_performed_rotations(self, bol):
         self.__print_rotations = bol
         return self
 
+    def coalesce_rotations(self, bol):
+        """
+            if True, a new rotation replaces the queued rotation waiting behind the currently performed one,
+            so the Servo moves straight to the latest target instead of performing every intermediate one.
+            rotations are not collapsed across wait_for_servo() barriers
+        """
+        self.__coalesce_rotations = bol
+        return self
+
+    def is_coalescing_rotations(self):
+        return self.__coalesce_rotations
+
     def is_running(self):
         if self.__rotation_controller_thread is not None:
             return self.__rotation_controller_thread.is_alive()
@@ -373,26 +984,215 @@ class Servo:
         return self.min_degree + int(value * (self.max_degree - self.min_degree))
 
 
+class _AsyncExecutor:
+
+    def __init__(self):
+        """
+        Stands in for the executor Thread of a ServoController while run_async() is running
+        """
+        self.__finished = threading.Event()
+
+    def is_alive(self):
+        return not self.__finished.is_set()
+
+    def join(self, timeout=None):
+        self.__finished.wait(timeout)
+
+    def finish(self):
+        self.__finished.set()
+
+
 class ServoController:
 
-    def __init__(self, *servos):
+    def __init__(self, *servos, synchronized=False, tick_time=None):
         """
         Basic class for controlling multiple Servos
 
         :param servos: Servos to be managed by this controller
+        :param synchronized: if True, a single executor Thread performs the rotations of all Servos on a shared tick
+                instead of one Rotation Control Thread per Servo.
+                Rotations starting in the same tick are stretched to finish together.
+        :param tick_time: time between two ticks of the executor Thread.
+                Note: smallest update_interval of all Servos if None
         """
         # noinspection PyTypeChecker
         self.servos = servos  # type: Tuple[Servo]
 
+        self.synchronized = synchronized
+        if tick_time is None:
+            tick_time = min([servo.update_interval for servo in servos], default=0.02)
+        self.tick_time = tick_time
+
+        # Thread of the synchronized executor or an _AsyncExecutor while run_async() is running
+        self.__executor = None
+        self.__executor_lock = threading.Lock()
+        # called by the bound Servos on new rotations, dumps and shutdowns
+        self.__executor_listener = None
+        self.__executor_condition = threading.Condition()
+
     def start(self):
         """
             starts the Thread of every servo which is performing queued rotations
+            or the shared executor Thread if synchronized
         """
+        if self.synchronized:
+            with self.__executor_lock:
+                if self.__executor is None or not self.__executor.is_alive():
+                    self.__executor = threading.Thread(target=self.__synchronized_control, daemon=True)
+                    self.__executor_listener = self.__wake_executor
+                    self.__bind_servos()
+                    self.__executor.start()
+                else:
+                    self.__bind_servos()
+            self.__executor_listener()
+            return self
         for servo in self.servos:
             if not servo.is_running():
                 servo.start()
         return self
 
+    async def run_async(self):
+        """
+            performs the queued rotations of all Servos on a shared tick like the synchronized executor,
+            but as a coroutine on the running event loop instead of a Thread.
+            Returns when every Servo is shut down, e.g. by finish_and_shutdown_async()
+
+            Note: blocking waits like wait_for_all() would block the event loop, use the *_async versions instead
+        Usage: asyncio.ensure_future(controller.run_async())
+
+        :raises AlreadyStartedException: if the synchronized executor Thread is running
+        """
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        executor = _AsyncExecutor()
+        with self.__executor_lock:
+            if self.__executor is not None and self.__executor.is_alive():
+                raise AlreadyStartedException("executor of this ServoController is already running")
+            self.__executor = executor
+            self.__executor_listener = lambda: loop.call_soon_threadsafe(changed.set)
+            self.__bind_servos()
+        try:
+            next_tick = _clock.monotonic()
+            while True:
+                servos = self.__release_shut_down_servos()
+                if not servos:
+                    return
+                changed.clear()
+                if not any(servo._has_work() for servo in servos):
+                    await changed.wait()
+                    next_tick = _clock.monotonic()
+                    continue
+
+                if not self.__tick(self.__begin_tick, servos):
+                    continue
+                next_tick += self.tick_time
+                delay = next_tick - _clock.monotonic()
+                if delay > 0:
+                    if _clock.virtual:
+                        _clock.sleep(delay)
+                        await asyncio.sleep(0)
+                    else:
+                        await asyncio.sleep(delay)
+                else:
+                    next_tick = _clock.monotonic()
+                self.__tick(self.__advance_tick, servos)
+        finally:
+            executor.finish()
+
+    def __bind_servos(self):
+        for servo in self.servos:
+            if not servo.is_running():
+                servo._bind_executor(self.__executor, self.__executor_listener)
+
+    def __wake_executor(self):
+        with self.__executor_condition:
+            self.__executor_condition.notify_all()
+
+    def __release_shut_down_servos(self):
+        """
+        :return: Servos still bound to the executor
+        """
+        with self.__executor_lock:
+            servos = [servo for servo in self.servos if servo._is_bound_to_executor()]
+            for servo in servos:
+                if servo._is_shutting_down():
+                    servo._release_executor(self.__executor_listener)
+            return [servo for servo in servos if servo._is_bound_to_executor()]
+
+    def __begin_tick(self, servos):
+        now = _clock.monotonic()
+        motions = []
+        while True:
+            # a Servo reaching a Rendezvous may release Servos asked before it, so they are asked again
+            started = [servo._begin_motion(now) for servo in servos]
+            started = [motion for motion in started if motion is not None]
+            if not started:
+                break
+            motions.extend(started)
+        # coordinated move: every rotation starting in this tick finishes together with the slowest one
+        if len(motions) > 1:
+            duration = max(motion.duration for motion in motions)
+            for motion in motions:
+                motion.stretch(duration)
+
+    @staticmethod
+    def __tick(step, servos):
+        """
+            performs a step of the tick. If it raises, every rotation of the Servos is cancelled with the exception
+            instead of ending the executor and leaving the callers waiting
+
+        :return: False if the step raised
+        """
+        try:
+            step(servos)
+            return True
+        except Exception as e:
+            for servo in servos:
+                servo._fail(e)
+            return False
+
+    @staticmethod
+    def __advance_tick(servos):
+        now = _clock.monotonic()
+        for servo in servos:
+            servo._advance(now)
+        _output.flush()
+
+    def __synchronized_control(self):
+        """
+            runs permanently performing the queued rotations of all bound Servos on a shared tick.
+            Runs in a new Thread after calling start() if synchronized.
+            Sleeps while no bound Servo has work and ends when every bound Servo is shut down
+        """
+        next_tick = _clock.monotonic()
+        while True:
+            servos = self.__release_shut_down_servos()
+            if not servos:
+                return
+
+            if not any(servo._has_work() for servo in servos):
+                with self.__executor_condition:
+                    self.__executor_condition.wait_for(
+                        lambda: any(servo._has_work() for servo in self.servos if servo._is_bound_to_executor()))
+                next_tick = _clock.monotonic()
+                continue
+
+            if not self.__tick(self.__begin_tick, servos):
+                continue
+            next_tick += self.tick_time
+            delay = next_tick - _clock.monotonic()
+            if delay > 0 and _clock.virtual:
+                _clock.sleep(delay)
+            elif delay > 0:
+                # dump_rotations() and shutdown() cut the tick short
+                with self.__executor_condition:
+                    self.__executor_condition.wait_for(lambda: any(servo._is_interrupted() for servo in servos),
+                                                       timeout=delay)
+            else:
+                # fell behind, do not try to catch up with a burst of ticks
+                next_tick = _clock.monotonic()
+            self.__tick(self.__advance_tick, servos)
+
     def interrupt(self):
         """
             sets flag to shutdown the Rotation Control Threads of every Servo in the servo list
@@ -432,12 +1232,38 @@ class ServoController:
                 servo.join(remaining_time)
         return self
 
-    def dump_rotations(self):
+    def dump_rotations(self, source=None):
         """
             interrupts all rotations and clears the queue of every Servo
         """
         for servo in self.servos:
-            servo.dump_rotations()
+            servo.dump_rotations(source=source)
+        return self
+
+    def sync_point(self, *servos, source=None):
+        """
+            none of the given Servos performs the rotations queued after this call before every one of them
+            performed the rotations queued before it. In synchronized mode their next rotations start in the
+            same tick and therefore finish together
+
+        :param servos: Servos to be synchronized, all Servos of this controller if none are given
+        :param source: name of the caller, written to the motion log if recording
+        """
+        if not servos:
+            servos = self.servos
+        rendezvous = Rendezvous(servos)
+        for servo in servos:
+            servo._wait_at(rendezvous, source=source)
+        return self
+
+    def record(self, recorder):
+        """
+            logs every command accepted by the Servos and every angle they write
+
+        :param recorder: motion_log.MotionRecorder, None to stop recording
+        """
+        for servo in self.servos:
+            servo._set_recorder(recorder)
         return self
 
     def wait_for_all(self):
@@ -448,6 +1274,60 @@ class ServoController:
             servo.wait()
         return self
 
+    def get_last_write_time(self):
+        """
+            time.monotonic() any Servo was last commanded to a new angle.
+            After wait_for_all() the arm has stopped moving once its Servos settled after this time
+        """
+        return max([servo.get_last_write_time() for servo in self.servos], default=-math.inf)
+
+    @staticmethod
+    def wait_all(*futures, timeout=None):
+        """
+            blocks until every given RotationFuture is done
+
+        :param futures: RotationFutures returned by Servo.rotate_to()
+        :param timeout: if timeout is not None, this function will stop blocking on timeout.
+        :return: True if all futures are done, False on timeout
+        """
+        end_time = None if timeout is None else time.monotonic() + timeout
+        return all([future.wait(None if end_time is None else max(0.0, end_time - time.monotonic()))
+                    for future in futures])
+
+    @staticmethod
+    def wait_any(*futures, timeout=None):
+        """
+            blocks until at least one of the given RotationFutures is done
+
+        :param futures: RotationFutures returned by Servo.rotate_to()
+        :param timeout: if timeout is not None, this function will stop blocking on timeout.
+        :return: the first done future, None on timeout
+        """
+        any_done = threading.Event()
+        for future in futures:
+            future.add_done_callback(lambda _: any_done.set())
+        any_done.wait(timeout)
+        for future in futures:
+            if future.done():
+                return future
+        return None
+
+    async def wait_for_all_async(self):
+        """
+            suspends the calling coroutine until all queued movements are performed
+        """
+        await asyncio.gather(*[servo.wait_async() for servo in self.servos])
+        return self
+
+    async def finish_and_shutdown_async(self, *args, dump_rotations=False):
+        """
+            coroutine version of finish_and_shutdown(), returns once every Servo is shut down
+        """
+        await asyncio.gather(*[servo.finish_and_shutdown_async(dump_rotations=dump_rotations,
+                                                               final_rotation=args[i] if i < len(args) else None)
+                               for i, servo in enumerate(self.servos)])
+        return self
+
     def to_default(self):
         for servo in self.servos:
             servo.to_default()
@@ -461,13 +1341,27 @@ class ServoController:
             servo.print_performed_rotations(bol)
         return self
 
+    def coalesce_rotations(self, bol):
+        for servo in self.servos:
+            servo.coalesce_rotations(bol)
+        return self
+
 
 class ServoKeyListener(KeyListener):
     def step_up(self, servo):
-        servo.wait().rotate(self.step_size)
+        self.__wait_unless_coalescing(servo).rotate(self.step_size, source="key_listener")
 
     def step_down(self, servo):
-        servo.wait().rotate(-self.step_size)
+        self.__wait_unless_coalescing(servo).rotate(-self.step_size, source="key_listener")
+
+    @staticmethod
+    def __wait_unless_coalescing(servo):
+        """
+            a coalescing Servo collapses key presses into its latest target, so there is no backlog to wait for
+        """
+        if servo.is_coalescing_rotations():
+            return servo
+        return servo.wait()
 
     def step_size_up(self):
         self.step_size += 1
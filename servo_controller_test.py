@@ -0,0 +1,377 @@
+"""Runs against the fake adafruit_servokit: python servo_controller_test.py (or pytest)"""
+import asyncio
+import time
+
+from constants import SERVO_CONTROLLER
+
+SERVO_CONTROLLER.USE_FAKE_CONTROLLER = True
+
+# noinspection PyPep8
+import servo_controller
+# noinspection PyPep8
+from servo_controller import Servo, ServoController
+# noinspection PyPep8
+from servo_output import PCA9685Output, FakeI2CDevice, ServoOutput, KitOutput
+# noinspection PyPep8
+from servo_simulation import VirtualClock, SimulatedServoKit
+# noinspection PyPep8
+from motion_profile import TrapezoidalProfile, SCurveProfile
+
+# half the 100 ms polling interval the Threads used to wake up in, leaving margin for the scheduler
+MAX_LATENCY = 0.05
+
+
+class _RecordingOutput(ServoOutput):
+    def __init__(self, written):
+        super().__init__()
+        self.written = written
+
+    def read(self, channel):
+        return servo_controller._kit.servo[channel].angle
+
+    def _transmit(self, updates):
+        self.written.extend(updates)
+
+
+def _slow_servo(channel=0):
+    return Servo(channel, 0, 180, step_size=1, step_time=0.5)
+
+
+def _measure(action, condition, timeout=1.0):
+    start = time.monotonic()
+    action()
+    while not condition():
+        if time.monotonic() - start > timeout:
+            break
+        time.sleep(0.0005)
+    return time.monotonic() - start
+
+
+def test_rotation_latency():
+    # rotations without step time are written at once, leaving the wake up of the idle Servo as latency
+    servo = Servo(0, 0, 180, step_time=0).start()
+    servo.rotate_to(0).wait()
+    latency = _measure(lambda: servo.rotate_to(10), lambda: servo.get_angle() == 10)
+    servo.dump_rotations().shutdown().join(1)
+    assert latency < MAX_LATENCY, latency
+
+
+def test_dump_latency():
+    servo = _slow_servo().start()
+    servo.rotate_to(180)
+    servo.rotate_to(0)
+    time.sleep(0.05)
+    latency = _measure(servo.dump_rotations, servo._is_idle)
+    servo.shutdown().join(1)
+    assert latency < MAX_LATENCY, latency
+
+
+def test_shutdown_latency():
+    servo = _slow_servo().start()
+    servo.rotate_to(180)
+    time.sleep(0.05)
+    latency = _measure(servo.shutdown, lambda: not servo.is_running())
+    assert latency < MAX_LATENCY, latency
+
+
+def test_idle_shutdown_latency():
+    servo = _slow_servo().start()
+    latency = _measure(servo.shutdown, lambda: not servo.is_running())
+    assert latency < MAX_LATENCY, latency
+
+
+def test_wait_for_servo():
+    first = Servo(0, 0, 180, step_size=10, step_time=0.01).start()
+    second = Servo(1, 0, 180, step_size=10, step_time=0.01).start()
+    first.rotate_to(0)
+    second.rotate_to(0)
+    ServoController(first, second).wait_for_all()
+    first.rotate_to(100)
+    second.wait_for_servo(first)
+    second.rotate_to(10)
+    second.wait()
+    assert first.get_angle() == 100
+    ServoController(first, second).finish_and_shutdown().join(1)
+    assert not first.is_running() and not second.is_running()
+
+
+def test_rotate_applies_to_queued_target():
+    servo = Servo(0, 0, 180, step_size=1, step_time=0.01).start()
+    servo.rotate_to(0).wait()
+    servo.rotate(20)
+    servo.rotate(20)
+    servo.rotate(-10)
+    assert servo.get_target_angle() == 30
+    servo.wait()
+    assert servo.get_angle() == 30
+    assert servo.resync().get_angle() == 30
+    servo.shutdown().join(1)
+
+
+def test_coalesce_rotations():
+    first = Servo(0, 0, 180, step_size=10, step_time=0.01).start()
+    second = Servo(1, 0, 180, step_time=0).start().coalesce_rotations(True)
+    first.rotate_to(0)
+    second.rotate_to(0)
+    ServoController(first, second).wait_for_all()
+
+    written = []
+    default_output = servo_controller._output
+    servo_controller._output = _RecordingOutput(written)
+    try:
+        first.rotate_to(100)
+        second.wait_for_servo(first)
+        for angle in (10, 20, 30):
+            second.rotate_to(angle)
+        second.wait()
+    finally:
+        servo_controller._output = default_output
+    # pending targets collapsed into the latest one, the barrier is kept
+    assert first.get_angle() == 100
+    assert [angle for channel, angle in written if channel == 1] == [30], written
+    ServoController(first, second).finish_and_shutdown().join(1)
+
+
+def test_rotation_futures():
+    for synchronized in (False, True):
+        first = Servo(0, 0, 180, step_size=10, step_time=0.01)
+        second = Servo(1, 0, 180, step_size=1, step_time=0.01)
+        controller = ServoController(first, second, synchronized=synchronized).start()
+        first.rotate_to(0)
+        second.rotate_to(0)
+        controller.wait_for_all()
+        fast = first.rotate_to(100)
+        # rotations starting in the same tick of a synchronized controller would finish together
+        time.sleep(0.05)
+        slow = second.rotate_to(100)
+        assert controller.wait_any(fast, slow, timeout=1) is fast
+        assert not slow.done() and not slow.wait(0.01) and fast.wait(0)
+        assert not controller.wait_all(fast, slow, timeout=0.01)
+        dumped = second.rotate_to(0)
+        second.dump_rotations()
+        assert controller.wait_all(slow, dumped, timeout=1)
+        assert slow.cancelled() and dumped.cancelled() and not fast.cancelled()
+        controller.interrupt().join(1)
+
+
+def test_synchronized_rotations_finish_together():
+    first = Servo(0, 0, 180, step_size=10, step_time=0.01)
+    second = Servo(1, 0, 180, step_size=10, step_time=0.01)
+    controller = ServoController(first, second, synchronized=True).start()
+    first.rotate_to(0)
+    second.rotate_to(0)
+    controller.wait_for_all()
+    finished = {}
+    # started in the same tick, the short rotation is stretched to the duration of the long one
+    controller.sync_point()
+    for servo, angle in ((first, 100), (second, 20)):
+        servo.rotate_to(angle).add_done_callback(lambda future: finished.setdefault(future.angle, time.monotonic()))
+    controller.wait_for_all()
+    controller.interrupt().join(1)
+    assert first.get_angle() == 100 and second.get_angle() == 20
+    assert abs(finished[100] - finished[20]) < controller.tick_time / 2, finished
+
+
+def test_run_async():
+    first = Servo(0, 0, 180, step_size=10, step_time=0.01)
+    second = Servo(1, 0, 180, step_size=10, step_time=0.01)
+    controller = ServoController(first, second)
+
+    async def move():
+        executor = asyncio.ensure_future(controller.run_async())
+        await asyncio.sleep(0)
+        assert controller.is_running()
+        await asyncio.gather(first.rotate_to(50), second.rotate_to(60))
+        assert first.get_angle() == 50 and second.get_angle() == 60
+        first.rotate_to(0)
+        await controller.wait_for_all_async()
+        assert first.get_angle() == 0
+        await controller.finish_and_shutdown_async(10, 20)
+        await asyncio.wait_for(executor, 1)
+
+    asyncio.run(move())
+    assert not controller.is_running()
+    assert first.get_angle() == 10 and second.get_angle() == 20
+
+
+def test_simulated_time():
+    for profile in (TrapezoidalProfile(max_velocity=50, max_acceleration=300),
+                    SCurveProfile(max_velocity=50, max_acceleration=300)):
+        clock = VirtualClock()
+        kit = SimulatedServoKit(clock)
+        default_clock, default_output = servo_controller._clock, servo_controller._output
+        servo_controller._clock, servo_controller._output = clock, KitOutput(kit)
+        try:
+            servo = Servo(2, 0, 150, profile=profile, update_interval=0.02)
+            controller = ServoController(servo, synchronized=True).start()
+            wall_start = time.monotonic()
+            servo.rotate_to(150).wait()
+            wall_time = time.monotonic() - wall_start
+            robot_time = clock.monotonic()
+            controller.interrupt().join(1)
+        finally:
+            servo_controller._clock, servo_controller._output = default_clock, default_output
+        duration = profile.duration(150)
+        assert duration <= robot_time < duration + 0.05, robot_time
+        assert wall_time < duration / 10, wall_time
+        assert abs(kit.angle_at(2, duration / 2) - 75) < 2
+        angles = [angle for _, angle in kit.trajectory(2)]
+        assert angles[-1] == 150 and angles == sorted(angles)
+
+
+def test_sync_point():
+    for synchronized in (False, True):
+        first = Servo(0, 0, 180, step_size=10, step_time=0.01)
+        second = Servo(1, 0, 180, step_size=10, step_time=0.01)
+        controller = ServoController(first, second, synchronized=synchronized).start()
+        first.rotate_to(0)
+        second.rotate_to(0)
+        controller.wait_for_all()
+        first.rotate_to(100)
+        controller.sync_point()
+        first.rotate_to(50)
+        moved = second.rotate_to(10)
+        moved.wait(1)
+        # the second Servo only started once the first one reached 100
+        assert first.get_target_angle() == 50 and first.get_angle() <= 100 and first.get_angle() > 10
+        controller.sync_point(first, second)
+        second.dump_rotations()
+        # dumping a Servo releases the others waiting at a sync point
+        assert controller.wait_all(first.rotate_to(0), timeout=1)
+        controller.interrupt().join(1)
+
+
+def test_record_and_replay():
+    import os
+    import tempfile
+    from motion_log import MotionRecorder, MotionReplayer, COMMAND, BARRIER
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "motion_log_test.bin")
+        first = Servo(0, 0, 180, step_size=10, step_time=0.01)
+        second = Servo(1, 0, 180, step_size=10, step_time=0.01)
+        controller = ServoController(first, second).start()
+        recorder = MotionRecorder(path)
+        controller.record(recorder)
+        first.rotate_to(50, source="test")
+        second.wait_for_servo(first)
+        second.rotate_to(70)
+        controller.wait_for_all().record(None)
+        recorder.close()
+
+        replayer = MotionReplayer(path)
+        commands = replayer.commands()
+        assert [(record.type, record.channel, record.value, record.source) for record in commands] == \
+            [(COMMAND, 0, 50, "test"), (BARRIER, 1, 0, "unknown"), (COMMAND, 1, 70, "unknown")]
+        assert replayer.ticks(0)[-1][1] == 50
+
+        first.rotate_to(0)
+        second.rotate_to(0)
+        controller.wait_for_all()
+        replayer.replay(controller, speed=None)
+        controller.wait_for_all()
+        assert first.get_angle() == 50 and second.get_angle() == 70
+
+        # the final rotation of a shutdown is recorded as well
+        os.remove(path)
+        recorder = MotionRecorder(path)
+        controller.record(recorder)
+        first._finish_and_shutdown(final_rotation=20)
+        second._finish_and_shutdown()
+        controller.record(None)
+        recorder.close()
+        assert [(record.type, record.channel, record.value, record.source) for record in
+                MotionReplayer(path).commands()] == [(COMMAND, 0, 20, "shutdown")]
+        controller.interrupt().join(1)
+
+
+def test_synchronized_dump_latency():
+    first, second = _slow_servo(0), _slow_servo(1)
+    controller = ServoController(first, second, synchronized=True, tick_time=0.5).start()
+    first.rotate_to(180)
+    second.rotate_to(180)
+    time.sleep(0.05)
+    latency = _measure(controller.dump_rotations, lambda: first._is_idle() and second._is_idle())
+    controller.interrupt().join(1)
+    assert latency < MAX_LATENCY, latency
+    assert not controller.is_running()
+
+
+def test_batched_output_transactions():
+    bus = FakeI2CDevice()
+    output = PCA9685Output(bus)
+    bus.reset_counters()
+    for channel in range(4):
+        output.write(channel, 90)
+    output.flush()
+    assert bus.transactions == 1
+    assert round(output.read(2)) == 90
+
+    default_output = servo_controller._output
+    servo_controller._output = output
+    try:
+        servos = [Servo(channel, 0, 180, step_size=1, step_time=0.01) for channel in range(4)]
+        controller = ServoController(*servos, synchronized=True).start()
+        for servo in servos:
+            servo.rotate_to(80)
+        controller.wait_for_all()
+        bus.reset_counters()
+        for servo in servos:
+            servo.rotate_to(100)
+        controller.wait_for_all()
+        controller.interrupt().join(1)
+    finally:
+        servo_controller._output = default_output
+    # one transaction per tick for all four channels
+    assert bus.transactions <= 22, bus.transactions
+
+
+def test_batched_output_fresh_device():
+    default_output = servo_controller._output
+    # nothing was written to the device yet, its channels can not be read back
+    servo_controller._output = PCA9685Output(FakeI2CDevice())
+    try:
+        servos = [Servo(channel, 0, 180, step_size=10, step_time=0.01) for channel in range(2)]
+        controller = ServoController(*servos, synchronized=True).start()
+        futures = [servo.rotate_to(30) for servo in servos]
+        assert all([future.wait(1) for future in futures])
+        controller.interrupt().join(1)
+    finally:
+        servo_controller._output = default_output
+    assert not any(future.cancelled() for future in futures)
+    assert [servo.get_angle() for servo in servos] == [30, 30]
+
+
+class _FailingOutput(_RecordingOutput):
+    def _transmit(self, updates):
+        raise OSError("i2c bus error")
+
+
+def test_executor_failure_resolves_futures():
+    default_output = servo_controller._output
+    servo_controller._output = _FailingOutput([])
+    try:
+        servo = Servo(0, 0, 180, step_size=10, step_time=0.1)
+        controller = ServoController(servo, synchronized=True).start()
+        # lasting longer than a tick, the first angle is transmitted before the rotation finishes
+        future = servo.rotate_to(0 if servo.get_angle() > 90 else 180)
+        assert future.wait(1)
+        assert future.cancelled() and isinstance(future.exception(), OSError)
+        # the executor keeps running and performs the next rotation once the output works again
+        written = []
+        servo_controller._output = _RecordingOutput(written)
+        future = servo.rotate_to(90)
+        assert future.wait(3)
+        assert not future.cancelled() and future.exception() is None
+        assert servo.get_angle() == 90 and written[-1] == (0, 90)
+        assert controller.is_running()
+        controller.interrupt().join(1)
+    finally:
+        servo_controller._output = default_output
+    assert not controller.is_running()
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print("{} passed".format(name))
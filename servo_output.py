@@ -0,0 +1,176 @@
+"""Output Layer between the Servos and the servo kit"""
+
+import threading
+
+# PCA9685 registers
+_MODE1 = 0x00
+_MODE1_AUTO_INCREMENT = 0x20
+_LED0_ON_L = 0x06
+_REGISTERS_PER_CHANNEL = 4
+
+
+class ServoOutput:
+
+    def __init__(self):
+        """
+        Collects the angles written by the Servos and transmits them on flush().
+        A ServoController in synchronized mode flushes once per tick, every other caller right after writing
+        """
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def write(self, channel, angle):
+        """
+            buffers the angle for the given channel. Overrides angles buffered before for the same channel
+        """
+        with self._lock:
+            self._pending[channel] = angle
+        return self
+
+    def flush(self):
+        """
+            transmits all buffered angles
+        """
+        with self._lock:
+            if not self._pending:
+                return self
+            updates = sorted(self._pending.items())
+            self._pending.clear()
+            self._transmit(updates)
+        return self
+
+    def read(self, channel):
+        """
+            reads back the angle of the given channel from the hardware
+        """
+        raise NotImplementedError
+
+    def _transmit(self, updates):
+        """
+        :param updates: list of (channel, angle) tuples sorted by channel
+        """
+        raise NotImplementedError
+
+
+class KitOutput(ServoOutput):
+
+    def __init__(self, kit):
+        """
+        Writes every angle through the adafruit_servokit, resulting in one bus transaction per channel
+
+        :param kit: adafruit_servokit.ServoKit instance
+        """
+        super().__init__()
+        self.kit = kit
+
+    def read(self, channel):
+        return self.kit.servo[channel].angle
+
+    def _transmit(self, updates):
+        for channel, angle in updates:
+            self.kit.servo[channel].angle = angle
+
+
+class PCA9685Output(ServoOutput):
+
+    def __init__(self, i2c_device, frequency=50, min_pulse=750, max_pulse=2250, actuation_range=180):
+        """
+        Writes the angles directly into the LED_ON/OFF registers of the PCA9685.
+        Consecutive channels are written in a single bus transaction using the auto increment of the PCA9685.
+        Pulse defaults match the ones of adafruit_servokit
+
+        :param i2c_device: adafruit_bus_device.i2c_device.I2CDevice of the PCA9685 or a FakeI2CDevice
+        :param frequency: pwm frequency the PCA9685 is set to
+        :param min_pulse: pulse width in microseconds at angle 0
+        :param max_pulse: pulse width in microseconds at angle actuation_range
+        :param actuation_range: angle at max_pulse
+        """
+        super().__init__()
+        self.i2c_device = i2c_device
+        self.actuation_range = actuation_range
+        # same duty cycle conversion as adafruit_motor.servo
+        self._min_duty = int((min_pulse * frequency) / 1000000 * 0xFFFF)
+        max_duty = (max_pulse * frequency) / 1000000 * 0xFFFF
+        self._duty_range = int(max_duty - self._min_duty)
+
+        mode = bytearray(1)
+        with self.i2c_device as i2c:
+            i2c.write_then_readinto(bytes([_MODE1]), mode)
+            if not mode[0] & _MODE1_AUTO_INCREMENT:
+                i2c.write(bytes([_MODE1, mode[0] | _MODE1_AUTO_INCREMENT]))
+
+    def read(self, channel):
+        registers = bytearray(_REGISTERS_PER_CHANNEL)
+        with self.i2c_device as i2c:
+            i2c.write_then_readinto(bytes([_LED0_ON_L + _REGISTERS_PER_CHANNEL * channel]), registers)
+        off = registers[2] | (registers[3] & 0x0F) << 8
+        if off == 0:
+            return None
+        fraction = ((off << 4) - self._min_duty) / self._duty_range
+        return fraction * self.actuation_range
+
+    def _duty_cycle(self, angle):
+        fraction = angle / self.actuation_range
+        return self._min_duty + int(fraction * self._duty_range)
+
+    def _transmit(self, updates):
+        with self.i2c_device as i2c:
+            for first_channel, angles in self._consecutive_runs(updates):
+                buffer = bytearray(1 + _REGISTERS_PER_CHANNEL * len(angles))
+                buffer[0] = _LED0_ON_L + _REGISTERS_PER_CHANNEL * first_channel
+                for i, angle in enumerate(angles):
+                    # 16 bit duty cycle to 12 bit, LED_ON stays 0 (see adafruit_pca9685.PWMChannel)
+                    off = (self._duty_cycle(angle) + 1) >> 4
+                    offset = 1 + _REGISTERS_PER_CHANNEL * i
+                    buffer[offset + 2] = off & 0xFF
+                    buffer[offset + 3] = (off >> 8) & 0x0F
+                i2c.write(buffer)
+
+    @staticmethod
+    def _consecutive_runs(updates):
+        """
+            splits sorted (channel, angle) tuples into runs of consecutive channels
+
+        :return: list of (first_channel, [angles]) tuples
+        """
+        runs = []
+        for channel, angle in updates:
+            if runs and runs[-1][0] + len(runs[-1][1]) == channel:
+                runs[-1][1].append(angle)
+            else:
+                runs.append((channel, [angle]))
+        return runs
+
+
+class FakeI2CDevice:
+
+    def __init__(self):
+        """
+        Stand-in for the I2CDevice of a PCA9685 counting bus transactions. Used to measure without hardware
+        """
+        self.registers = bytearray(256)
+        self.transactions = 0
+        self.bytes_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def write(self, buffer, start=0, end=None):
+        buffer = buffer[start:end]
+        self.transactions += 1
+        self.bytes_written += len(buffer)
+        register = buffer[0]
+        for i, value in enumerate(buffer[1:]):
+            self.registers[register + i] = value
+
+    def write_then_readinto(self, out_buffer, in_buffer):
+        self.transactions += 1
+        register = out_buffer[0]
+        in_buffer[:] = self.registers[register:register + len(in_buffer)]
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes_written = 0
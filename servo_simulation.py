@@ -0,0 +1,101 @@
+"""Clocks and a simulated servo kit for running the Servos without hardware"""
+
+import bisect
+import threading
+import time
+
+
+class MonotonicClock:
+    """
+        Wall clock time used on the real robot
+    """
+    virtual = False
+
+    @staticmethod
+    def monotonic():
+        return time.monotonic()
+
+    @staticmethod
+    def sleep(seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock:
+    virtual = True
+
+    def __init__(self, start_time=0.0):
+        """
+        Simulated time: sleeping advances the clock at once instead of waiting.
+        Note: only a synchronized ServoController advances it consistently,
+        unsynchronized Servo Threads would each push the clock forward on their own
+
+        :param start_time: initial value of monotonic()
+        """
+        self.__now = start_time
+        self.__lock = threading.Lock()
+
+    def monotonic(self):
+        return self.__now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.sleep_until(self.__now + seconds)
+
+    def sleep_until(self, timestamp):
+        with self.__lock:
+            if timestamp > self.__now:
+                self.__now = timestamp
+
+
+class _SimulatedServo:
+
+    def __init__(self, clock, initial_angle):
+        self.__clock = clock
+        self.__angle = initial_angle
+        self.times = [clock.monotonic()]
+        self.angles = [initial_angle]
+
+    @property
+    def angle(self):
+        return self.__angle
+
+    @angle.setter
+    def angle(self, value):
+        self.__angle = value
+        self.times.append(self.__clock.monotonic())
+        self.angles.append(value)
+
+
+class SimulatedServoKit:
+
+    def __init__(self, clock, channels=8, initial_angle=0):
+        """
+        Stand-in for adafruit_servokit.ServoKit recording every written angle with the time of the given clock,
+        so the trajectory of a simulated run can be queried afterwards
+
+        :param clock: VirtualClock (or MonotonicClock) the Servos are timed by
+        :param channels: number of servo channels
+        :param initial_angle: angle of every channel before the first write
+        """
+        self.clock = clock
+        self.servo = [_SimulatedServo(clock, initial_angle) for _ in range(channels)]
+
+    def trajectory(self, channel):
+        """
+        :return: list of (time, angle) tuples of every angle written to the given channel
+        """
+        return list(zip(self.servo[channel].times, self.servo[channel].angles))
+
+    def angle_at(self, channel, timestamp):
+        """
+        :return: angle the given channel had at the given time, a servo holds the last written angle
+        """
+        servo = self.servo[channel]
+        index = bisect.bisect_right(servo.times, timestamp) - 1
+        return servo.angles[max(index, 0)]
+
+    def clear_trajectories(self):
+        for servo in self.servo:
+            servo.times = [self.clock.monotonic()]
+            servo.angles = [servo.angle]